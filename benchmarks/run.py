@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks for analyze latency, throughput, startup and client CPU cost.
+
+By default they run against the in-repo stub server, which needs neither
+Java nor network. Use --server to benchmark a real Elasticsearch started by
+esanpy, and --baseline to compare with the JSON results of an earlier run:
+
+    $ python benchmarks/run.py --output current.json
+    $ python benchmarks/run.py --baseline current.json
+"""
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import esanpy  # noqa: E402
+from esanpy import analyzers  # noqa: E402
+from esanpy import cache  # noqa: E402
+from esanpy import elasticsearch  # noqa: E402
+from esanpy import serializer  # noqa: E402
+from esanpy.executor import AnalysisExecutor  # noqa: E402
+from stub_server import start_stub_server  # noqa: E402
+
+
+_timer = getattr(time, 'perf_counter', time.time)
+_cpu_timer = getattr(time, 'process_time', time.clock if hasattr(time, 'clock') else time.time)
+
+ANALYZERS = ['standard', 'kuromoji', 'icu_analyzer']
+CUSTOM_ANALYZERS = {'lowercase': {'tokenizer': 'standard', 'token_filter': ['lowercase']},
+                    'kuromoji_baseform': {'tokenizer': 'kuromoji_tokenizer',
+                                          'token_filter': ['kuromoji_baseform']}}
+BATCH_SIZES = [1, 10, 100]
+CONCURRENCIES = [1, 4]
+TEXTS = ['This is a pen.',
+         'Elasticsearch is a distributed, RESTful search and analytics engine.',
+         '今日の天気は晴れです。',
+         'The quick brown fox jumps over the lazy dog. ' * 4]
+
+
+def get_percentile(values, percent):
+    values = sorted(values)
+    if len(values) == 0:
+        return None
+    index = (len(values) - 1) * percent / 100
+    lower = int(index)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (index - lower)
+
+
+def summarize_latencies(latencies):
+    return {'count': len(latencies),
+            'mean_ms': sum(latencies) / len(latencies) * 1000,
+            'p50_ms': get_percentile(latencies, 50) * 1000,
+            'p90_ms': get_percentile(latencies, 90) * 1000,
+            'p99_ms': get_percentile(latencies, 99) * 1000,
+            'max_ms': max(latencies) * 1000}
+
+
+def measure_latency(fn, iterations, warmup):
+    for i in range(warmup):
+        fn(TEXTS[i % len(TEXTS)])
+    latencies = []
+    for i in range(iterations):
+        start = _timer()
+        fn(TEXTS[i % len(TEXTS)])
+        latencies.append(_timer() - start)
+    return summarize_latencies(latencies)
+
+
+def bench_latency(options, results):
+    for name in ANALYZERS:
+        results['latency.analyzer.' + name] = measure_latency(
+            lambda text: esanpy.analyzer(text, analyzer=name, host=options.host, http_port=options.http_port),
+            options.iterations, options.warmup)
+    for name, kwargs in sorted(CUSTOM_ANALYZERS.items()):
+        results['latency.custom_analyzer.' + name] = measure_latency(
+            lambda text: esanpy.custom_analyzer(text, host=options.host, http_port=options.http_port, **kwargs),
+            options.iterations, options.warmup)
+
+
+def bench_throughput(options, results):
+    texts = [TEXTS[i % len(TEXTS)] for i in range(options.num_of_text)]
+    for batch_size in BATCH_SIZES:
+        for concurrency in CONCURRENCIES:
+            with AnalysisExecutor(max_workers=concurrency) as executor:
+                start = _timer()
+                num_of_token = 0
+                for tokens in executor.analyzer(texts, batch_size=batch_size,
+                                                host=options.host, http_port=options.http_port):
+                    num_of_token += len(tokens)
+                seconds = _timer() - start
+            results['throughput.batch_{}.concurrency_{}'.format(batch_size, concurrency)] = {
+                'texts': len(texts),
+                'tokens': num_of_token,
+                'seconds': seconds,
+                'texts_per_sec': len(texts) / seconds,
+                'tokens_per_sec': num_of_token / seconds}
+
+
+def bench_startup(options, results):
+    if options.server and options.cold_start:
+        elasticsearch.stop_server(host=options.host, http_port=options.http_port, force=True)
+        start = _timer()
+        elasticsearch.start_server(host=options.host, http_port=options.http_port)
+        cold = {'seconds': _timer() - start}
+        cold.update(dict((x + '_seconds', y) for x, y in elasticsearch.get_startup_timings().items()))
+        results['startup.cold'] = cold
+    warm = []
+    for _ in range(options.warmup + 10):
+        start = _timer()
+        elasticsearch.start_server(host=options.host, http_port=options.http_port, attach=False)
+        warm.append(_timer() - start)
+    results['startup.warm'] = summarize_latencies(warm[options.warmup:])
+
+
+def bench_cpu(options, results):
+    texts = [TEXTS[i % len(TEXTS)] for i in range(options.num_of_text)]
+    request = {'analyzer': 'standard', 'text': texts}
+    stub = start_stub_server()
+    try:
+        body = esanpy.connection.request('POST', 'http://localhost:' + str(stub.http_port) + '/_analyze',
+                                         serializer.dumps(request)).read()
+    finally:
+        stub.shutdown()
+        stub.server_close()
+    num_of_token = len(serializer.loads(body).get('tokens'))
+
+    def measure(fn):
+        start = _cpu_timer()
+        for _ in range(options.repeat):
+            fn()
+        return (_cpu_timer() - start) / options.repeat / num_of_token * 1e9
+
+    result = serializer.loads(body)
+    results['cpu.' + serializer.get_serializer().name] = {
+        'tokens': num_of_token,
+        'encode_ns_per_token': measure(lambda: serializer.dumps(request)),
+        'decode_ns_per_token': measure(lambda: serializer.loads(body)),
+        'decode_tokens_ns_per_token': measure(lambda: serializer.loads_tokens(body)),
+        'convert_ns_per_token': measure(lambda: analyzers.default_converter(result)),
+        'split_ns_per_token': measure(lambda: analyzers.split_analyze_result(result, texts))}
+
+
+BENCHMARKS = {'latency': bench_latency,
+              'throughput': bench_throughput,
+              'startup': bench_startup,
+              'cpu': bench_cpu}
+
+
+def is_higher_better(metric):
+    return metric.endswith('_per_sec')
+
+
+def compare(baseline, current, threshold):
+    """Return (name, metric, baseline, current, change) of metrics regressed more than threshold."""
+    regressions = []
+    for name, metrics in sorted(current.get('results').items()):
+        base_metrics = baseline.get('results').get(name)
+        if base_metrics is None:
+            continue
+        for metric, value in sorted(metrics.items()):
+            base_value = base_metrics.get(metric)
+            if not metric.endswith(('_ms', '_per_sec', '_per_token')) or not base_value:
+                continue
+            change = (value - base_value) / base_value
+            if (-change if is_higher_better(metric) else change) > threshold:
+                regressions.append((name, metric, base_value, value, change))
+    return regressions
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='esanpy benchmarks')
+    parser.add_argument('--benchmark', dest='benchmarks', action='append', choices=sorted(BENCHMARKS),
+                        help='Benchmark to run (default: all)')
+    parser.add_argument('--server', dest='server', action='store_true', default=False,
+                        help='Use Elasticsearch started by esanpy instead of the stub server')
+    parser.add_argument('--cold-start', dest='cold_start', action='store_true', default=False,
+                        help='Restart Elasticsearch to measure cold startup (with --server)')
+    parser.add_argument('--host', dest='host', default='localhost', help='Host name')
+    parser.add_argument('--http-port', dest='http_port', type=int, default=None, help='HTTP port')
+    parser.add_argument('--stub-latency', dest='stub_latency', type=float, default=0.0,
+                        help='Seconds the stub server waits before each response')
+    parser.add_argument('--iterations', dest='iterations', type=int, default=200,
+                        help='Requests per latency benchmark')
+    parser.add_argument('--warmup', dest='warmup', type=int, default=20, help='Requests before measuring')
+    parser.add_argument('--num-of-text', dest='num_of_text', type=int, default=1000,
+                        help='Texts per throughput and CPU benchmark')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=20, help='Repeats per CPU benchmark')
+    parser.add_argument('--output', dest='output', default=None, help='File to write JSON results to')
+    parser.add_argument('--baseline', dest='baseline', default=None, help='JSON results to compare with')
+    parser.add_argument('--threshold', dest='threshold', type=float, default=0.1,
+                        help='Relative change reported as a regression')
+    return parser.parse_args(args=args)
+
+
+def main(args=None):
+    options = parse_args(args)
+    cache.disable()
+    stub = None
+    if options.server:
+        if options.http_port is None:
+            options.http_port = esanpy.DEFAULT_HTTP_PORT
+        esanpy.start_server(host=options.host, http_port=options.http_port)
+    else:
+        stub = start_stub_server(host=options.host, port=options.http_port or 0, latency=options.stub_latency)
+        options.http_port = stub.http_port
+
+    report = {'environment': {'python': platform.python_version(),
+                              'implementation': platform.python_implementation(),
+                              'platform': platform.platform(),
+                              'serializer': serializer.get_serializer().name,
+                              'server': 'elasticsearch' if options.server else 'stub',
+                              'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+              'results': {}}
+    try:
+        for name in options.benchmarks or sorted(BENCHMARKS):
+            BENCHMARKS[name](options, report['results'])
+    finally:
+        if stub is not None:
+            stub.shutdown()
+            stub.server_close()
+        else:
+            esanpy.stop_server(host=options.host, http_port=options.http_port)
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if options.output is None:
+        print(output)
+    else:
+        with open(options.output, 'wt') as f:
+            f.write(output)
+
+    if options.baseline is not None:
+        with open(options.baseline, 'rt') as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, options.threshold)
+        for name, metric, base_value, value, change in regressions:
+            print('REGRESSION {} {}: {:.4g} -> {:.4g} ({:+.1%})'.format(name, metric, base_value, value, change),
+                  file=sys.stderr)
+        return 1 if len(regressions) > 0 else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""Stub HTTP server that mimics the Elasticsearch APIs used by esanpy.
+
+_analyze splits text into word tokens with UTF-16 offsets and, for text
+arrays, the offset and position gaps of Elasticsearch, so that benchmarks
+and functional checks run without Java or network access.
+"""
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import json
+import re
+import sys
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+
+WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+POSITION_INCREMENT_GAP = 100
+
+
+def get_utf16_length(text):
+    return len(text.encode('utf-16-le')) // 2
+
+
+def analyze_texts(texts, lowercase=True, position_gap=0):
+    tokens = []
+    position = -1
+    offset = 0
+    for text in texts:
+        for m in WORD_PATTERN.finditer(text):
+            position += 1
+            token = m.group(0)
+            tokens.append({'token': token.lower() if lowercase else token,
+                           'start_offset': offset + get_utf16_length(text[0:m.start()]),
+                           'end_offset': offset + get_utf16_length(text[0:m.end()]),
+                           'type': '<ALPHANUM>',
+                           'position': position})
+        offset += get_utf16_length(text) + 1
+        position += position_gap
+    return tokens
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately; avoid delayed ACK stalls
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, code, obj=None):
+        body = b'' if obj is None else json.dumps(obj).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length == 0:
+            return None
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def handle_request(self):
+        server = self.server
+        with server.lock:
+            server.num_of_request += 1
+        if server.latency > 0:
+            time.sleep(server.latency)
+        paths = [x for x in self.path.split('?')[0].split('/') if len(x) > 0]
+        if len(paths) == 0:
+            return self.send_json(200, {'name': 'stub', 'version': {'number': '5.6.3'}})
+        if paths[0] == '_cluster':
+            return self.send_json(200, {'status': 'green', 'number_of_nodes': 1})
+        if paths[-1] == '_analyze':
+            if len(paths) == 2 and paths[0] not in server.indices:
+                return self.send_json(404, {'error': 'index_not_found_exception', 'status': 404})
+            return self.analyze(self.read_json())
+        index = paths[0]
+        if self.command == 'HEAD':
+            return self.send_json(200 if index in server.indices else 404)
+        if self.command == 'GET':
+            if index not in server.indices:
+                return self.send_json(404, {'error': 'index_not_found_exception', 'status': 404})
+            return self.send_json(200, {index: server.indices[index]})
+        if self.command == 'PUT':
+            if index in server.indices:
+                return self.send_json(400, {'error': 'index_already_exists_exception', 'status': 400})
+            server.indices[index] = self.read_json()
+            return self.send_json(200, {'acknowledged': True})
+        if self.command == 'DELETE':
+            if server.indices.pop(index, None) is None:
+                return self.send_json(404, {'error': 'index_not_found_exception', 'status': 404})
+            return self.send_json(200, {'acknowledged': True})
+        return self.send_json(400, {'error': 'unsupported request', 'status': 400})
+
+    def analyze(self, data):
+        texts = data.get('text')
+        if not isinstance(texts, list):
+            texts = [texts]
+        analyzer = data.get('analyzer')
+        lowercase = analyzer is not None or 'lowercase' in (data.get('filter') or [])
+        position_gap = 0 if analyzer in (None, 'standard') else POSITION_INCREMENT_GAP
+        tokens = analyze_texts(texts, lowercase=lowercase, position_gap=position_gap)
+        if data.get('explain'):
+            if analyzer is not None:
+                detail = {'custom_analyzer': False, 'analyzer': {'name': analyzer, 'tokens': tokens}}
+            else:
+                detail = {'custom_analyzer': True,
+                          'tokenizer': {'name': data.get('tokenizer'),
+                                        'tokens': analyze_texts(texts, lowercase=False,
+                                                                position_gap=position_gap)},
+                          'tokenfilters': [{'name': x, 'tokens': tokens} for x in data.get('filter') or []]}
+            return self.send_json(200, {'detail': detail})
+        return self.send_json(200, {'tokens': tokens})
+
+    do_GET = handle_request
+    do_POST = handle_request
+    do_PUT = handle_request
+    do_DELETE = handle_request
+    do_HEAD = handle_request
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='localhost', port=0, latency=0.0):
+        HTTPServer.__init__(self, (host, port), StubHandler)
+        self.latency = latency
+        self.indices = {}
+        self.lock = threading.Lock()
+        self.num_of_request = 0
+
+    @property
+    def http_port(self):
+        return self.server_address[1]
+
+
+def start_stub_server(host='localhost', port=0, latency=0.0):
+    """Serve on a background thread and return the server; port 0 picks a free port."""
+    server = StubServer(host, port, latency)
+    thread = threading.Thread(target=server.serve_forever, name='esanpy-stub-server')
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+if __name__ == '__main__':
+    server = start_stub_server(port=int(sys.argv[1]) if len(sys.argv) > 1 else 9299)
+    print('Listening on port ' + str(server.http_port))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -7,18 +7,61 @@ import os
 import sys
 
 from esanpy import analyzers
+from esanpy import cache
+from esanpy import chunking
+from esanpy import connection
 from esanpy import elasticsearch
+from esanpy import jvm
+from esanpy import local
+from esanpy import metrics
+from esanpy import serializer
+from esanpy import singleflight
+from esanpy import stream
+from esanpy.cluster import AnalysisCluster
+from esanpy.definitions import AnalyzerRegistry
+from esanpy.resources import ManagedAnalysis
+from esanpy.dedup import Deduplicator
+from esanpy.executor import AnalysisExecutor
+from esanpy.features import HashedFeatures, Vocabulary, iter_features
+from esanpy.tokens import TokenStream
+from esanpy.workers import AnalysisProcessPool
 from esanpy.core import ESRUNNER_VERSION, DEFAULT_CLUSTER_NAME, DEFAULT_HTTP_PORT, DEFAULT_TRANSPORT_PORT,\
-    DEFAULT_PLUGINS
+    DEFAULT_PLUGINS, DEFAULT_BATCH_SIZE, DEFAULT_HEAP_SIZE
 
 
 start_server = elasticsearch.start_server
 stop_server = elasticsearch.stop_server
+start_servers = elasticsearch.start_servers
+stop_servers = elasticsearch.stop_servers
+start_standby = elasticsearch.start_standby
+get_startup_timings = elasticsearch.get_startup_timings
 create_analysis = elasticsearch.create_analysis
 get_analysis = elasticsearch.get_analysis
 delete_analysis = elasticsearch.delete_analysis
+apply_analyses = elasticsearch.apply_analyses
 analyzer = analyzers.analyzer
 custom_analyzer = analyzers.custom_analyzer
+analyze_batch = analyzers.analyze_batch
+custom_analyze_batch = analyzers.custom_analyze_batch
+configure_connection_pool = connection.configure
+enable_cache = cache.enable
+disable_cache = cache.disable
+cache_stats = cache.stats
+enable_persistent_cache = cache.enable_persistent
+disable_persistent_cache = cache.disable_persistent
+set_serializer = serializer.set_serializer
+enable_metrics = metrics.enable
+disable_metrics = metrics.disable
+add_metrics_hook = metrics.add_hook
+remove_metrics_hook = metrics.remove_hook
+enable_local = local.enable
+disable_local = local.disable
+verify_local = local.verify
+enable_singleflight = singleflight.enable
+disable_singleflight = singleflight.disable
+singleflight_stats = singleflight.stats
+enable_chunking = chunking.enable
+disable_chunking = chunking.disable
 
 logger = getLogger('esanpy')
 
@@ -35,14 +78,63 @@ def parse_args(args):
                         default=DEFAULT_HTTP_PORT, type=int, help='Elasticsearch HTTP port')
     parser.add_argument('--transport-port', dest='transport_port', action='store',
                         default=DEFAULT_TRANSPORT_PORT, type=int, help='Elasticsearch Transport port')
+    parser.add_argument('--num-of-node', dest='num_of_node', action='store',
+                        default=1, type=int, help='Number of Elasticsearch nodes')
+    parser.add_argument('--heap-size', dest='heap_size', action='store',
+                        default=None, help='Maximum Java heap size of Elasticsearch (default: ' +
+                        DEFAULT_HEAP_SIZE + ')')
+    parser.add_argument('--heap-min', dest='heap_min', action='store',
+                        default=None, help='Minimum Java heap size of Elasticsearch')
+    parser.add_argument('--jvm-profile', dest='jvm_profile', action='store',
+                        default=None, help='JVM profile: ' + ', '.join(sorted(jvm.PROFILES)) +
+                        ', a JSON file or a JSON object')
+    parser.add_argument('--gc', dest='gc', action='store', choices=sorted(jvm.GC_OPTIONS),
+                        default=None, help='Garbage collector of Elasticsearch')
+    parser.add_argument('--analyze-threads', dest='analyze_threads', action='store',
+                        default=None, type=int, help='Threads for analyze requests')
+    parser.add_argument('--analyze-queue-size', dest='analyze_queue_size', action='store',
+                        default=None, type=int, help='Queue size for analyze requests')
+    parser.add_argument('--jvm-option', dest='jvm_options', action='append',
+                        help='Extra JVM option such as --jvm-option=-XX:+PrintGCDetails')
+    parser.add_argument('--java-home', dest='java_home', action='store',
+                        default=None, help='JAVA_HOME to run Elasticsearch with')
     parser.add_argument('--analyzer-name', dest='analyzer_name', action='store',
                         default='standard', help='Analyzer name')
+    parser.add_argument('--namespace', dest='namespace', action='store',
+                        default=None, help='Namespace of analyzer')
     parser.add_argument('--text', dest='text', action='store', help='Text to analyze')
+    parser.add_argument('--input', dest='input', action='store',
+                        default=None, help='File to analyze line by line (- for stdin)')
+    parser.add_argument('--output', dest='output', action='store',
+                        default='-', help='File to write tokens of --input to (- for stdout)')
+    parser.add_argument('--format', dest='format', action='store', choices=['text', 'jsonl'],
+                        default='text', help='Format of --input and --output')
+    parser.add_argument('--text-field', dest='text_field', action='store',
+                        default='text', help='Field of text in jsonl input')
+    parser.add_argument('--tokens-field', dest='tokens_field', action='store',
+                        default='tokens', help='Field of tokens in jsonl output')
+    parser.add_argument('--batch-size', dest='batch_size', action='store',
+                        default=DEFAULT_BATCH_SIZE, type=int, help='Number of lines per request')
+    parser.add_argument('--concurrency', dest='concurrency', action='store',
+                        default=1, type=int, help='Number of concurrent requests')
+    parser.add_argument('--dedup-window', dest='dedup_window', action='store',
+                        default=None, type=int,
+                        help='Send duplicate lines once, remembering this many distinct lines (0: within a batch)')
+    parser.add_argument('--progress-interval', dest='progress_interval', action='store',
+                        default=stream.DEFAULT_PROGRESS_INTERVAL, type=float,
+                        help='Seconds between progress messages')
     parser.add_argument('--plugin', dest='plugins', action='append', help='Plugins to install')
     parser.add_argument('--verbose', '-v', dest='verbose', action='store_true',
                         default=False, help='Display debug messages')
     parser.add_argument('--stop', dest='stop', action='store_true',
-                        default=False, help='Stop Elasticsearch on exit')
+                        default=False, help='Stop Elasticsearch on exit if no other process uses it')
+    parser.add_argument('--force', dest='force', action='store_true',
+                        default=False, help='Stop Elasticsearch even if other processes use it')
+    parser.add_argument('--daemon', dest='daemon', action='store_true',
+                        default=False, help='Keep Elasticsearch running as a standby daemon')
+    parser.add_argument('--idle-timeout', dest='idle_timeout', action='store',
+                        default=elasticsearch.DEFAULT_IDLE_TIMEOUT, type=float,
+                        help='Seconds without clients before the daemon stops Elasticsearch (0 for never)')
     return parser.parse_args(args=args)
 
 
@@ -57,27 +149,76 @@ def configure_logging(options):
         logger.setLevel(20)
 
 
+def get_jvm_profile(options):
+    profile = jvm.get_profile(jvm.load_profile(options.jvm_profile),
+                              heap_min=options.heap_min,
+                              heap_max=options.heap_size,
+                              gc=options.gc,
+                              analyze_threads=options.analyze_threads,
+                              analyze_queue_size=options.analyze_queue_size,
+                              java_home=options.java_home)
+    if options.jvm_options is not None:
+        profile['jvm_options'] = profile.get('jvm_options') + options.jvm_options
+    return profile
+
+
 def main(args=None):
     options = parse_args(args)
 
     configure_logging(options)
 
     plugin_names = DEFAULT_PLUGINS if options.plugins is None else options.plugins
+    if options.daemon:
+        elasticsearch.run_standby(host=options.host,
+                                  http_port=options.http_port,
+                                  idle_timeout=options.idle_timeout,
+                                  transport_port=options.transport_port,
+                                  cluster_name=options.cluster_name,
+                                  plugin_names=plugin_names,
+                                  esrunner_version=options.esrunner_version,
+                                  num_of_node=options.num_of_node,
+                                  jvm_profile=get_jvm_profile(options))
+        return 0
+
     start_server(host=options.host,
                  http_port=options.http_port,
                  transport_port=options.transport_port,
                  cluster_name=options.cluster_name,
                  plugin_names=plugin_names,
-                 esrunner_version=options.esrunner_version)
-
-    tokens = analyzer(options.text,
-                      analyzer=options.analyzer_name)
-    print('\n'.join(tokens))
+                 esrunner_version=options.esrunner_version,
+                 num_of_node=options.num_of_node,
+                 jvm_profile=get_jvm_profile(options))
+
+    if options.input is not None:
+        deduplicator = Deduplicator(window=options.dedup_window) if options.dedup_window is not None else None
+        with stream.open_input(options.input) as lines, stream.open_output(options.output) as output:
+            stream.analyze_stream(lines, output,
+                                  input_format=options.format,
+                                  text_field=options.text_field,
+                                  tokens_field=options.tokens_field,
+                                  batch_size=options.batch_size,
+                                  concurrency=options.concurrency,
+                                  progress_interval=options.progress_interval,
+                                  analyzer=options.analyzer_name,
+                                  namespace=options.namespace,
+                                  host=options.host,
+                                  http_port=options.http_port,
+                                  deduplicator=deduplicator)
+        if deduplicator is not None:
+            logger.info('Deduplicated: ' + str(deduplicator.stats()))
+    elif options.text is not None:
+        tokens = analyzer(options.text,
+                          analyzer=options.analyzer_name,
+                          namespace=options.namespace,
+                          host=options.host,
+                          http_port=options.http_port)
+        print('\n'.join(tokens))
 
     if options.stop:
         stop_server(host=options.host,
                     http_port=options.http_port,
-                    esrunner_version=options.esrunner_version)
+                    esrunner_version=options.esrunner_version,
+                    force=options.force)
 
     return 0
 
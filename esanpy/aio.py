@@ -0,0 +1,425 @@
+# -*- coding: utf-8 -*-
+"""asyncio counterparts of esanpy.analyzers and the analysis functions in
+esanpy.elasticsearch. Requires Python 3.5 or above.
+
+Only I/O differs: chunking, the local engine, the token and persistent
+caches, request coalescing and metrics events are shared with them.
+"""
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import asyncio
+from collections import deque
+from io import BytesIO
+import json
+from logging import getLogger
+import time
+from urllib.error import HTTPError
+from urllib.error import URLError
+from urllib.parse import urlsplit
+import weakref
+
+from esanpy import analyzers
+from esanpy import cache
+from esanpy import chunking
+from esanpy import connection
+from esanpy import local
+from esanpy import metrics
+from esanpy import serializer
+from esanpy import singleflight
+from esanpy.analyzers import default_converter
+from esanpy.core import EsanpySetupError, EsanpyServerError
+from esanpy.core import DEFAULT_HTTP_PORT
+from esanpy.elasticsearch import get_analysis_settings, _parse_analysis_index
+
+
+logger = getLogger('esanpy')
+
+_timer = getattr(time, 'perf_counter', time.time)
+_clients = weakref.WeakKeyDictionary()
+_groups = weakref.WeakKeyDictionary()
+
+
+def _is_stale_connection(e):
+    # the server closed an idle connection before reading the request, as
+    # connection._is_stale_connection; an empty status line reads as EOF here
+    if isinstance(e, asyncio.IncompleteReadError):
+        return len(e.partial) == 0
+    return connection._is_stale_connection(e)
+
+
+class AsyncConnectionPool(object):
+    """Pool of persistent HTTP/1.1 connections to one host and port on an event loop.
+
+    As in connection.ConnectionPool, a request on a reused connection that the
+    server has closed is retried on a new one only if it failed before any
+    response bytes were received.
+    """
+
+    def __init__(self, host, port, maxsize=connection.DEFAULT_POOL_SIZE,
+                 idle_timeout=connection.DEFAULT_IDLE_TIMEOUT, timeout=None):
+        self.host = host
+        self.port = port
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle = deque()
+
+    async def _get_connection(self):
+        now = time.time()
+        while len(self._idle) > 0 and now - self._idle[0][2] > self.idle_timeout:
+            self._idle.popleft()[1].close()
+        if len(self._idle) > 0:
+            reader, writer, _ = self._idle.pop()
+            return reader, writer, True
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        return reader, writer, False
+
+    def _release_connection(self, reader, writer):
+        if len(self._idle) < self.maxsize:
+            self._idle.append((reader, writer, time.time()))
+        else:
+            writer.close()
+
+    async def request(self, method, path, body=None, headers={}):
+        if self.timeout is None:
+            return await self._request(method, path, body, headers)
+        return await asyncio.wait_for(self._request(method, path, body, headers), self.timeout)
+
+    async def _request(self, method, path, body, headers):
+        lines = [method + ' ' + path + ' HTTP/1.1',
+                 'Host: ' + self.host + ':' + str(self.port),
+                 'Content-Length: ' + str(0 if body is None else len(body))]
+        for name, value in headers.items():
+            lines.append(name + ': ' + value)
+        head = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        while True:
+            reader, writer, reused = await self._get_connection()
+            status_line = None
+            try:
+                writer.write(head if body is None else head + body)
+                await writer.drain()
+                status_line = await reader.readline()
+                if len(status_line) == 0:
+                    raise asyncio.IncompleteReadError(status_line, None)
+                code, reason, response_headers, data, keep_alive = await _read_response(reader, method, status_line)
+            except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                writer.close()
+                if reused and not status_line and _is_stale_connection(e):
+                    logger.debug('Reconnecting to ' + self.host + ':' + str(self.port) + ': ' + repr(e))
+                    continue
+                raise URLError(e)
+            except BaseException:
+                writer.close()
+                raise
+            if keep_alive:
+                self._release_connection(reader, writer)
+            else:
+                writer.close()
+            return code, reason, response_headers, data
+
+    def clear(self):
+        while len(self._idle) > 0:
+            self._idle.pop()[1].close()
+
+
+async def _read_response(reader, method, status_line):
+    version, code, reason = (status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[0:3]
+    code = int(code)
+    headers = []
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, value = line.decode('latin-1').split(':', 1)
+        headers.append((name.strip(), value.strip()))
+    header_map = dict((k.lower(), v) for k, v in headers)
+    keep_alive = version == 'HTTP/1.1' and header_map.get('connection', '').lower() != 'close'
+    if method == 'HEAD' or code in (204, 304) or 100 <= code < 200:
+        data = b''
+    elif header_map.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';', 1)[0].strip(), 16)
+            if size == 0:
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        data = b''.join(chunks)
+    elif 'content-length' in header_map:
+        data = await reader.readexactly(int(header_map['content-length']))
+    else:
+        data = await reader.read()
+        keep_alive = False
+    return code, reason, headers, data, keep_alive
+
+
+class AsyncClient(object):
+    """Holds one AsyncConnectionPool per host and port for an event loop."""
+
+    def __init__(self, maxsize=connection.DEFAULT_POOL_SIZE,
+                 idle_timeout=connection.DEFAULT_IDLE_TIMEOUT, timeout=None):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._pools = {}
+
+    def get_pool(self, host, port):
+        key = (host, int(port))
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = AsyncConnectionPool(host, int(port), maxsize=self.maxsize,
+                                       idle_timeout=self.idle_timeout, timeout=self.timeout)
+            self._pools[key] = pool
+        return pool
+
+    async def request(self, method, url, body=None, headers={'Content-Type': 'application/json'}):
+        parts = urlsplit(url)
+        path = parts.path if len(parts.path) > 0 else '/'
+        if len(parts.query) > 0:
+            path += '?' + parts.query
+        pool = self.get_pool(parts.hostname, parts.port if parts.port is not None else 80)
+        code, reason, response_headers, data = await pool.request(method, path, body, headers)
+        if code >= 400:
+            raise HTTPError(url, code, reason, dict(response_headers), BytesIO(data))
+        return connection.Response(url, code, reason, response_headers, data)
+
+    def close(self):
+        for pool in self._pools.values():
+            pool.clear()
+        self._pools.clear()
+
+
+def _get_loop():
+    get_running_loop = getattr(asyncio, 'get_running_loop', None)
+    return get_running_loop() if get_running_loop is not None else asyncio.get_event_loop()
+
+
+def get_client():
+    loop = _get_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = AsyncClient()
+        _clients[loop] = client
+    return client
+
+
+def close_client(loop=None):
+    client = _clients.pop(_get_loop() if loop is None else loop, None)
+    if client is not None:
+        client.close()
+
+
+class AsyncGroup(object):
+    """Runs at most one coroutine per key at a time on an event loop.
+
+    Callers await the shared task through asyncio.shield, so cancelling one
+    caller does not cancel the request the others are waiting for.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+    async def do(self, key, coroutine_fn):
+        task = self._tasks.get(key)
+        singleflight.record(task is not None)
+        if task is None:
+            task = asyncio.ensure_future(coroutine_fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda x: self._done(key, x))
+        return await asyncio.shield(task)
+
+    def _done(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # marks the exception as retrieved when every caller was cancelled
+            task.exception()
+
+    def __len__(self):
+        return len(self._tasks)
+
+
+def get_group():
+    loop = _get_loop()
+    group = _groups.get(loop)
+    if group is None:
+        group = AsyncGroup()
+        _groups[loop] = group
+    return group
+
+
+async def analyzer(text, analyzer='standard', namespace=None, attributes=None,
+                   host='localhost', http_port=DEFAULT_HTTP_PORT,
+                   converter=None):
+    if text is None:
+        return []
+    data = {'analyzer': analyzer, 'text': text}
+    if attributes is not None:
+        data.update({"explain": True,
+                     "attributes": attributes})
+        if converter is None:
+            converter = lambda x: x
+    elif converter is None:
+        converter = default_converter
+    url_suffix = '/_analyze' if namespace is None else '/' + namespace + '/_analyze'
+    return await send_analyze_request('http://' + host + ':' + str(http_port) + url_suffix,
+                                      data,
+                                      converter=converter)
+
+
+async def custom_analyzer(text, namespace=None, attributes=None,
+                          tokenizer='keyword', token_filter=[], char_filter=[],
+                          host='localhost', http_port=DEFAULT_HTTP_PORT,
+                          converter=None):
+    if text is None:
+        return []
+    data = {"tokenizer": tokenizer,
+            "filter": token_filter,
+            "char_filter": char_filter,
+            "text": text}
+    if attributes is not None:
+        data.update({"explain": True,
+                     "attributes": attributes})
+        if converter is None:
+            converter = lambda x: x
+    elif converter is None:
+        converter = default_converter
+    url_suffix = '/_analyze' if namespace is None else '/' + namespace + '/_analyze'
+    return await send_analyze_request('http://' + host + ':' + str(http_port) + url_suffix,
+                                      data,
+                                      converter=converter)
+
+
+async def send_analyze_request(url, data, converter):
+    """Same as analyzers.send_analyze_request, sending requests on the event loop.
+
+    Texts are chunked, analyzed locally and cached as there; persistent cache
+    lookups and the index lookups of its fingerprints block, so they run in
+    the default executor.
+    """
+    if chunking.enabled and chunking.should_split(data.get('text')):
+        return await _send_chunked_request(url, data, converter)
+    result = analyzers._analyze_locally(url, data)
+    if result is not None:
+        if local.should_verify():
+            response = await get_client().request('POST', url, serializer.dumps(data))
+            result = analyzers._check_local_result(data, result, response.read())
+        return converter(result)
+    with metrics.trace('analyze') as values:
+        return await _send_analyze_request(url, data, converter, values)
+
+
+async def _send_analyze_request(url, data, converter, values):
+    tokens_only = analyzers._is_tokens_only(data, converter)
+    token_cache, key, result = analyzers._get_cached_result(url, data, tokens_only, values)
+    if result is None:
+        if singleflight.enabled:
+            result = await get_group().do(analyzers._get_coalescing_key(url, data, tokens_only, key, values),
+                                          lambda: _fetch_result(url, data, tokens_only, token_cache, key, values))
+        else:
+            result = await _fetch_result(url, data, tokens_only, token_cache, key, values)
+    return analyzers._convert_result(result, tokens_only, token_cache is not None or singleflight.enabled,
+                                     converter, values)
+
+
+async def _fetch_result(url, data, tokens_only, token_cache, key, values):
+    loop = _get_loop()
+    if cache.get_persistent_cache() is None:
+        persistent_cache, persistent_key, body = None, None, None
+        values['cache'] = None
+    else:
+        persistent_cache, persistent_key, body = \
+            await loop.run_in_executor(None, analyzers._get_persistent_body, url, data, values)
+    if body is None:
+        request_body = analyzers._serialize_request(data, values)
+        step = _timer()
+        body = (await get_client().request('POST', url, request_body)).read()
+        values['request_seconds'] = _timer() - step
+        if persistent_cache is not None:
+            await loop.run_in_executor(None, persistent_cache.put, persistent_key, body)
+    return analyzers._decode_result(url, body, tokens_only, token_cache, key, values)
+
+
+async def _send_chunked_request(url, data, converter):
+    chunks = chunking.split_text(data.get('text'))
+    semaphore = asyncio.Semaphore(chunking.get_max_workers())
+
+    async def send(chunk):
+        async with semaphore:
+            return await send_analyze_request(url, dict(data, text=chunk), lambda y: y)
+
+    results = await asyncio.gather(*[send(x) for x in chunks])
+    return converter(chunking.merge_analyze_results(results, chunks))
+
+
+async def create_analysis(namespace, analyzer={}, tokenizer={}, token_filter={}, char_filter={},
+                          host='localhost', http_port=DEFAULT_HTTP_PORT):
+    with metrics.trace('analysis.create'):
+        return await _create_analysis(namespace, analyzer, tokenizer, token_filter, char_filter, host, http_port)
+
+
+async def _create_analysis(namespace, analyzer, tokenizer, token_filter, char_filter, host, http_port):
+    url = 'http://' + host + ':' + str(http_port) + '/' + namespace
+    client = get_client()
+    try:
+        response = await client.request('HEAD', url)
+        if response.code == 200:
+            return False
+    except HTTPError as e:
+        if e.code == 404:
+            logger.debug('Index does not exist: ' + str(e))
+        else:
+            raise EsanpySetupError('Failed to check ' + namespace + ' namespace: ' + e.read().decode('utf-8'))
+
+    data = get_analysis_settings(analyzer=analyzer, tokenizer=tokenizer,
+                                 token_filter=token_filter, char_filter=char_filter)
+    try:
+        response = await client.request('PUT', url, json.dumps(data).encode('utf-8'))
+        if logger.isEnabledFor(10):
+            logger.debug(response.read().decode('utf-8'))
+    except HTTPError as e:
+        raise EsanpySetupError('Failed to create ' + namespace + ' namespace: ' + e.read().decode('utf-8'))
+    finally:
+        cache.invalidate_namespace(namespace, host=host, http_port=http_port)
+    return True
+
+
+async def get_analysis_index(namespace,
+                             host='localhost', http_port=DEFAULT_HTTP_PORT):
+    """Same as elasticsearch.get_analysis_index, resolving aliases to the concrete index."""
+    url = 'http://' + host + ':' + str(http_port) + '/' + namespace
+    try:
+        response = await get_client().request('GET', url)
+        if response.code == 200:
+            return _parse_analysis_index(namespace, json.loads(response.read().decode('utf-8')))
+    except HTTPError as e:
+        if e.code == 404:
+            logger.debug('Index does not exist: ' + str(e))
+        else:
+            raise EsanpySetupError('Failed to get ' + namespace + ' namespace: ' + e.read().decode('utf-8'))
+    return None
+
+
+async def get_analysis(namespace,
+                       host='localhost', http_port=DEFAULT_HTTP_PORT):
+    with metrics.trace('analysis.get'):
+        index = await get_analysis_index(namespace, host=host, http_port=http_port)
+    return index.get('analysis') if index is not None else None
+
+
+async def delete_analysis(namespace,
+                          host='localhost', http_port=DEFAULT_HTTP_PORT):
+    with metrics.trace('analysis.delete'):
+        return await _delete_analysis(namespace, host, http_port)
+
+
+async def _delete_analysis(namespace, host, http_port):
+    url = 'http://' + host + ':' + str(http_port) + '/' + namespace
+    try:
+        response = await get_client().request('DELETE', url)
+    finally:
+        cache.invalidate_namespace(namespace, host=host, http_port=http_port)
+    if response.code != 200:
+        raise EsanpyServerError('Failed to delete ' + namespace)
@@ -1,22 +1,24 @@
 # -*- coding: utf-8 -*-
 from __future__ import division, print_function, absolute_import, unicode_literals
 
-from contextlib import closing
-import json
+from bisect import bisect_right
+import copy
 from logging import getLogger
+import time
 
-from esanpy.core import DEFAULT_HTTP_PORT
-
-
-try:
-    from urllib.request import urlopen
-    from urllib.request import Request
-except ImportError:
-    from urllib2 import urlopen
-    from urllib2 import Request
+from esanpy import cache
+from esanpy import chunking
+from esanpy import connection
+from esanpy import local
+from esanpy import metrics
+from esanpy import serializer
+from esanpy import singleflight
+from esanpy.core import DEFAULT_HTTP_PORT, DEFAULT_BATCH_SIZE, DEFAULT_BATCH_BYTES
 
 logger = getLogger('esanpy')
 
+_timer = getattr(time, 'perf_counter', time.time)
+
 
 def default_converter(result):
     return [x.get('token') for x in result.get('tokens')]
@@ -64,9 +66,346 @@ def custom_analyzer(text, namespace=None, attributes=None,
                                 converter=converter)
 
 
+def _get_local_analyzer(url, data):
+    # only built-in chains without a namespace can be analyzed in process
+    if 'explain' in data or not url.endswith('/_analyze') or url.count('/') != 3:
+        return None
+    return local.get_analyzer(data)
+
+
+def _verify_local_result(url, data, result):
+    response = connection.request('POST', url, serializer.dumps(data))
+    return _check_local_result(data, result, response.read())
+
+
+def _check_local_result(data, result, body):
+    server_result = serializer.loads(body)
+    return result if local.check(data, result, server_result) else server_result
+
+
+def _analyze_locally(url, data):
+    """Return the result of the local engine for data, or None if the server is needed."""
+    local_analyzer = _get_local_analyzer(url, data) if local.enabled else None
+    if local_analyzer is None:
+        return None
+    return local.run(local_analyzer, data.get('text'))
+
+
 def send_analyze_request(url, data, converter):
-    req = Request(url)
-    req.add_header('Content-Type', 'application/json')
-    with closing(urlopen(req, json.dumps(data).encode('utf-8'))) as response:
-        result = json.loads(response.read().decode('utf-8'))
+    if chunking.enabled and chunking.should_split(data.get('text')):
+        return _send_chunked_request(url, data, converter)
+    result = _analyze_locally(url, data)
+    if result is not None:
+        if local.should_verify():
+            result = _verify_local_result(url, data, result)
         return converter(result)
+    with metrics.trace('analyze') as values:
+        return _send_analyze_request(url, data, converter, values)
+
+
+def _is_tokens_only(data, converter):
+    # the default converter only needs token texts, which the serializer
+    # can extract without decoding every token object
+    return converter is default_converter and 'explain' not in data
+
+
+def _get_cached_result(url, data, tokens_only, values):
+    """Return the token cache, the key of data in it and the cached result or None."""
+    token_cache = cache.get_cache()
+    if token_cache is None:
+        return None, None, None
+    key = cache.make_key(data) + (':tokens' if tokens_only else '')
+    result = token_cache.get(url, key)
+    if result is not None:
+        values['cache'] = 'memory'
+    return token_cache, key, result
+
+
+def _get_coalescing_key(url, data, tokens_only, key, values):
+    # the fetch function is not called when the result of a request in flight is shared
+    values['cache'] = 'singleflight'
+    return url, key if key is not None else cache.make_key(data) + (':tokens' if tokens_only else '')
+
+
+def _convert_result(result, tokens_only, shared, converter, values):
+    if shared:
+        # cached and coalesced results are shared, so callers get copies
+        result = list(result) if tokens_only else copy.deepcopy(result)
+    if tokens_only:
+        return result
+    step = _timer()
+    converted = converter(result)
+    values['convert_seconds'] = _timer() - step
+    return converted
+
+
+def _send_analyze_request(url, data, converter, values):
+    # values collects the cache used and the time of each step for the
+    # analyze event; it is a throwaway dict while metrics are disabled
+    tokens_only = _is_tokens_only(data, converter)
+    token_cache, key, result = _get_cached_result(url, data, tokens_only, values)
+    if result is None:
+        if singleflight.enabled:
+            result = singleflight.do(_get_coalescing_key(url, data, tokens_only, key, values),
+                                     lambda: _fetch_result(url, data, tokens_only, token_cache, key, values))
+        else:
+            result = _fetch_result(url, data, tokens_only, token_cache, key, values)
+    return _convert_result(result, tokens_only, token_cache is not None or singleflight.enabled,
+                           converter, values)
+
+
+def _get_persistent_body(url, data, values):
+    """Return the persistent cache, the key of data in it and the cached body or None."""
+    values['cache'] = None
+    persistent_cache = cache.get_persistent_cache()
+    if persistent_cache is None:
+        return None, None, None
+    persistent_key = persistent_cache.make_key(url, data)
+    body = persistent_cache.get(persistent_key)
+    if body is not None:
+        values['cache'] = 'persistent'
+    return persistent_cache, persistent_key, body
+
+
+def _serialize_request(data, values):
+    step = _timer()
+    request_body = serializer.dumps(data)
+    values['serialize_seconds'] = _timer() - step
+    return request_body
+
+
+def _decode_result(url, body, tokens_only, token_cache, key, values):
+    step = _timer()
+    result = serializer.loads_tokens(body) if tokens_only else serializer.loads(body)
+    values['deserialize_seconds'] = _timer() - step
+    if token_cache is not None:
+        token_cache.put(url, key, result, len(body))
+    return result
+
+
+def _fetch_result(url, data, tokens_only, token_cache, key, values):
+    persistent_cache, persistent_key, body = _get_persistent_body(url, data, values)
+    if body is None:
+        request_body = _serialize_request(data, values)
+        step = _timer()
+        body = connection.request('POST', url, request_body).read()
+        values['request_seconds'] = _timer() - step
+        if persistent_cache is not None:
+            persistent_cache.put(persistent_key, body)
+    return _decode_result(url, body, tokens_only, token_cache, key, values)
+
+
+def _send_chunked_request(url, data, converter):
+    # imported here because esanpy.executor imports this module
+    from esanpy.executor import AnalysisExecutor
+    chunks = chunking.split_text(data.get('text'))
+    with AnalysisExecutor(max_workers=min(chunking.get_max_workers(), len(chunks))) as executor:
+        results = list(executor.map(lambda x: send_analyze_request(url, dict(data, text=x), lambda y: y), chunks))
+    return converter(chunking.merge_analyze_results(results, chunks))
+
+
+def analyze_batch(texts, analyzer='standard', namespace=None, attributes=None,
+                  host='localhost', http_port=DEFAULT_HTTP_PORT,
+                  converter=None, batch_size=DEFAULT_BATCH_SIZE, batch_bytes=DEFAULT_BATCH_BYTES,
+                  deduplicator=None):
+    data = {'analyzer': analyzer}
+    if attributes is not None:
+        data.update({"explain": True,
+                     "attributes": attributes})
+        if converter is None:
+            converter = lambda x: x
+    elif converter is None:
+        converter=default_converter
+    url_suffix = '/_analyze' if namespace is None else '/' + namespace + '/_analyze'
+    return send_analyze_batch_request('http://' + host + ':' + str(http_port) + url_suffix,
+                                      data,
+                                      texts,
+                                      converter=converter,
+                                      batch_size=batch_size,
+                                      batch_bytes=batch_bytes,
+                                      deduplicator=deduplicator)
+
+
+def custom_analyze_batch(texts, namespace=None, attributes=None,
+                         tokenizer='keyword', token_filter=[], char_filter=[],
+                         host='localhost', http_port=DEFAULT_HTTP_PORT,
+                         converter=None, batch_size=DEFAULT_BATCH_SIZE, batch_bytes=DEFAULT_BATCH_BYTES,
+                         deduplicator=None):
+    data = {"tokenizer": tokenizer,
+            "filter": token_filter,
+            "char_filter": char_filter}
+    if attributes is not None:
+        data.update({"explain": True,
+                     "attributes": attributes})
+        if converter is None:
+            converter = lambda x: x
+    elif converter is None:
+        converter=default_converter
+    url_suffix = '/_analyze' if namespace is None else '/' + namespace + '/_analyze'
+    return send_analyze_batch_request('http://' + host + ':' + str(http_port) + url_suffix,
+                                      data,
+                                      texts,
+                                      converter=converter,
+                                      batch_size=batch_size,
+                                      batch_bytes=batch_bytes,
+                                      deduplicator=deduplicator)
+
+
+def send_analyze_batch_request(url, data, texts, converter,
+                               batch_size=DEFAULT_BATCH_SIZE, batch_bytes=DEFAULT_BATCH_BYTES,
+                               deduplicator=None):
+    if deduplicator is not None:
+        results = deduplicator.analyze(url, data, texts,
+                                       lambda x: send_analyze_batch_request(url, data, x, lambda y: y,
+                                                                            batch_size=batch_size,
+                                                                            batch_bytes=batch_bytes))
+        return [[] if x is None else converter(x) for x in results]
+    results = [[] for _ in texts]
+    if chunking.enabled:
+        # large texts are analyzed in chunks instead of in a batch
+        pending = list(texts)
+        for i, text in enumerate(texts):
+            if chunking.should_split(text):
+                results[i] = _send_chunked_request(url, dict(data, text=text), converter)
+                pending[i] = None
+        texts = pending
+    local_analyzer = _get_local_analyzer(url, data) if local.enabled else None
+    local_results = {}
+    if local_analyzer is not None:
+        # texts analyzed in process are skipped by split_batches, except sampled ones to verify
+        pending = list(texts)
+        for i, text in enumerate(texts):
+            result = local.run(local_analyzer, text) if text is not None else None
+            if result is None:
+                continue
+            if local.should_verify():
+                local_results[i] = result
+                continue
+            results[i] = converter(result)
+            pending[i] = None
+        texts = pending
+    for indexes in split_batches(texts, batch_size, batch_bytes):
+        batch_texts = [texts[i] for i in indexes]
+        batch_data = dict(data)
+        batch_data['text'] = batch_texts
+        with metrics.trace('analyze_batch', num_of_text=len(batch_texts)) as values:
+            step = _timer()
+            request_body = serializer.dumps(batch_data)
+            values['serialize_seconds'] = _timer() - step
+            step = _timer()
+            response = connection.request('POST', url, request_body)
+            values['request_seconds'] = _timer() - step
+            step = _timer()
+            result = serializer.loads(response.read())
+            values['deserialize_seconds'] = _timer() - step
+            step = _timer()
+            for i, text_result in zip(indexes, split_analyze_result(result, batch_texts)):
+                if i in local_results:
+                    local.check(dict(data, text=texts[i]), local_results[i], text_result)
+                results[i] = converter(text_result)
+            values['convert_seconds'] = _timer() - step
+    return results
+
+
+def split_batches(texts, batch_size=DEFAULT_BATCH_SIZE, batch_bytes=DEFAULT_BATCH_BYTES):
+    """Yield lists of indexes into texts, bounded by item count and UTF-8 size.
+
+    None entries are skipped and a text larger than batch_bytes is sent alone.
+    """
+    indexes = []
+    size = 0
+    for i, text in enumerate(texts):
+        if text is None:
+            continue
+        text_size = len(text.encode('utf-8'))
+        if len(indexes) > 0 and (len(indexes) >= batch_size or size + text_size > batch_bytes):
+            yield indexes
+            indexes = []
+            size = 0
+        indexes.append(i)
+        size += text_size
+    if len(indexes) > 0:
+        yield indexes
+
+
+def get_text_offsets(texts):
+    """Return the start offset of each text in a multi-valued _analyze request.
+
+    Elasticsearch counts offsets in UTF-16 code units and adds an offset gap
+    of 1 between values.
+    """
+    offsets = []
+    offset = 0
+    for text in texts:
+        offsets.append(offset)
+        offset += len(text.encode('utf-16-le')) // 2 + 1
+    return offsets
+
+
+def split_analyze_result(result, texts):
+    """Split an _analyze result for multiple texts into one result per text.
+
+    Tokens are assigned to texts by start offset. Offsets are rebased to each
+    text, and positions are rebased so that the first token of each text has
+    the lowest position found for it in the response (0 for most analyzers),
+    which hides the position increment gap between values.
+    """
+    offsets = get_text_offsets(texts)
+    token_lists = []
+    detail = result.get('detail')
+    if detail is None:
+        token_lists.append(result.get('tokens') or [])
+    else:
+        for key in ('analyzer', 'tokenizer'):
+            if detail.get(key) is not None:
+                token_lists.append(detail.get(key).get('tokens') or [])
+        for token_filter in detail.get('tokenfilters') or []:
+            token_lists.append(token_filter.get('tokens') or [])
+
+    split_lists = []
+    positions = [None] * len(texts)
+    for tokens in token_lists:
+        split_tokens = [[] for _ in texts]
+        for token in tokens:
+            index = bisect_right(offsets, token.get('start_offset')) - 1
+            split_tokens[index].append(token)
+            position = token.get('position')
+            if positions[index] is None or position < positions[index]:
+                positions[index] = position
+        split_lists.append(split_tokens)
+
+    results = []
+    for index, offset in enumerate(offsets):
+        token_lists = []
+        for split_tokens in split_lists:
+            tokens = []
+            for token in split_tokens[index]:
+                token = dict(token)
+                token['start_offset'] -= offset
+                token['end_offset'] -= offset
+                token['position'] -= positions[index]
+                tokens.append(token)
+            token_lists.append(tokens)
+        results.append(_build_text_result(result, index, token_lists))
+    return results
+
+
+def _build_text_result(result, index, token_lists):
+    detail = result.get('detail')
+    if detail is None:
+        return {'tokens': token_lists[0]}
+    text_detail = copy.deepcopy(dict((k, v) for k, v in detail.items()
+                                     if k not in ('analyzer', 'tokenizer', 'tokenfilters')))
+    token_lists = list(token_lists)
+    for key in ('analyzer', 'tokenizer'):
+        if detail.get(key) is not None:
+            text_detail[key] = {'name': detail.get(key).get('name'),
+                                'tokens': token_lists.pop(0)}
+    if detail.get('tokenfilters') is not None:
+        text_detail['tokenfilters'] = [{'name': x.get('name'), 'tokens': token_lists.pop(0)}
+                                       for x in detail.get('tokenfilters')]
+    for char_filter in text_detail.get('charfilters') or []:
+        filtered_text = char_filter.get('filtered_text')
+        if isinstance(filtered_text, list):
+            char_filter['filtered_text'] = [filtered_text[index]]
+    return {'detail': text_detail}
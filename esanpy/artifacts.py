@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+from contextlib import closing
+import errno
+import hashlib
+from logging import getLogger
+import os
+import shutil
+import zipfile
+
+from esanpy.core import EsanpySetupError
+
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    from urllib.request import Request
+    from urllib.request import urlopen
+    from urllib.request import pathname2url
+    from urllib.error import HTTPError
+    from urllib.error import URLError
+except ImportError:
+    from urllib2 import Request
+    from urllib2 import urlopen
+    from urllib import pathname2url
+    from urllib2 import HTTPError
+    from urllib2 import URLError
+
+logger = getLogger('esanpy')
+
+MIRROR_ENV = 'ESANPY_MIRROR'
+CHECKSUM_ALGORITHMS = ('sha512', 'sha1')
+BUFFER_SIZE = 64 * 1024
+
+
+def get_mirror(mirror=None):
+    """Return the mirror base URL from the argument or ESANPY_MIRROR, if any.
+
+    A mirror is a local directory, a file:// URL or an http(s) URL that holds
+    the artifacts (and optional .sha1/.sha512 files) by file name.
+    """
+    if mirror is None:
+        mirror = os.environ.get(MIRROR_ENV)
+    if mirror is None or len(mirror) == 0:
+        return None
+    if '://' not in mirror:
+        mirror = 'file:' + pathname2url(os.path.abspath(mirror))
+    return mirror.rstrip('/')
+
+
+def resolve_url(url, mirror=None):
+    mirror = get_mirror(mirror)
+    if mirror is None:
+        return url
+    return mirror + '/' + url.split('/')[-1]
+
+
+def get_file_hash(path, algorithm='sha1'):
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(BUFFER_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fetch_checksum(url):
+    """Return (algorithm, hex digest) published next to url, or None."""
+    for algorithm in CHECKSUM_ALGORITHMS:
+        try:
+            with closing(urlopen(url + '.' + algorithm)) as response:
+                value = response.read().decode('utf-8').strip().split()
+                if len(value) > 0:
+                    return algorithm, value[0].lower()
+        except (HTTPError, URLError, IOError) as e:
+            logger.debug('No ' + algorithm + ' checksum for ' + url + ': ' + str(e))
+    return None
+
+
+def _open_part_file(part_file):
+    """Open part_file for appending with an exclusive lock across processes.
+
+    Without fcntl (Windows) the file is not locked.
+    """
+    while True:
+        f = open(part_file, 'ab')
+        if fcntl is None:
+            return f
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            if os.path.samestat(os.fstat(f.fileno()), os.stat(part_file)):
+                return f
+        except OSError:
+            pass
+        # renamed or removed by the process holding the lock before
+        f.close()
+
+
+def download(url, path, checksum=None, require_checksum=False):
+    """Download url to path, resuming a previous partial download.
+
+    Data is written to path + '.part' and renamed to path only after the
+    checksum (given, or fetched from url + '.sha512'/'.sha1') matches.
+    The part file is locked while it is written, so processes downloading
+    the same path wait for each other instead of writing to it together.
+    """
+    if checksum is None:
+        checksum = fetch_checksum(url)
+    if checksum is None and require_checksum:
+        raise EsanpySetupError('No checksum is available for ' + url)
+
+    part_file = path + '.part'
+    with _open_part_file(part_file) as f:
+        if os.path.exists(path):
+            logger.debug('Downloaded by another process: ' + path)
+            os.remove(part_file)
+            return path
+        f.seek(0, os.SEEK_END)
+        offset = f.tell()
+        req = Request(url)
+        if offset > 0 and not url.startswith('file:'):
+            req.add_header('Range', 'bytes=' + str(offset) + '-')
+        try:
+            with closing(urlopen(req)) as response:
+                resumed = offset > 0 and getattr(response, 'code', None) == 206
+                if offset > 0:
+                    logger.debug(('Resuming ' if resumed else 'Restarting ') + url + ' at ' + str(offset))
+                if not resumed:
+                    f.seek(0)
+                    f.truncate(0)
+                for chunk in iter(lambda: response.read(BUFFER_SIZE), b''):
+                    f.write(chunk)
+                f.flush()
+        except HTTPError as e:
+            if e.code == 416 and offset > 0:
+                logger.debug('Download is already completed: ' + url)
+            else:
+                raise EsanpySetupError('Failed to download ' + url + ': ' + str(e))
+        except (URLError, IOError) as e:
+            raise EsanpySetupError('Failed to download ' + url + ': ' + str(e))
+
+        if checksum is not None:
+            algorithm, expected = checksum
+            actual = get_file_hash(part_file, algorithm)
+            if actual != expected:
+                os.remove(part_file)
+                raise EsanpySetupError('Checksum mismatch for ' + url + ': expected ' + expected + ', got ' + actual)
+        os.rename(part_file, path)
+    return path
+
+
+def _make_dirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def _staging_path(path):
+    return path + '.tmp-' + str(os.getpid()) + '-' + str(id(path))
+
+
+def _commit_staging(staging_dir, path):
+    try:
+        os.rename(staging_dir, path)
+    except OSError:
+        if not os.path.exists(path):
+            raise
+        # another process installed it first
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def fetch_artifact(url, artifact_home, mirror=None, require_checksum=False):
+    """Download an artifact into the shared cache and return its zip path and sha1."""
+    downloads_dir = artifact_home + '/downloads'
+    _make_dirs(downloads_dir)
+    file_name = url.split('/')[-1]
+    zip_file = downloads_dir + '/' + file_name
+    sha1_file = zip_file + '.sha1'
+    if not os.path.exists(zip_file):
+        resolved_url = resolve_url(url, mirror)
+        logger.debug('Downloading ' + resolved_url)
+        download(resolved_url, zip_file, require_checksum=require_checksum)
+    if os.path.exists(sha1_file):
+        with open(sha1_file, 'rt') as f:
+            sha1 = f.read().strip()
+    else:
+        sha1 = get_file_hash(zip_file, 'sha1')
+        with open(sha1_file + '.tmp-' + str(os.getpid()), 'wt') as f:
+            f.write(sha1)
+        os.rename(sha1_file + '.tmp-' + str(os.getpid()), sha1_file)
+    return zip_file, sha1
+
+
+def extract_artifact(zip_file, sha1, artifact_home):
+    """Extract a zip once into artifact_home/<sha1> and return that directory."""
+    extracted_dir = artifact_home + '/' + sha1
+    if not os.path.exists(extracted_dir):
+        staging_dir = _staging_path(extracted_dir)
+        try:
+            with zipfile.ZipFile(zip_file, 'r') as zf:
+                zf.extractall(path=staging_dir)
+        except zipfile.BadZipfile as e:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            os.remove(zip_file)
+            raise EsanpySetupError('Broken artifact ' + zip_file + ': ' + str(e))
+        _commit_staging(staging_dir, extracted_dir)
+    return extracted_dir
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except (OSError, AttributeError):
+        shutil.copy2(src, dst)
+
+
+def install_tree(src_dir, dest_dir):
+    """Install src_dir as dest_dir with hard links where possible, atomically."""
+    if os.path.exists(dest_dir):
+        return False
+    staging_dir = _staging_path(dest_dir)
+    for root, dirs, files in os.walk(src_dir):
+        target_root = staging_dir + root[len(src_dir):]
+        _make_dirs(target_root)
+        for name in files:
+            _link_or_copy(os.path.join(root, name), os.path.join(target_root, name))
+    _commit_staging(staging_dir, dest_dir)
+    return True
@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+from collections import OrderedDict
+import hashlib
+import json
+from logging import getLogger
+import os
+import sqlite3
+import threading
+import time
+import weakref
+
+from esanpy.core import DEFAULT_HTTP_PORT, ESRUNNER_VERSION
+
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+
+logger = getLogger('esanpy')
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_PERSISTENT_MAX_BYTES = 1024 * 1024 * 1024
+PERSISTENT_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL
+)"""
+
+_cache = None
+_persistent_cache = None
+_listeners = weakref.WeakSet()
+
+
+class TokenCache(object):
+    """Bounded LRU cache of decoded _analyze results.
+
+    Entries are keyed by the analyze URL, which carries host, port and
+    namespace, and by a hash of the request body, which carries the analyzer
+    definition, attributes and text. Cached results are shared, so converters
+    must not modify them.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+        self._entries = OrderedDict()
+        self._keys_by_url = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, url, key):
+        with self._lock:
+            entry = self._entries.pop((url, key), None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries[(url, key)] = entry
+            self.hits += 1
+            return entry[0]
+
+    def put(self, url, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old_entry = self._entries.pop((url, key), None)
+            if old_entry is not None:
+                self.size -= old_entry[1]
+            self._entries[(url, key)] = (value, size)
+            self._keys_by_url.setdefault(url, set()).add(key)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                (evicted_url, evicted_key), (_, evicted_size) = self._entries.popitem(last=False)
+                self._discard_key(evicted_url, evicted_key)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def _discard_key(self, url, key):
+        keys = self._keys_by_url.get(url)
+        if keys is not None:
+            keys.discard(key)
+            if len(keys) == 0:
+                del self._keys_by_url[url]
+
+    def invalidate(self, url):
+        with self._lock:
+            for key in self._keys_by_url.pop(url, ()):
+                entry = self._entries.pop((url, key), None)
+                if entry is not None:
+                    self.size -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_url.clear()
+            self.size = 0
+
+    def after_fork(self):
+        # the lock may have been held by another thread of the parent
+        self._lock = threading.Lock()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self._entries),
+                    'bytes': self.size}
+
+
+class PersistentCache(object):
+    """SQLite-backed cache of _analyze response bodies shared across processes.
+
+    Keys combine a fingerprint of the analyzer definition with a hash of the
+    text. The fingerprint covers the request body without the text, the
+    runner version, the plugins installed for the port and, for a namespace,
+    the name, uuid and analysis settings of its index, so a changed
+    definition, a recreated index or an alias switched to a new version
+    (whose resource files may have changed behind the same paths) never
+    hits stale entries. Fingerprints are recomputed fingerprint_ttl seconds
+    after they were made, so changes made by other processes are picked up
+    within that time.
+    The database runs in WAL mode so readers in other processes are not
+    blocked; entries least recently read are deleted when the file grows
+    beyond max_bytes.
+    """
+
+    access_resolution = 60
+    fingerprint_ttl = 5
+    compaction_interval = 1000
+
+    def __init__(self, path=None, max_bytes=DEFAULT_PERSISTENT_MAX_BYTES,
+                 esrunner_version=ESRUNNER_VERSION, timeout=30):
+        if path is None:
+            from esanpy.elasticsearch import get_esanalyzer_home
+            path = get_esanalyzer_home() + '/cache/analysis.db'
+        directory = os.path.dirname(path)
+        if len(directory) > 0 and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.esrunner_version = esrunner_version
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._fingerprints = {}
+        self._forked_connections = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        conn = self._get_connection()
+        conn.execute(PERSISTENT_CACHE_SCHEMA)
+        conn.commit()
+
+    def _get_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get_fingerprint(self, url, data):
+        definition = dict((k, v) for k, v in data.items() if k != 'text')
+        memo_key = (url, make_key(definition))
+        now = time.time()
+        fingerprint, created = self._fingerprints.get(memo_key, (None, None))
+        if fingerprint is None or now - created > self.fingerprint_ttl:
+            parts = urlsplit(url)
+            path = parts.path.strip('/').split('/')
+            namespace = path[0] if len(path) > 1 else None
+            fingerprint = make_key({'esrunner_version': self.esrunner_version,
+                                    'plugins': _get_installed_plugins(parts.port, self.esrunner_version),
+                                    'analysis': _get_namespace_analysis(namespace, parts.hostname, parts.port),
+                                    'definition': definition})
+            with self._lock:
+                self._fingerprints[memo_key] = (fingerprint, now)
+        return fingerprint
+
+    def make_key(self, url, data):
+        text = json.dumps(data.get('text'), ensure_ascii=False)
+        return self.get_fingerprint(url, data) + ':' + hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        conn = self._get_connection()
+        row = conn.execute('SELECT value, accessed FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        now = time.time()
+        if now - row[1] > self.access_resolution:
+            try:
+                conn.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+                conn.commit()
+            except sqlite3.OperationalError as e:
+                logger.debug('Failed to update access time: ' + str(e))
+        return bytes(row[0])
+
+    def put(self, key, value):
+        conn = self._get_connection()
+        try:
+            conn.execute('INSERT OR REPLACE INTO entries (key, value, size, accessed) VALUES (?, ?, ?, ?)',
+                         (key, sqlite3.Binary(value), len(value), time.time()))
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            logger.debug('Failed to store cache entry: ' + str(e))
+            return
+        self._puts += 1
+        if self._puts % self.compaction_interval == 0:
+            self.compact()
+
+    def compact(self, vacuum=False):
+        conn = self._get_connection()
+        low_watermark = self.max_bytes * 0.8
+        size = conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        while size > self.max_bytes:
+            rows = conn.execute('SELECT key, size FROM entries ORDER BY accessed LIMIT 1000').fetchall()
+            if len(rows) == 0:
+                break
+            removed = []
+            for key, entry_size in rows:
+                removed.append((key,))
+                size -= entry_size
+                if size <= low_watermark:
+                    break
+            conn.executemany('DELETE FROM entries WHERE key = ?', removed)
+            conn.commit()
+        if vacuum:
+            conn.execute('VACUUM')
+        return size
+
+    def after_fork(self):
+        """Stop using the connections of the parent process in a forked child.
+
+        SQLite connections must not be used across fork. They are kept
+        referenced but never closed, because closing one may checkpoint the
+        WAL file the parent is still using.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._forked_connections.append(conn)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def invalidate(self, url):
+        with self._lock:
+            for memo_key in [x for x in self._fingerprints if x[0] == url]:
+                del self._fingerprints[memo_key]
+
+    def clear(self):
+        conn = self._get_connection()
+        conn.execute('DELETE FROM entries')
+        conn.commit()
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def stats(self):
+        entries, size = self._get_connection().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'entries': entries,
+                'bytes': size}
+
+
+def _get_installed_plugins(http_port, esrunner_version):
+    from esanpy.elasticsearch import get_plugin_home
+    plugin_home = get_plugin_home(http_port, esrunner_version)
+    if not os.path.exists(plugin_home):
+        return []
+    return sorted(os.listdir(plugin_home))
+
+
+def _get_namespace_analysis(namespace, host, http_port):
+    if namespace is None:
+        return None
+    from esanpy.elasticsearch import get_analysis_index
+    return get_analysis_index(namespace, host=host, http_port=http_port)
+
+
+def make_key(data):
+    body = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha1(body.encode('utf-8')).hexdigest()
+
+
+def get_analyze_url(host, http_port, namespace=None):
+    url_suffix = '/_analyze' if namespace is None else '/' + namespace + '/_analyze'
+    return 'http://' + host + ':' + str(http_port) + url_suffix
+
+
+def enable(max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+    global _cache
+    _cache = TokenCache(max_entries=max_entries, max_bytes=max_bytes)
+    return _cache
+
+
+def disable():
+    global _cache
+    _cache = None
+
+
+def get_cache():
+    return _cache
+
+
+def stats():
+    if _cache is None:
+        return None
+    return _cache.stats()
+
+
+def enable_persistent(path=None, max_bytes=DEFAULT_PERSISTENT_MAX_BYTES,
+                      esrunner_version=ESRUNNER_VERSION):
+    global _persistent_cache
+    _persistent_cache = PersistentCache(path=path, max_bytes=max_bytes,
+                                        esrunner_version=esrunner_version)
+    return _persistent_cache
+
+
+def disable_persistent():
+    global _persistent_cache
+    if _persistent_cache is not None:
+        _persistent_cache.close()
+    _persistent_cache = None
+
+
+def get_persistent_cache():
+    return _persistent_cache
+
+
+def reset_after_fork():
+    """Make the caches inherited by a forked process safe to use."""
+    if _cache is not None:
+        _cache.after_fork()
+    if _persistent_cache is not None:
+        _persistent_cache.after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_after_fork)
+
+
+def add_listener(listener):
+    """Call listener.invalidate(url) whenever a namespace is invalidated, while listener is alive."""
+    _listeners.add(listener)
+
+
+def invalidate_namespace(namespace, host='localhost', http_port=DEFAULT_HTTP_PORT):
+    url = get_analyze_url(host, http_port, namespace)
+    if _cache is not None:
+        _cache.invalidate(url)
+    if _persistent_cache is not None:
+        _persistent_cache.invalidate(url)
+    for listener in list(_listeners):
+        listener.invalidate(url)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""Analysis of large texts in chunks.
+
+While enabled, a text longer than max_chars is split at the last paragraph
+break, sentence end or whitespace within each max_chars window, the chunks
+are analyzed in parallel and their tokens are merged back into one result
+with offsets and positions of the whole text. The result is the same as
+analyzing the text at once unless the analysis looks across a chunk
+boundary, e.g. n-gram or shingle filters, char filters spanning the
+boundary, or stop words removed at the end of a chunk, whose position gap
+is lost.
+"""
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import re
+
+from esanpy.core import EsanpyInvalidArgumentError
+
+
+DEFAULT_MAX_CHARS = 10000
+DEFAULT_MAX_WORKERS = 4
+# boundaries in order of preference, searched in the second half of each window
+BOUNDARY_PATTERNS = [re.compile(r'\n[ \t\r\f\v]*\n\s*'),
+                     re.compile(r'[.!?]+[\'")\]]*\s+|[。！？]+[」』）]*\s*'),
+                     re.compile(r'\s+')]
+
+enabled = False
+_max_chars = DEFAULT_MAX_CHARS
+_max_workers = DEFAULT_MAX_WORKERS
+
+
+def enable(max_chars=DEFAULT_MAX_CHARS, max_workers=DEFAULT_MAX_WORKERS):
+    """Analyze texts longer than max_chars in chunks, max_workers at a time."""
+    global enabled, _max_chars, _max_workers
+    if max_chars < 2:
+        raise EsanpyInvalidArgumentError('max_chars should be 2 or more: ' + str(max_chars))
+    _max_chars = max_chars
+    _max_workers = max_workers
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def get_max_workers():
+    return _max_workers
+
+
+def should_split(text):
+    return text is not None and not isinstance(text, list) and len(text) > _max_chars
+
+
+def _find_boundary(text, start, end):
+    for pattern in BOUNDARY_PATTERNS:
+        boundary = None
+        for match in pattern.finditer(text, start + (end - start) // 2, end):
+            boundary = match.end()
+        if boundary is not None:
+            return boundary
+    # no boundary; do not cut a surrogate pair apart
+    if '\ud800' <= text[end - 1] <= '\udbff':
+        return end - 1
+    return end
+
+
+def split_text(text, max_chars=None):
+    """Split text into chunks of at most max_chars characters that join back into text."""
+    if max_chars is None:
+        max_chars = _max_chars
+    chunks = []
+    start = 0
+    while len(text) - start > max_chars:
+        end = _find_boundary(text, start, start + max_chars)
+        chunks.append(text[start:end])
+        start = end
+    chunks.append(text[start:])
+    return chunks
+
+
+def get_chunk_offsets(chunks):
+    """Return the start offset of each chunk in UTF-16 code units, as Elasticsearch counts offsets."""
+    offsets = []
+    offset = 0
+    for chunk in chunks:
+        offsets.append(offset)
+        offset += len(chunk.encode('utf-16-le')) // 2
+    return offsets
+
+
+def _get_token_lists(result):
+    detail = result.get('detail')
+    if detail is None:
+        return [result.get('tokens') or []]
+    token_lists = []
+    for key in ('analyzer', 'tokenizer'):
+        if detail.get(key) is not None:
+            token_lists.append(detail.get(key).get('tokens') or [])
+    for token_filter in detail.get('tokenfilters') or []:
+        token_lists.append(token_filter.get('tokens') or [])
+    return token_lists
+
+
+def merge_analyze_results(results, chunks):
+    """Merge the _analyze results of chunks into the result of their concatenation.
+
+    Offsets are shifted by the length of the preceding chunks, and positions
+    of each chunk continue after the last position of the previous chunk.
+    """
+    offsets = get_chunk_offsets(chunks)
+    merged_lists = None
+    next_positions = None
+    for result, offset in zip(results, offsets):
+        token_lists = _get_token_lists(result)
+        if merged_lists is None:
+            merged_lists = [[] for _ in token_lists]
+            next_positions = [0] * len(token_lists)
+        for i, tokens in enumerate(token_lists):
+            base = next_positions[i]
+            for token in tokens:
+                token = dict(token)
+                token['start_offset'] += offset
+                token['end_offset'] += offset
+                token['position'] += base
+                merged_lists[i].append(token)
+                next_positions[i] = max(next_positions[i], token['position'] + 1)
+
+    detail = results[0].get('detail')
+    if detail is None:
+        return {'tokens': merged_lists[0]}
+    merged_detail = dict((k, v) for k, v in detail.items()
+                         if k not in ('analyzer', 'tokenizer', 'tokenfilters', 'charfilters'))
+    for key in ('analyzer', 'tokenizer'):
+        if detail.get(key) is not None:
+            merged_detail[key] = {'name': detail.get(key).get('name'),
+                                  'tokens': merged_lists.pop(0)}
+    if detail.get('tokenfilters') is not None:
+        merged_detail['tokenfilters'] = [{'name': x.get('name'), 'tokens': merged_lists.pop(0)}
+                                         for x in detail.get('tokenfilters')]
+    if detail.get('charfilters') is not None:
+        char_filters = []
+        for i, char_filter in enumerate(detail.get('charfilters')):
+            filtered_texts = [x.get('detail').get('charfilters')[i].get('filtered_text') for x in results]
+            filtered_texts = [x[0] if isinstance(x, list) else x for x in filtered_texts]
+            char_filters.append({'name': char_filter.get('name'),
+                                 'filtered_text': [''.join(filtered_texts)]})
+        merged_detail['charfilters'] = char_filters
+    return {'detail': merged_detail}
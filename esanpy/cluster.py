@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import itertools
+from logging import getLogger
+import threading
+import time
+
+from esanpy import analyzers
+from esanpy import connection
+from esanpy import elasticsearch
+from esanpy.core import EsanpyInvalidArgumentError, EsanpyServerError
+
+
+try:
+    from urllib.error import HTTPError
+    from urllib.error import URLError
+except ImportError:
+    from urllib2 import HTTPError
+    from urllib2 import URLError
+
+logger = getLogger('esanpy')
+
+ROUND_ROBIN = 'round_robin'
+LEAST_OUTSTANDING = 'least_outstanding'
+DEFAULT_RETRY_INTERVAL = 5.0
+
+
+class Node(object):
+
+    def __init__(self, host, http_port):
+        self.host = host
+        self.http_port = http_port
+        self.outstanding = 0
+        self.healthy = True
+        self.failed_at = None
+
+    def __repr__(self):
+        return 'Node(' + self.host + ':' + str(self.http_port) + ')'
+
+
+class AnalysisCluster(object):
+    """Spreads analyze requests over several Elasticsearch nodes.
+
+    Nodes are picked by round robin or by the least outstanding requests. A
+    node failing with URLError is ejected and the request fails over to the
+    next node; ejected nodes are probed again after retry_interval seconds
+    and re-admitted when they respond.
+    """
+
+    def __init__(self, nodes, strategy=ROUND_ROBIN, retry_interval=DEFAULT_RETRY_INTERVAL):
+        if strategy not in (ROUND_ROBIN, LEAST_OUTSTANDING):
+            raise EsanpyInvalidArgumentError('Unknown strategy: ' + str(strategy))
+        if len(nodes) == 0:
+            raise EsanpyInvalidArgumentError('No nodes are specified.')
+        self.nodes = [Node(host, http_port) for host, http_port in nodes]
+        self.strategy = strategy
+        self.retry_interval = retry_interval
+        self._counter = itertools.count()
+        self._analyses = {}
+        self._lock = threading.Lock()
+        self._health_check_thread = None
+        self._health_check_stop = threading.Event()
+
+    def check_node(self, node):
+        try:
+            connection.request('GET', 'http://' + node.host + ':' + str(node.http_port) + '/')
+            if not node.healthy:
+                self._create_analyses(node)
+            healthy = True
+        except Exception as e:
+            logger.debug(repr(node) + ' is not available: ' + str(e))
+            healthy = False
+        with self._lock:
+            if healthy and not node.healthy:
+                logger.info('Re-admitting ' + repr(node))
+            node.healthy = healthy
+            node.failed_at = None if healthy else time.time()
+        return healthy
+
+    def check_health(self):
+        return [self.check_node(node) for node in self.nodes]
+
+    def start_health_check(self, interval=DEFAULT_RETRY_INTERVAL):
+        def run():
+            while not self._health_check_stop.wait(interval):
+                self.check_health()
+        self._health_check_stop.clear()
+        self._health_check_thread = threading.Thread(target=run, name='esanpy-health-check')
+        self._health_check_thread.daemon = True
+        self._health_check_thread.start()
+
+    def stop_health_check(self):
+        self._health_check_stop.set()
+        if self._health_check_thread is not None:
+            self._health_check_thread.join()
+            self._health_check_thread = None
+
+    def _eject(self, node, e):
+        with self._lock:
+            if node.healthy:
+                logger.warning('Ejecting ' + repr(node) + ': ' + str(e))
+            node.healthy = False
+            node.failed_at = time.time()
+
+    def _select_node(self, excluded):
+        now = time.time()
+        retried = [x for x in self.nodes
+                   if not x.healthy and x not in excluded and now - x.failed_at >= self.retry_interval]
+        for node in retried:
+            self.check_node(node)
+        with self._lock:
+            candidates = [x for x in self.nodes if x.healthy and x not in excluded]
+            if len(candidates) == 0:
+                return None
+            if self.strategy == LEAST_OUTSTANDING:
+                node = min(candidates, key=lambda x: x.outstanding)
+            else:
+                node = candidates[next(self._counter) % len(candidates)]
+            node.outstanding += 1
+            return node
+
+    def call(self, fn, *args, **kwargs):
+        """Call fn with host and http_port of a selected node, failing over on URLError."""
+        excluded = []
+        last_error = None
+        while True:
+            node = self._select_node(excluded)
+            if node is None:
+                if last_error is not None:
+                    raise last_error
+                raise EsanpyServerError('No available nodes: ' + str(self.nodes))
+            try:
+                return fn(*args, host=node.host, http_port=node.http_port, **kwargs)
+            except HTTPError:
+                raise
+            except URLError as e:
+                self._eject(node, e)
+                excluded.append(node)
+                last_error = e
+            finally:
+                with self._lock:
+                    node.outstanding -= 1
+
+    def analyzer(self, text, **kwargs):
+        return self.call(analyzers.analyzer, text, **kwargs)
+
+    def custom_analyzer(self, text, **kwargs):
+        return self.call(analyzers.custom_analyzer, text, **kwargs)
+
+    def analyze_batch(self, texts, **kwargs):
+        return self.call(analyzers.analyze_batch, texts, **kwargs)
+
+    def custom_analyze_batch(self, texts, **kwargs):
+        return self.call(analyzers.custom_analyze_batch, texts, **kwargs)
+
+    def _create_analyses(self, node):
+        for namespace, kwargs in list(self._analyses.items()):
+            elasticsearch.create_analysis(namespace, host=node.host, http_port=node.http_port, **kwargs)
+
+    def create_analysis(self, namespace, **kwargs):
+        """Create a namespace on every healthy node.
+
+        Namespaces are remembered and created on ejected nodes when they are
+        re-admitted, so independent instances stay in sync.
+        """
+        self._analyses[namespace] = kwargs
+        results = [elasticsearch.create_analysis(namespace, host=x.host, http_port=x.http_port, **kwargs)
+                   for x in self.nodes if x.healthy]
+        return any(results)
+
+    def get_analysis(self, namespace):
+        return self.call(elasticsearch.get_analysis, namespace)
+
+    def delete_analysis(self, namespace):
+        self._analyses.pop(namespace, None)
+        for node in self.nodes:
+            if not node.healthy:
+                continue
+            try:
+                elasticsearch.delete_analysis(namespace, host=node.host, http_port=node.http_port)
+            except HTTPError as e:
+                if e.code != 404:
+                    raise
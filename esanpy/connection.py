@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+from collections import deque
+import errno
+from io import BytesIO
+from logging import getLogger
+import os
+import socket
+import threading
+import time
+
+from esanpy import metrics
+
+
+try:
+    from http.client import BadStatusLine
+    from http.client import HTTPConnection
+    from http.client import HTTPException
+    from urllib.error import HTTPError
+    from urllib.error import URLError
+    from urllib.parse import urlsplit
+except ImportError:
+    from httplib import BadStatusLine
+    from httplib import HTTPConnection
+    from httplib import HTTPException
+    from urllib2 import HTTPError
+    from urllib2 import URLError
+    from urlparse import urlsplit
+
+logger = getLogger('esanpy')
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_IDLE_TIMEOUT = 60.0
+DEFAULT_TIMEOUT = socket._GLOBAL_DEFAULT_TIMEOUT
+
+_timer = getattr(time, 'perf_counter', time.time)
+_pools = {}
+_pools_lock = threading.Lock()
+_pool_options = {'maxsize': DEFAULT_POOL_SIZE,
+                 'idle_timeout': DEFAULT_IDLE_TIMEOUT,
+                 'timeout': DEFAULT_TIMEOUT}
+_stale_errnos = (errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE)
+
+
+def _is_stale_connection(e):
+    """Return True if e shows that the server closed an idle connection.
+
+    Such a request was not processed, so it can be sent again even if it is
+    not idempotent. A timeout or a malformed status line is not retried.
+    """
+    if isinstance(e, socket.timeout):
+        return False
+    if isinstance(e, BadStatusLine):
+        # Python 2 reports an empty read as "''"
+        return e.line in ('', "''")
+    return getattr(e, 'errno', None) in _stale_errnos
+
+
+class Response(object):
+    """Fully read HTTP response returned by ConnectionPool.request."""
+
+    def __init__(self, url, code, reason, headers, data):
+        self.url = url
+        self.code = code
+        self.reason = reason
+        self.headers = headers
+        self.data = data
+
+    def read(self):
+        return self.data
+
+    def close(self):
+        pass
+
+
+class ConnectionPool(object):
+    """Thread-safe pool of persistent HTTP/1.1 connections to one host and port.
+
+    Idle connections are reused in LIFO order, closed once they have been idle
+    longer than idle_timeout, and at most maxsize of them are kept. A request on
+    a reused connection that the server has closed is retried on a new one if
+    it failed before any response bytes were received.
+    """
+
+    def __init__(self, host, port, maxsize=DEFAULT_POOL_SIZE,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, timeout=DEFAULT_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle = deque()
+        self._lock = threading.Lock()
+
+    def _new_connection(self):
+        return HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _get_connection(self):
+        expired = []
+        conn = None
+        now = time.time()
+        with self._lock:
+            while len(self._idle) > 0 and now - self._idle[0][1] > self.idle_timeout:
+                expired.append(self._idle.popleft()[0])
+            if len(self._idle) > 0:
+                conn = self._idle.pop()[0]
+        for c in expired:
+            c.close()
+        if conn is None:
+            return self._new_connection(), False
+        return conn, True
+
+    def _release_connection(self, conn):
+        with self._lock:
+            if len(self._idle) < self.maxsize:
+                self._idle.append((conn, time.time()))
+                return
+        conn.close()
+
+    def request(self, method, path, body=None, headers={}):
+        timed = metrics.enabled
+        while True:
+            conn, reused = self._get_connection()
+            if timed:
+                start = _timer()
+                connect_seconds = None
+            response = None
+            try:
+                if timed and not reused:
+                    conn.connect()
+                    connect_seconds = _timer() - start
+                conn.request(method, path, body, headers)
+                response = conn.getresponse()
+                if timed:
+                    ttfb_seconds = _timer() - start
+                data = response.read()
+            except (HTTPException, socket.error) as e:
+                conn.close()
+                if reused and response is None and _is_stale_connection(e):
+                    logger.debug('Reconnecting to ' + self.host + ':' + str(self.port) + ': ' + repr(e))
+                    continue
+                if timed:
+                    metrics.emit('http.request', method=method, path=path, error=type(e).__name__,
+                                 connect_seconds=connect_seconds, total_seconds=_timer() - start)
+                raise URLError(e)
+            if response.will_close:
+                conn.close()
+            else:
+                self._release_connection(conn)
+            if timed:
+                metrics.emit('http.request', method=method, path=path, status=response.status,
+                             sent_bytes=len(body) if body is not None else 0, received_bytes=len(data),
+                             connect_seconds=connect_seconds, ttfb_seconds=ttfb_seconds,
+                             total_seconds=_timer() - start)
+            return response.status, response.reason, response.getheaders(), data
+
+    def clear(self):
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn, _ in idle:
+            conn.close()
+
+
+def get_pool(host, port):
+    key = (host, int(port))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(host, int(port), **_pool_options)
+                _pools[key] = pool
+    return pool
+
+
+def configure(maxsize=None, idle_timeout=None, timeout=None):
+    with _pools_lock:
+        if maxsize is not None:
+            _pool_options['maxsize'] = maxsize
+        if idle_timeout is not None:
+            _pool_options['idle_timeout'] = idle_timeout
+        if timeout is not None:
+            _pool_options['timeout'] = timeout
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.maxsize = _pool_options['maxsize']
+        pool.idle_timeout = _pool_options['idle_timeout']
+        if pool.timeout != _pool_options['timeout']:
+            pool.timeout = _pool_options['timeout']
+            pool.clear()
+
+
+def close_all():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.clear()
+
+
+def reset_after_fork():
+    """Forget the pools inherited by a forked process; their sockets belong to the parent."""
+    global _pools, _pools_lock
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_after_fork)
+
+
+def request(method, url, body=None, headers={'Content-Type': 'application/json'}):
+    parts = urlsplit(url)
+    path = parts.path if len(parts.path) > 0 else '/'
+    if len(parts.query) > 0:
+        path += '?' + parts.query
+    pool = get_pool(parts.hostname, parts.port if parts.port is not None else 80)
+    code, reason, response_headers, data = pool.request(method, path, body, headers)
+    if code >= 400:
+        raise HTTPError(url, code, reason, dict(response_headers), BytesIO(data))
+    return Response(url, code, reason, response_headers, data)
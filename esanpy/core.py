@@ -7,6 +7,9 @@ ESRUNNER_VERSION = "5.6.3.0"
 DEFAULT_HTTP_PORT = 9299
 DEFAULT_TRANSPORT_PORT = 9399
 DEFAULT_CLUSTER_NAME = 'esanpy'
+DEFAULT_HEAP_SIZE = '256m'
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_BATCH_BYTES = 1024 * 1024
 DEFAULT_PLUGINS = ['analysis-icu',
                    'analysis-kuromoji',
                    'analysis-phonetic',
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+from collections import OrderedDict
+import threading
+
+from esanpy import cache
+
+
+DEFAULT_WINDOW = 10000
+
+
+class _Flight(object):
+    """Result of texts being sent by one thread, awaited by the others."""
+
+    __slots__ = ('event', 'result', 'failed')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+class Deduplicator(object):
+    """Sends each distinct text of a batch once and fans the result out.
+
+    Texts are keyed by a hash of the URL, the analysis request and the text.
+    Duplicates within a batch share one request, and the decoded results of
+    the last window distinct texts are kept so that duplicates in later
+    batches are not sent at all (window=0 dedups within each batch only).
+    A text being sent by another thread is awaited instead of sent again.
+    Results of a namespace are dropped when it is invalidated by
+    create_analysis, delete_analysis or a ManagedAnalysis deploy, and results
+    of requests in flight at that time are not kept.
+    The converter runs once per input position on the shared decoded result,
+    so it must not modify it. Pass an instance as the deduplicator of
+    analyze_batch or custom_analyze_batch; it is safe to share between
+    threads, e.g. through AnalysisExecutor.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self._results = OrderedDict()
+        self._flights = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.texts = 0
+        self.sent = 0
+        self.batch_duplicates = 0
+        self.window_duplicates = 0
+        cache.add_listener(self)
+
+    def __len__(self):
+        return len(self._results)
+
+    def analyze(self, url, data, texts, send):
+        """Return the decoded _analyze result of each text.
+
+        send is called with the distinct texts not found in the window and
+        returns their results in the same order. None texts give None.
+        """
+        keys = []
+        pending = OrderedDict()
+        waiting = OrderedDict()
+        found = {}
+        with self._lock:
+            generation = self._generations.get(url, 0)
+            for text in texts:
+                if text is None:
+                    keys.append(None)
+                    continue
+                key = (url, cache.make_key(dict(data, text=text)))
+                keys.append(key)
+                self.texts += 1
+                if key in found or key in pending or key in waiting:
+                    self.batch_duplicates += 1
+                    continue
+                result = self._results.pop(key, None)
+                if result is not None:
+                    self._results[key] = result
+                    found[key] = result
+                    self.window_duplicates += 1
+                    continue
+                flight = self._flights.get(key)
+                if flight is not None:
+                    waiting[key] = (text, flight)
+                    self.window_duplicates += 1
+                    continue
+                pending[key] = text
+                self._flights[key] = _Flight()
+            self.sent += len(pending)
+
+        if len(pending) > 0:
+            self._send(url, pending, send, generation, found)
+        retry = OrderedDict()
+        for key, (text, flight) in waiting.items():
+            flight.event.wait()
+            if flight.failed:
+                retry[key] = text
+            else:
+                found[key] = flight.result
+        if len(retry) > 0:
+            # the thread sending them failed
+            with self._lock:
+                self.sent += len(retry)
+            found.update(zip(retry.keys(), send(list(retry.values()))))
+        return [None if x is None else found[x] for x in keys]
+
+    def _send(self, url, pending, send, generation, found):
+        try:
+            results = send(list(pending.values()))
+        except BaseException:
+            with self._lock:
+                for key in pending:
+                    flight = self._flights.pop(key)
+                    flight.failed = True
+                    flight.event.set()
+            raise
+        found.update(zip(pending.keys(), results))
+        with self._lock:
+            # results of requests sent before an invalidation are not kept
+            store = self.window > 0 and self._generations.get(url, 0) == generation
+            for key in pending:
+                flight = self._flights.pop(key)
+                flight.result = found[key]
+                flight.event.set()
+                if store:
+                    self._results.pop(key, None)
+                    self._results[key] = found[key]
+            while len(self._results) > self.window:
+                self._results.popitem(last=False)
+
+    def stats(self):
+        """Return the counts of texts, texts sent and duplicates, and the ratio of texts not sent."""
+        with self._lock:
+            return {'texts': self.texts,
+                    'sent': self.sent,
+                    'batch_duplicates': self.batch_duplicates,
+                    'window_duplicates': self.window_duplicates,
+                    'ratio': 1 - self.sent / self.texts if self.texts > 0 else 0.0}
+
+    def invalidate(self, url):
+        with self._lock:
+            self._generations[url] = self._generations.get(url, 0) + 1
+            for key in [x for x in self._results if x[0] == url]:
+                del self._results[key]
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def reset_stats(self):
+        with self._lock:
+            self.texts = 0
+            self.sent = 0
+            self.batch_duplicates = 0
+            self.window_duplicates = 0
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+from io import BytesIO
+import json
+from logging import getLogger
+import re
+import threading
+
+from esanpy import analyzers
+from esanpy import cache
+from esanpy import chunking
+from esanpy import connection
+from esanpy import elasticsearch
+from esanpy import local
+from esanpy import metrics
+from esanpy import serializer
+from esanpy import singleflight
+from esanpy.core import DEFAULT_HTTP_PORT, EsanpyInvalidArgumentError
+
+
+try:
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import HTTPError
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+logger = getLogger('esanpy')
+
+# Names usable without a definition in Elasticsearch 5.6 with DEFAULT_PLUGINS.
+# They are sets so that names of other plugins can be added.
+BUILTIN_ANALYZERS = set([
+    'standard', 'simple', 'whitespace', 'stop', 'keyword', 'pattern', 'fingerprint', 'snowball',
+    'standard_html_strip', 'arabic', 'armenian', 'basque', 'brazilian', 'bulgarian', 'catalan',
+    'chinese', 'cjk', 'czech', 'danish', 'dutch', 'english', 'finnish', 'french', 'galician',
+    'german', 'greek', 'hindi', 'hungarian', 'indonesian', 'irish', 'italian', 'latvian',
+    'lithuanian', 'norwegian', 'persian', 'portuguese', 'romanian', 'russian', 'sorani', 'spanish',
+    'swedish', 'turkish', 'thai',
+    'icu_analyzer', 'kuromoji', 'smartcn', 'polish', 'ukrainian'])
+BUILTIN_TOKENIZERS = set([
+    'standard', 'classic', 'uax_url_email', 'letter', 'lowercase', 'whitespace', 'keyword',
+    'pattern', 'path_hierarchy', 'PathHierarchy', 'ngram', 'nGram', 'edge_ngram', 'edgeNGram', 'thai',
+    'icu_tokenizer', 'kuromoji_tokenizer', 'smartcn_tokenizer', 'smartcn_sentence'])
+BUILTIN_TOKEN_FILTERS = set([
+    'standard', 'lowercase', 'uppercase', 'asciifolding', 'length', 'limit', 'stop', 'trim',
+    'truncate', 'unique', 'reverse', 'elision', 'porter_stem', 'kstem', 'stemmer', 'snowball',
+    'word_delimiter', 'word_delimiter_graph', 'shingle', 'ngram', 'nGram', 'edge_ngram', 'edgeNGram',
+    'apostrophe', 'classic', 'decimal_digit', 'delimited_payload_filter', 'type_as_payload',
+    'keyword_repeat', 'remove_duplicates', 'flatten_graph', 'fingerprint', 'min_hash',
+    'arabic_normalization', 'arabic_stem', 'brazilian_stem', 'czech_stem', 'dutch_stem',
+    'french_stem', 'german_stem', 'german_normalization', 'russian_stem', 'cjk_bigram', 'cjk_width',
+    'hindi_normalization', 'indic_normalization', 'persian_normalization', 'scandinavian_folding',
+    'scandinavian_normalization', 'serbian_normalization', 'sorani_normalization',
+    'icu_normalizer', 'icu_folding', 'icu_collation', 'icu_transform',
+    'kuromoji_baseform', 'kuromoji_part_of_speech', 'kuromoji_readingform', 'kuromoji_stemmer',
+    'kuromoji_number', 'ja_stop', 'phonetic', 'smartcn_word', 'polish_stem'])
+BUILTIN_CHAR_FILTERS = set(['html_strip', 'icu_normalizer', 'kuromoji_iteration_mark'])
+
+INVALID_NAMESPACE_PATTERN = re.compile(r'[\\/*?"<>| ,#:A-Z]')
+HEADERS = {'Content-Type': 'application/json'}
+
+
+def _get_names(value):
+    # Elasticsearch also accepts a comma separated string for lists of names
+    if isinstance(value, (list, tuple)):
+        return value
+    return [x.strip() for x in value.split(',')]
+
+
+def _check_reference(kind, name, defined, builtins, errors, context):
+    if isinstance(name, dict):
+        # anonymous definitions are only allowed in _analyze requests
+        if not isinstance(name.get('type'), string_types):
+            errors.append(context + ': ' + kind + ' definition has no type')
+    elif name not in defined and name not in builtins:
+        errors.append(context + ': unknown ' + kind + ' ' + json.dumps(name))
+
+
+def validate_namespace(namespace):
+    if not isinstance(namespace, string_types) or len(namespace) == 0 or namespace in ('.', '..') or \
+            namespace[0] in '_-+' or INVALID_NAMESPACE_PATTERN.search(namespace) is not None or \
+            len(namespace.encode('utf-8')) > 255:
+        raise EsanpyInvalidArgumentError('Invalid namespace: ' + json.dumps(namespace))
+
+
+def validate_analysis(namespace, analyzer={}, tokenizer={}, token_filter={}, char_filter={}):
+    """Check an analysis definition without Elasticsearch.
+
+    Checks the namespace name, that every component has a type, and that
+    custom analyzers only refer to tokenizers, token filters and char filters
+    defined in the analysis or built in. All problems found are reported in
+    one EsanpyInvalidArgumentError.
+    """
+    validate_namespace(namespace)
+    errors = []
+    components = [('analyzer', analyzer), ('tokenizer', tokenizer),
+                  ('filter', token_filter), ('char_filter', char_filter)]
+    for kind, definitions in components:
+        if not isinstance(definitions, dict):
+            errors.append(kind + ' must be a dict of name to definition')
+            continue
+        for name, definition in definitions.items():
+            if not isinstance(definition, dict):
+                errors.append(kind + ' ' + json.dumps(name) + ': definition must be a dict')
+            elif kind != 'analyzer' and not isinstance(definition.get('type'), string_types):
+                errors.append(kind + ' ' + json.dumps(name) + ': type is required')
+    if len(errors) > 0:
+        raise EsanpyInvalidArgumentError('Invalid analysis for ' + namespace + ': ' + '; '.join(errors))
+
+    for name, definition in analyzer.items():
+        context = 'analyzer ' + json.dumps(name)
+        analyzer_type = definition.get('type', 'custom' if 'tokenizer' in definition else None)
+        if analyzer_type != 'custom':
+            if analyzer_type not in BUILTIN_ANALYZERS:
+                errors.append(context + ': unknown type ' + json.dumps(analyzer_type))
+            continue
+        if 'tokenizer' not in definition:
+            errors.append(context + ': tokenizer is required')
+        else:
+            _check_reference('tokenizer', definition.get('tokenizer'), tokenizer,
+                             BUILTIN_TOKENIZERS, errors, context)
+        for x in _get_names(definition.get('filter', [])):
+            _check_reference('filter', x, token_filter, BUILTIN_TOKEN_FILTERS, errors, context)
+        for x in _get_names(definition.get('char_filter', [])):
+            _check_reference('char_filter', x, char_filter, BUILTIN_CHAR_FILTERS, errors, context)
+    if len(errors) > 0:
+        raise EsanpyInvalidArgumentError('Invalid analysis for ' + namespace + ': ' + '; '.join(errors))
+
+
+class AnalyzeTemplate(object):
+    """Precompiled _analyze request for one analyzer chain.
+
+    The URL and the JSON body up to the text are encoded once, so a call
+    only encodes the text and splices it in. While the token cache, local
+    analysis, request coalescing or metrics are enabled, or the text is long
+    enough to be chunked, calls go through send_analyze_request instead so
+    that they behave as analyzer does.
+    """
+
+    def __init__(self, data, host='localhost', http_port=DEFAULT_HTTP_PORT, namespace=None):
+        self.data = data
+        self.host = host
+        self.http_port = int(http_port)
+        self.url = cache.get_analyze_url(host, http_port, namespace)
+        self.path = '/_analyze' if namespace is None else '/' + namespace + '/_analyze'
+        head = json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        self.prefix = (head[:-1] + b',' if len(data) > 0 else b'{') + b'"text":'
+        self.default_converter = (lambda x: x) if 'explain' in data else analyzers.default_converter
+
+    def analyze(self, text, converter=None):
+        if text is None:
+            return []
+        if converter is None:
+            converter = self.default_converter
+        if local.enabled or metrics.enabled or singleflight.enabled or cache.get_cache() is not None or \
+                cache.get_persistent_cache() is not None or (chunking.enabled and chunking.should_split(text)):
+            return analyzers.send_analyze_request(self.url, dict(self.data, text=text), converter)
+        body = self.prefix + serializer.dumps(text) + b'}'
+        code, reason, headers, data = connection.get_pool(self.host, self.http_port).request(
+            'POST', self.path, body, HEADERS)
+        if code >= 400:
+            raise HTTPError(self.url, code, reason, dict(headers), BytesIO(data))
+        if converter is analyzers.default_converter:
+            return serializer.loads_tokens(data)
+        return converter(serializer.loads(data))
+
+
+class AnalyzerRegistry(object):
+    """Named analysis definitions of one Elasticsearch node.
+
+    Definitions are validated locally before they are sent. The analysis of
+    each namespace is fetched once and kept in sync by register and
+    unregister, so lookups and compile do not issue GET requests; call
+    refresh after changing namespaces outside of the registry. compile
+    returns a cached AnalyzeTemplate per analyzer chain.
+    """
+
+    def __init__(self, host='localhost', http_port=DEFAULT_HTTP_PORT):
+        self.host = host
+        self.http_port = http_port
+        self._analyses = {}
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def validate(self, namespace, analyzer={}, tokenizer={}, token_filter={}, char_filter={}):
+        validate_analysis(namespace, analyzer=analyzer, tokenizer=tokenizer,
+                          token_filter=token_filter, char_filter=char_filter)
+
+    def register(self, namespace, analyzer={}, tokenizer={}, token_filter={}, char_filter={}):
+        """Validate and create the analysis; False if the namespace already exists."""
+        self.validate(namespace, analyzer=analyzer, tokenizer=tokenizer,
+                      token_filter=token_filter, char_filter=char_filter)
+        try:
+            return elasticsearch.create_analysis(namespace, analyzer=analyzer, tokenizer=tokenizer,
+                                                 token_filter=token_filter, char_filter=char_filter,
+                                                 host=self.host, http_port=self.http_port)
+        finally:
+            self.refresh(namespace)
+
+    def unregister(self, namespace):
+        try:
+            elasticsearch.delete_analysis(namespace, host=self.host, http_port=self.http_port)
+        finally:
+            self._update(namespace, None)
+
+    def apply(self, spec):
+        """Apply spec with apply_analyses and sync with one _settings request."""
+        try:
+            return elasticsearch.apply_analyses(spec, host=self.host, http_port=self.http_port)
+        finally:
+            analyses = elasticsearch.get_analyses(host=self.host, http_port=self.http_port)
+            with self._lock:
+                namespaces = set(spec) | set(self._analyses)
+            for namespace in namespaces:
+                self._update(namespace, analyses.get(namespace))
+
+    def get_analysis(self, namespace):
+        """Return the analysis of namespace as get_analysis does, fetching it only once."""
+        with self._lock:
+            if namespace in self._analyses:
+                return self._analyses.get(namespace)
+        analysis = elasticsearch.get_analysis(namespace, host=self.host, http_port=self.http_port)
+        with self._lock:
+            return self._analyses.setdefault(namespace, analysis)
+
+    def get_analyzer_names(self, namespace):
+        analysis = self.get_analysis(namespace)
+        if analysis is None:
+            return []
+        return sorted(analysis.get('analyzer', {}))
+
+    def refresh(self, namespace=None):
+        """Fetch the analysis of namespace, or of all known namespaces, again."""
+        with self._lock:
+            namespaces = list(self._analyses) if namespace is None else [namespace]
+        for x in namespaces:
+            self._update(x, elasticsearch.get_analysis(x, host=self.host, http_port=self.http_port))
+
+    def _update(self, namespace, analysis):
+        with self._lock:
+            self._analyses[namespace] = analysis
+            for key in [x for x in self._templates if x[0] == namespace]:
+                del self._templates[key]
+
+    def _get_namespace_analysis(self, namespace):
+        analysis = self.get_analysis(namespace)
+        if analysis is None:
+            raise EsanpyInvalidArgumentError('Namespace does not exist: ' + namespace)
+        return analysis
+
+    def _get_template(self, namespace, key, data):
+        with self._lock:
+            template = self._templates.get((namespace, key))
+            if template is None:
+                template = AnalyzeTemplate(data, host=self.host, http_port=self.http_port, namespace=namespace)
+                self._templates[(namespace, key)] = template
+            return template
+
+    def compile(self, analyzer='standard', namespace=None, attributes=None):
+        """Return the AnalyzeTemplate for analyzer, checking that it exists."""
+        if analyzer not in BUILTIN_ANALYZERS:
+            if namespace is None or analyzer not in self._get_namespace_analysis(namespace).get('analyzer', {}):
+                raise EsanpyInvalidArgumentError('Unknown analyzer: ' + str(analyzer) +
+                                                 ('' if namespace is None else ' in ' + namespace))
+        elif namespace is not None:
+            self._get_namespace_analysis(namespace)
+        data = {'analyzer': analyzer}
+        if attributes is not None:
+            data.update({'explain': True, 'attributes': attributes})
+        return self._get_template(namespace, json.dumps(data, sort_keys=True), data)
+
+    def compile_custom(self, tokenizer='keyword', token_filter=[], char_filter=[], namespace=None,
+                       attributes=None):
+        """Return the AnalyzeTemplate for a custom chain, checking its references."""
+        analysis = {} if namespace is None else self._get_namespace_analysis(namespace)
+        errors = []
+        _check_reference('tokenizer', tokenizer, analysis.get('tokenizer', {}),
+                         BUILTIN_TOKENIZERS, errors, 'custom analyzer')
+        for x in token_filter:
+            _check_reference('filter', x, analysis.get('filter', {}),
+                             BUILTIN_TOKEN_FILTERS, errors, 'custom analyzer')
+        for x in char_filter:
+            _check_reference('char_filter', x, analysis.get('char_filter', {}),
+                             BUILTIN_CHAR_FILTERS, errors, 'custom analyzer')
+        if len(errors) > 0:
+            raise EsanpyInvalidArgumentError('; '.join(errors))
+        data = {'tokenizer': tokenizer, 'filter': token_filter, 'char_filter': char_filter}
+        if attributes is not None:
+            data.update({'explain': True, 'attributes': attributes})
+        return self._get_template(namespace, json.dumps(data, sort_keys=True), data)
+
+    def analyzer(self, text, analyzer='standard', namespace=None, attributes=None, converter=None):
+        return self.compile(analyzer=analyzer, namespace=namespace,
+                            attributes=attributes).analyze(text, converter=converter)
+
+    def custom_analyzer(self, text, namespace=None, attributes=None,
+                        tokenizer='keyword', token_filter=[], char_filter=[], converter=None):
+        return self.compile_custom(tokenizer=tokenizer, token_filter=token_filter, char_filter=char_filter,
+                                   namespace=namespace, attributes=attributes).analyze(text, converter=converter)
@@ -1,17 +1,26 @@
 # -*- coding: utf-8 -*-
 from __future__ import division, print_function, absolute_import, unicode_literals
 
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import closing
 import glob
+import hashlib
 import json
 from logging import getLogger
-import multiprocessing
 import os
+import shutil
 import signal
+import socket
 import subprocess
+import sys
 import time
-import zipfile
 
+from esanpy import artifacts
+from esanpy import cache
+from esanpy import connection
+from esanpy import instances
+from esanpy import jvm
+from esanpy import metrics
 from esanpy.core import EsanpySetupError, EsanpyInvalidArgumentError, \
     EsanpyServerError, EsanpyStartupError
 from esanpy.core import IVY_VERSION, ESRUNNER_VERSION, DEFAULT_CLUSTER_NAME, \
@@ -19,13 +28,9 @@ from esanpy.core import IVY_VERSION, ESRUNNER_VERSION, DEFAULT_CLUSTER_NAME, \
 
 
 try:
-    from urllib.request import Request
-    from urllib.request import urlretrieve
     from urllib.request import urlopen
     from urllib.error import HTTPError
 except ImportError:
-    from urllib2 import Request
-    from urllib import urlretrieve
     from urllib2 import urlopen
     from urllib2 import HTTPError
 
@@ -36,6 +41,17 @@ except ImportError:
 
 logger = getLogger('esanpy')
 
+DEFAULT_STARTUP_TIMEOUT = 60
+STARTUP_CHECK_MIN_INTERVAL = 0.01
+STARTUP_CHECK_MAX_INTERVAL = 0.5
+DEFAULT_DOWNLOAD_WORKERS = 4
+DEFAULT_APPLY_WORKERS = 8
+DEFAULT_IDLE_TIMEOUT = 600
+STANDBY_CHECK_INTERVAL = 1.0
+
+_timer = getattr(time, 'perf_counter', time.time)
+_startup_timings = {}
+
 
 def get_esanalyzer_home():
     return os.path.expanduser('~/.esanpy')
@@ -61,7 +77,18 @@ def get_ivy_url():
     return "http://search.maven.org/remotecontent?filepath=org/apache/ivy/ivy/" + IVY_VERSION + "/ivy-" + IVY_VERSION + ".jar"
 
 
-def setup_esanalyzer(esrunner_version=ESRUNNER_VERSION, http_port=DEFAULT_HTTP_PORT, plugin_names=[]):
+def get_setup_manifest(http_port, esrunner_version, plugin_names):
+    plugins_hash = hashlib.sha1(json.dumps(sorted(plugin_names)).encode('utf-8')).hexdigest()[0:12]
+    return get_esrunner_home(esrunner_version) + '/.setup_' + str(http_port) + '_' + plugins_hash + '.json'
+
+
+def setup_esanalyzer(esrunner_version=ESRUNNER_VERSION, http_port=DEFAULT_HTTP_PORT, plugin_names=[],
+                     mirror=None, require_checksum=False, java='java'):
+    manifest_file = get_setup_manifest(http_port, esrunner_version, plugin_names)
+    if os.path.exists(manifest_file):
+        logger.debug('Setup is completed: ' + manifest_file)
+        return
+
     esanalyzer_home = get_esanalyzer_home()
     if not os.path.exists(esanalyzer_home):
         os.mkdir(esanalyzer_home)
@@ -69,71 +96,101 @@ def setup_esanalyzer(esrunner_version=ESRUNNER_VERSION, http_port=DEFAULT_HTTP_P
     # download ivy
     ivy_file = get_ivy_file()
     if not os.path.exists(ivy_file):
-        urlretrieve(get_ivy_url(), ivy_file)
+        artifacts.download(artifacts.resolve_url(get_ivy_url(), mirror), ivy_file,
+                           require_checksum=require_checksum)
 
     esrunner_home = get_esrunner_home(esrunner_version)
     if not os.path.exists(esrunner_home):
         os.mkdir(esrunner_home)
 
-    if not os.path.exists(esrunner_home + "/lib/elasticsearch-cluster-runner-" + ESRUNNER_VERSION + ".jar"):
-        p = subprocess.Popen(["java",
+    if not os.path.exists(esrunner_home + "/lib/elasticsearch-cluster-runner-" + esrunner_version + ".jar"):
+        # retrieve into a staging directory so that an interrupted setup never leaves a partial lib
+        staging_dir = "lib.tmp-" + str(os.getpid())
+        p = subprocess.Popen([java,
                               "-jar",
                               "../ivy-" + IVY_VERSION + ".jar",
                               "-dependency",
                               "org.codelibs",
                               "elasticsearch-cluster-runner",
-                              ESRUNNER_VERSION,
+                              esrunner_version,
                               "-retrieve",
-                              "lib/[artifact]-[revision](-[classifier]).[ext]"],
+                              staging_dir + "/[artifact]-[revision](-[classifier]).[ext]"],
                              stdout=DEVNULL if logger.level != 10 else None,
                              stderr=DEVNULL if logger.level != 10 else None,
                              cwd=esrunner_home)
         p.wait()
         if p.returncode != 0:
+            shutil.rmtree(esrunner_home + "/" + staging_dir, ignore_errors=True)
             raise EsanpySetupError('Failed to download jar files. exit code: ' + str(p.returncode))
 
         # workaround
         removed_files = []
-        removed_files.extend(glob.glob(esrunner_home + "/lib/asm-debug-all*"))
-        removed_files.extend(glob.glob(esrunner_home + "/lib/commons-codec*"))
+        removed_files.extend(glob.glob(esrunner_home + "/" + staging_dir + "/asm-debug-all*"))
+        removed_files.extend(glob.glob(esrunner_home + "/" + staging_dir + "/commons-codec*"))
         for removed_file in removed_files:
             os.remove(removed_file)
+        if os.path.exists(esrunner_home + "/lib"):
+            shutil.rmtree(esrunner_home + "/lib")
+        os.rename(esrunner_home + "/" + staging_dir, esrunner_home + "/lib")
 
-    for plugin_name in plugin_names:
-        install_plugin(plugin_name, http_port, esrunner_version)
+    install_plugins(plugin_names, http_port, esrunner_version,
+                    mirror=mirror, require_checksum=require_checksum)
 
+    with open(manifest_file, 'wt') as f:
+        json.dump({'esrunner_version': esrunner_version,
+                   'http_port': http_port,
+                   'plugins': sorted(plugin_names)}, f)
 
-def install_plugin(plugin_name, http_port=DEFAULT_HTTP_PORT, esrunner_version=ESRUNNER_VERSION):
-    plugin_home = get_plugin_home(http_port, esrunner_version)
-    if not os.path.exists(plugin_home):
-        os.makedirs(plugin_home)
 
-    if plugin_name.startswith("http:") or plugin_name.startswith("https:"):
-        url = plugin_name
+def get_artifact_home():
+    return get_esanalyzer_home() + "/artifacts"
+
+
+def get_plugin_url(plugin_name, esrunner_version=ESRUNNER_VERSION):
+    if plugin_name.startswith("http:") or plugin_name.startswith("https:") or plugin_name.startswith("file:"):
+        return plugin_name
     elif ':' in plugin_name:
         values = plugin_name.split(':')
         if len(values) != 3:
             raise EsanpyInvalidArgumentError("Unknown plugin name: " + plugin_name)
-        url = "https://repo1.maven.org/maven2/{}/{}/{}/{}-{}.zip".format(values[0].replace('.', '/'),
-                                                                         values[1],
-                                                                         values[2],
-                                                                         values[1],
-                                                                         values[2])
-    else:
-        url_template = "https://artifacts.elastic.co/downloads/elasticsearch-plugins/{}/{}-{}.zip"
-        url = url_template.format(plugin_name,
-                                  plugin_name,
-                                  ".".join(esrunner_version.split('.')[0:3]))
+        return "https://repo1.maven.org/maven2/{}/{}/{}/{}-{}.zip".format(values[0].replace('.', '/'),
+                                                                          values[1],
+                                                                          values[2],
+                                                                          values[1],
+                                                                          values[2])
+    url_template = "https://artifacts.elastic.co/downloads/elasticsearch-plugins/{}/{}-{}.zip"
+    return url_template.format(plugin_name,
+                               plugin_name,
+                               ".".join(esrunner_version.split('.')[0:3]))
+
+
+def install_plugin(plugin_name, http_port=DEFAULT_HTTP_PORT, esrunner_version=ESRUNNER_VERSION,
+                   mirror=None, require_checksum=False):
+    plugin_home = get_plugin_home(http_port, esrunner_version)
+    if not os.path.exists(plugin_home):
+        os.makedirs(plugin_home)
 
+    url = get_plugin_url(plugin_name, esrunner_version)
     plugin_dir = plugin_home + "/" + url.split('/')[-1][0:-4]
     if not os.path.exists(plugin_dir):
-        logger.debug("Downloading " + url)
-        plugin_file, _ = urlretrieve(url)
-        esrunner_home = get_esrunner_home(esrunner_version)
-        with zipfile.ZipFile(plugin_file, 'r') as zf:
-            zf.extractall(path=esrunner_home)
-        logger.debug("Renaming to " + plugin_dir)
-        os.rename(esrunner_home + "/elasticsearch", plugin_dir)
+        artifact_home = get_artifact_home()
+        zip_file, sha1 = artifacts.fetch_artifact(url, artifact_home, mirror=mirror,
+                                                  require_checksum=require_checksum)
+        extracted_dir = artifacts.extract_artifact(zip_file, sha1, artifact_home)
+        logger.debug("Installing " + extracted_dir + " to " + plugin_dir)
+        artifacts.install_tree(extracted_dir + "/elasticsearch", plugin_dir)
+
+
+def install_plugins(plugin_names, http_port=DEFAULT_HTTP_PORT, esrunner_version=ESRUNNER_VERSION,
+                    mirror=None, require_checksum=False, max_workers=DEFAULT_DOWNLOAD_WORKERS):
+    if len(plugin_names) == 0:
+        return
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(plugin_names))) as executor:
+        futures = [executor.submit(install_plugin, x, http_port, esrunner_version,
+                                   mirror=mirror, require_checksum=require_checksum)
+                   for x in plugin_names]
+        for future in futures:
+            future.result()
 
 
 def get_esrunner_classpath(esrunner_version):
@@ -145,42 +202,91 @@ def get_esrunner_classpath(esrunner_version):
     return ':'.join(jar_files)
 
 
+def get_startup_timings():
+    """Return seconds spent in each phase of the last start_server call."""
+    return dict(_startup_timings)
+
+
 def start_server(host='localhost', http_port=DEFAULT_HTTP_PORT,
                  transport_port=DEFAULT_TRANSPORT_PORT,
                  cluster_name=DEFAULT_CLUSTER_NAME,
                  plugin_names=DEFAULT_PLUGINS,
-                 esrunner_version=ESRUNNER_VERSION):
+                 esrunner_version=ESRUNNER_VERSION,
+                 num_of_node=1,
+                 heap_size=None,
+                 startup_timeout=DEFAULT_STARTUP_TIMEOUT,
+                 mirror=None,
+                 require_checksum=False,
+                 attach=True,
+                 jvm_profile=None):
+    """Start Elasticsearch, or attach to the instance already running on http_port.
+
+    Startup is serialized by a lock in the instance registry, so concurrent
+    processes start one instance and attach to it. With attach, the calling
+    process is counted as a client until stop_server. jvm_profile is a
+    preset name in jvm.PROFILES or a dict (see jvm.get_profile), and
+    heap_size overrides its maximum heap size.
+    """
+    profile = jvm.get_profile(jvm_profile, heap_max=heap_size)
+    with instances.lock(http_port):
+        with metrics.trace('server.start', http_port=http_port) as values:
+            try:
+                _start_server(host, http_port, transport_port, cluster_name, plugin_names, esrunner_version,
+                              num_of_node, profile, startup_timeout, mirror, require_checksum)
+            finally:
+                values.update((x + '_seconds', y) for x, y in _startup_timings.items() if x != 'total')
+        if attach:
+            instances.attach(http_port)
+
+
+def _start_server(host, http_port, transport_port, cluster_name, plugin_names, esrunner_version,
+                  num_of_node, profile, startup_timeout, mirror, require_checksum):
+    start_time = _timer()
+    timings = {}
+    _startup_timings.clear()
+    jvm_settings = jvm.get_effective_settings(profile)
     try:
         with closing(urlopen('http://' + host + ':' + str(http_port))) as response:
             if logger.isEnabledFor(10):
                 logger.debug(json.loads(response.read().decode('utf-8')))
+            _startup_timings.update({'probe': _timer() - start_time, 'total': _timer() - start_time})
+            instance = instances.get_instance(http_port)
+            if instance is not None and instance.get('jvm') not in (None, jvm_settings):
+                logger.warning('Elasticsearch on port ' + str(http_port) + ' runs with JVM profile ' +
+                               str(instance.get('jvm').get('profile')) + '. Stop it to apply ' +
+                               str(profile.get('name')) + '.')
             return
     except Exception as e:
         logger.debug('Elasticsearch is not working: ' + str(e))
+    timings['probe'] = _timer() - start_time
 
-    setup_esanalyzer(esrunner_version, http_port, plugin_names)
-    stop_server(host=host, http_port=http_port, esrunner_version=esrunner_version)
+    phase_time = _timer()
+    setup_esanalyzer(esrunner_version, http_port, plugin_names,
+                     mirror=mirror, require_checksum=require_checksum, java=jvm_settings.get('java'))
+    _stop_server(http_port, esrunner_version)
+    timings['setup'] = _timer() - phase_time
 
+    phase_time = _timer()
     esrunner_home = get_esrunner_home(esrunner_version)
     es_home = get_es_home(http_port, esrunner_version)
     data_path = es_home + "/data/" + os.uname()[1]
-    esrunner_args = ['java',
-                     '-Xmx256m',
-                     '-cp',
-                     get_esrunner_classpath(esrunner_version),
-                     "org.codelibs.elasticsearch.runner.ElasticsearchClusterRunner",
-                     '-basePath',
-                     es_home,
-                     '-dataPath',
-                     data_path,
-                     '-numOfNode',
-                     '1',
-                     '-clusterName',
-                     cluster_name,
-                     '-baseHttpPort',
-                     str(http_port - 1),
-                     '-baseTransportPort',
-                     str(transport_port - 1)]
+    jvm.write_node_settings(es_home, num_of_node, jvm_settings.get('node_settings'))
+    esrunner_args = [jvm_settings.get('java')] + jvm_settings.get('jvm_args')
+    esrunner_args.extend(['-cp',
+                          get_esrunner_classpath(esrunner_version),
+                          "org.codelibs.elasticsearch.runner.ElasticsearchClusterRunner",
+                          '-basePath',
+                          es_home,
+                          '-dataPath',
+                          data_path,
+                          '-numOfNode',
+                          str(num_of_node),
+                          '-clusterName',
+                          cluster_name,
+                          '-baseHttpPort',
+                          str(http_port - 1),
+                          '-baseTransportPort',
+                          str(transport_port - 1)])
 
     logger.debug(' '.join(esrunner_args))
     p = subprocess.Popen(esrunner_args,
@@ -188,64 +294,262 @@ def start_server(host='localhost', http_port=DEFAULT_HTTP_PORT,
                          stderr=DEVNULL if logger.level != 10 else None,
                          cwd=esrunner_home)
 
-    pid_file = esrunner_home + "/" + str(http_port) + ".pid"
-    with open(pid_file, 'wt') as f:
-        f.write(str(p.pid))
+    instances.register(http_port, p.pid, host=host, esrunner_version=esrunner_version,
+                       num_of_node=num_of_node, jvm=jvm_settings)
+    timings['spawn'] = _timer() - phase_time
+
+    deadline = time.time() + startup_timeout
+    phase_time = _timer()
+    if wait_for_port(host, http_port, deadline, process=p):
+        timings['port_open'] = _timer() - phase_time
+        phase_time = _timer()
+        if wait_for_cluster(host, http_port, num_of_node, deadline, process=p):
+            timings['cluster_yellow'] = _timer() - phase_time
+            timings['total'] = _timer() - start_time
+            _startup_timings.update(timings)
+            logger.info('Started Elasticsearch in {:.2f}s ({})'.format(
+                timings['total'],
+                ', '.join('{} {:.3f}s'.format(x, timings[x])
+                          for x in ('probe', 'setup', 'spawn', 'port_open', 'cluster_yellow'))))
+            return
 
-    for i in range(30):
-        time.sleep(1)
-        logger.debug('Checking Elasticsearch status: ' + str(i))
+    timings['total'] = _timer() - start_time
+    _startup_timings.update(timings)
+    if p.poll() is None:
+        p.kill()
+        p.wait()
+    instances.remove_instance(http_port)
+    raise EsanpyStartupError('Failed to start Elasticsearch. See ' + es_home + '/logs/node_1/esanpy.log')
+
+
+def _backoff_intervals():
+    interval = STARTUP_CHECK_MIN_INTERVAL
+    while True:
+        yield interval
+        interval = min(interval * 2, STARTUP_CHECK_MAX_INTERVAL)
+
+
+def _is_alive(process):
+    if process is not None and process.poll() is not None:
+        logger.debug('Elasticsearch exited with code ' + str(process.returncode))
+        return False
+    return True
+
+
+def wait_for_port(host, http_port, deadline, process=None):
+    for interval in _backoff_intervals():
+        if not _is_alive(process):
+            return False
+        try:
+            sock = socket.create_connection((host, http_port), timeout=STARTUP_CHECK_MAX_INTERVAL)
+            sock.close()
+            return True
+        except socket.error as e:
+            logger.debug('HTTP port is not open: ' + str(e))
+        if time.time() + interval > deadline:
+            return False
+        time.sleep(interval)
+
+
+def wait_for_cluster(host, http_port, num_of_node, deadline, process=None):
+    for interval in _backoff_intervals():
+        if not _is_alive(process):
+            return False
+        timeout = max(int(deadline - time.time()), 1)
         try:
             with closing(urlopen('http://' + host + ':' + str(http_port) +
-                         '/_cluster/health?wait_for_status=yellow&timeout=1m')) as response:
+                         '/_cluster/health?wait_for_status=yellow&wait_for_nodes=' + str(num_of_node) +
+                         '&timeout=' + str(timeout) + 's', timeout=timeout + 1)) as response:
                 if logger.isEnabledFor(10):
                     logger.debug(json.loads(response.read().decode('utf-8')))
-                return
+                return True
         except Exception as e:
             logger.debug('Elasticsearch is not available: ' + str(e))
+        if time.time() + interval > deadline:
+            return False
+        time.sleep(interval)
 
-    if os.path.exists(pid_file):
-        os.remove(pid_file)
-    raise EsanpyStartupError('Failed to start Elasticsearch. See ' + es_home + '/logs/node_1/esanpy.log')
+
+def start_servers(num_of_server, host='localhost', http_port=DEFAULT_HTTP_PORT,
+                  transport_port=DEFAULT_TRANSPORT_PORT, **kwargs):
+    """Start independent instances on consecutive HTTP and transport ports.
+
+    Each instance runs in its own JVM with its own es_home. Returns the list
+    of (host, http_port) for AnalysisCluster.
+    """
+    nodes = []
+    for i in range(num_of_server):
+        start_server(host=host, http_port=http_port + i, transport_port=transport_port + i, **kwargs)
+        nodes.append((host, http_port + i))
+    return nodes
+
+
+def stop_servers(num_of_server, host='localhost', http_port=DEFAULT_HTTP_PORT,
+                 esrunner_version=ESRUNNER_VERSION):
+    for i in range(num_of_server):
+        stop_server(host=host, http_port=http_port + i, esrunner_version=esrunner_version)
 
 
 def stop_server(host='localhost', http_port=DEFAULT_HTTP_PORT,
-                esrunner_version=ESRUNNER_VERSION):
+                esrunner_version=ESRUNNER_VERSION, force=False,
+                stop_timeout=instances.DEFAULT_STOP_TIMEOUT):
+    """Detach the calling process and stop Elasticsearch when no client is left.
+
+    The instance keeps running while other processes are attached, or while
+    a standby daemon manages it. With force, it is stopped regardless. The
+    process gets SIGTERM and is killed only if it does not exit in
+    stop_timeout seconds. Returns True if the instance was stopped.
+    """
+    with instances.lock(http_port):
+        instance = instances.get_instance(http_port)
+        if instance is not None and not force:
+            num_of_client = instances.detach(http_port)
+            if num_of_client > 0:
+                logger.info('Elasticsearch is still used by ' + str(num_of_client) + ' process(es).')
+                return False
+            if instances.is_alive(instance.get('daemon_pid')):
+                logger.debug('Elasticsearch is left to standby daemon ' + str(instance.get('daemon_pid')))
+                return False
+        return _stop_server(http_port, esrunner_version, stop_timeout)
+
+
+def _stop_server(http_port, esrunner_version, stop_timeout=instances.DEFAULT_STOP_TIMEOUT):
+    pids = []
+    instance = instances.get_instance(http_port)
+    if instance is not None:
+        pids.append(instance.get('pid'))
+        instances.remove_instance(http_port)
+    # pid file of older versions
     pid_file = get_esrunner_home(esrunner_version) + "/" + str(http_port) + ".pid"
-    # stop existing process
     if os.path.exists(pid_file):
         with open(pid_file, 'rt') as f:
             pid = f.readline().strip()
         os.remove(pid_file)
         if len(pid) > 0:
-            try:
-                os.kill(int(pid), signal.SIGKILL)
-            except Exception as e:
-                logger.error('Failed to stop Elasticsearch process: ' + str(e))
-
-
-def create_analysis(namespace, analyzer={}, tokenizer={}, token_filter={}, char_filter={},
-                    host='localhost', http_port=DEFAULT_HTTP_PORT):
-    url = 'http://' + host + ':' + str(http_port) + '/' + namespace
-    req = Request(url)
-    req.get_method = lambda: 'HEAD'
-    req.add_header('Content-Type', 'application/json')
-    try:
-        with closing(urlopen(req)) as response:
-            if response.code == 200:
-                return False
-    except HTTPError as e:
-        if e.code == 404:
-            logger.debug('Index does not exist: ' + str(e))
-        else:
-            raise EsanpySetupError('Failed to check ' + namespace + ' namespace: ' + e.read().decode('utf-8'))
-
-    data = {
+            pids.append(int(pid))
+    stopped = False
+    for pid in pids:
+        if not instances.is_alive(pid):
+            continue
+        try:
+            instances.terminate(pid, timeout=stop_timeout)
+            stopped = True
+        except Exception as e:
+            logger.error('Failed to stop Elasticsearch process: ' + str(e))
+    return stopped
+
+
+def run_standby(host='localhost', http_port=DEFAULT_HTTP_PORT,
+                idle_timeout=DEFAULT_IDLE_TIMEOUT, check_interval=STANDBY_CHECK_INTERVAL, **kwargs):
+    """Keep a warm Elasticsearch instance until it has no client for idle_timeout seconds.
+
+    With idle_timeout None or 0, it runs until SIGTERM. This blocks; use
+    start_standby to run it as a background daemon. Clients attach with
+    start_server and detach with stop_server as usual.
+    """
+    start_server(host=host, http_port=http_port, attach=False, **kwargs)
+    with instances.lock(http_port):
+        instance = instances.get_instance(http_port)
+        if instance is None:
+            raise EsanpyServerError('Elasticsearch on port ' + str(http_port) + ' is not managed by esanpy.')
+        instance['daemon_pid'] = os.getpid()
+        instance['idle_timeout'] = idle_timeout
+        if len(instances.get_clients(instance)) == 0:
+            instance['idle_since'] = time.time()
+        instances.save_instance(instance)
+
+    terminated = []
+
+    def handle_signal(signum, frame):
+        terminated.append(signum)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    logger.info('Standby daemon is watching Elasticsearch on port ' + str(http_port))
+    while len(terminated) == 0:
+        time.sleep(check_interval)
+        with instances.lock(http_port):
+            instance = instances.get_instance(http_port)
+            if instance is None or instance.get('daemon_pid') != os.getpid():
+                logger.info('Elasticsearch on port ' + str(http_port) + ' was stopped by another process.')
+                return
+            if not instances.is_alive(instance.get('pid')):
+                logger.warning('Elasticsearch on port ' + str(http_port) + ' exited.')
+                instances.remove_instance(http_port)
+                return
+            idle_seconds = instances.get_idle_seconds(instance)
+            if idle_timeout and idle_seconds >= idle_timeout:
+                logger.info('Stopping Elasticsearch idle for {:.0f}s.'.format(idle_seconds))
+                _stop_server(http_port, instance.get('esrunner_version'))
+                return
+            instances.save_instance(instance)
+    with instances.lock(http_port):
+        _stop_server(http_port, kwargs.get('esrunner_version', ESRUNNER_VERSION))
+
+
+def start_standby(host='localhost', http_port=DEFAULT_HTTP_PORT,
+                  idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                  transport_port=DEFAULT_TRANSPORT_PORT,
+                  cluster_name=DEFAULT_CLUSTER_NAME,
+                  plugin_names=DEFAULT_PLUGINS,
+                  esrunner_version=ESRUNNER_VERSION,
+                  num_of_node=1,
+                  heap_size=None,
+                  startup_timeout=DEFAULT_STARTUP_TIMEOUT,
+                  jvm_profile=None):
+    """Run run_standby in a background process and wait until the instance is ready.
+
+    Returns the pid of the daemon. Call start_server afterwards to attach.
+    """
+    instance = instances.get_instance(http_port)
+    if instance is not None and instances.is_alive(instance.get('daemon_pid')):
+        return instance.get('daemon_pid')
+    args = [sys.executable, '-c', 'import sys, esanpy; sys.exit(esanpy.main(sys.argv[1:]))',
+            '--daemon',
+            '--host', host,
+            '--http-port', str(http_port),
+            '--transport-port', str(transport_port),
+            '--cluster-name', cluster_name,
+            '--runner-version', esrunner_version,
+            '--num-of-node', str(num_of_node),
+            '--jvm-profile', json.dumps(jvm.get_profile(jvm_profile, heap_max=heap_size)),
+            '--idle-timeout', str(idle_timeout or 0)]
+    for plugin_name in plugin_names:
+        args.extend(['--plugin', plugin_name])
+    if logger.isEnabledFor(10):
+        args.append('--verbose')
+    logger.debug(' '.join(args))
+    env = dict(os.environ)
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join([package_dir] + ([env['PYTHONPATH']] if 'PYTHONPATH' in env else []))
+    p = subprocess.Popen(args, stdin=DEVNULL, env=env,
+                         stdout=DEVNULL if logger.level != 10 else None,
+                         stderr=DEVNULL if logger.level != 10 else None,
+                         preexec_fn=getattr(os, 'setsid', None))
+    deadline = time.time() + startup_timeout
+    for interval in _backoff_intervals():
+        instance = instances.get_instance(http_port)
+        if instance is not None and instance.get('daemon_pid') == p.pid:
+            return p.pid
+        if p.poll() is not None or time.time() + interval > deadline:
+            break
+        time.sleep(interval)
+    if p.poll() is None:
+        p.kill()
+    raise EsanpyStartupError('Failed to start standby daemon for port ' + str(http_port))
+
+
+ANALYSIS_KEYS = {'analyzer': 'analyzer', 'tokenizer': 'tokenizer',
+                 'token_filter': 'filter', 'char_filter': 'char_filter'}
+
+
+def get_analysis_settings(analyzer={}, tokenizer={}, token_filter={}, char_filter={}):
+    return {
         "settings": {
             "index": {
                 "refresh_interval": -1,
                 "number_of_replicas": 0,
-                "number_of_shards": multiprocessing.cpu_count(),
+                # the index only holds analysis settings
+                "number_of_shards": 1,
                 "analysis": {
                     "filter": token_filter,
                     "char_filter": char_filter,
@@ -255,37 +559,47 @@ def create_analysis(namespace, analyzer={}, tokenizer={}, token_filter={}, char_
             }
         }
     }
-    req = Request(url)
-    req.get_method = lambda: 'PUT'
-    req.add_header('Content-Type', 'application/json')
+
+
+@metrics.traced('analysis.create')
+def create_analysis(namespace, analyzer={}, tokenizer={}, token_filter={}, char_filter={},
+                    host='localhost', http_port=DEFAULT_HTTP_PORT):
+    url = 'http://' + host + ':' + str(http_port) + '/' + namespace
     try:
-        with closing(urlopen(req, json.dumps(data).encode('utf-8'))) as response:
-            if logger.isEnabledFor(10):
-                logger.debug(response.read().decode('utf-8'))
+        response = connection.request('HEAD', url)
+        if response.code == 200:
+            return False
+    except HTTPError as e:
+        if e.code == 404:
+            logger.debug('Index does not exist: ' + str(e))
+        else:
+            raise EsanpySetupError('Failed to check ' + namespace + ' namespace: ' + e.read().decode('utf-8'))
+
+    data = get_analysis_settings(analyzer=analyzer, tokenizer=tokenizer,
+                                 token_filter=token_filter, char_filter=char_filter)
+    try:
+        response = connection.request('PUT', url, json.dumps(data).encode('utf-8'))
+        if logger.isEnabledFor(10):
+            logger.debug(response.read().decode('utf-8'))
     except HTTPError as e:
         raise EsanpySetupError('Failed to create ' + namespace + ' namespace: ' + e.read().decode('utf-8'))
+    finally:
+        cache.invalidate_namespace(namespace, host=host, http_port=http_port)
     return True
 
 
-def get_analysis(namespace,
-                 host='localhost', http_port=DEFAULT_HTTP_PORT):
+def get_analysis_index(namespace,
+                       host='localhost', http_port=DEFAULT_HTTP_PORT):
+    """Return the index behind namespace as {'index', 'uuid', 'analysis'}, or None.
+
+    namespace may be an alias of a versioned index, as ManagedAnalysis
+    creates, in which case the concrete index it points to is returned.
+    """
     url = 'http://' + host + ':' + str(http_port) + '/' + namespace
-    req = Request(url)
-    req.add_header('Content-Type', 'application/json')
     try:
-        with closing(urlopen(req)) as response:
-            if response.code == 200:
-                result = json.loads(response.read().decode('utf-8'))
-                namespace_obj = result.get(namespace)
-                if namespace_obj is None:
-                    return None
-                settings_obj = namespace_obj.get('settings')
-                if settings_obj is None:
-                    return None
-                index_obj = settings_obj.get('index')
-                if index_obj is None:
-                    return None
-                return index_obj.get('analysis')
+        response = connection.request('GET', url)
+        if response.code == 200:
+            return _parse_analysis_index(namespace, json.loads(response.read().decode('utf-8')))
     except HTTPError as e:
         if e.code == 404:
             logger.debug('Index does not exist: ' + str(e))
@@ -294,12 +608,160 @@ def get_analysis(namespace,
     return None
 
 
+def _parse_analysis_index(namespace, result):
+    """Return {'index', 'uuid', 'analysis'} from the GET /<namespace> response, or None."""
+    index = namespace if namespace in result else None
+    if index is None and len(result) == 1:
+        # namespace is an alias of a versioned index
+        index = list(result)[0]
+    if index is None:
+        return None
+    settings_obj = result.get(index).get('settings')
+    if settings_obj is None:
+        return None
+    index_obj = settings_obj.get('index')
+    if index_obj is None:
+        return None
+    return {'index': index,
+            'uuid': index_obj.get('uuid'),
+            'analysis': index_obj.get('analysis')}
+
+
+@metrics.traced('analysis.get')
+def get_analysis(namespace,
+                 host='localhost', http_port=DEFAULT_HTTP_PORT):
+    index = get_analysis_index(namespace, host=host, http_port=http_port)
+    return index.get('analysis') if index is not None else None
+
+
+@metrics.traced('analysis.delete')
 def delete_analysis(namespace,
                     host='localhost', http_port=DEFAULT_HTTP_PORT):
     url = 'http://' + host + ':' + str(http_port) + '/' + namespace
-    req = Request(url)
-    req.get_method = lambda: 'DELETE'
-    req.add_header('Content-Type', 'application/json')
-    with closing(urlopen(req)) as response:
-        if response.code != 200:
-            raise EsanpyServerError('Failed to delete ' + namespace)
+    try:
+        response = connection.request('DELETE', url)
+    finally:
+        cache.invalidate_namespace(namespace, host=host, http_port=http_port)
+    if response.code != 200:
+        raise EsanpyServerError('Failed to delete ' + namespace)
+
+
+def get_analyses(host='localhost', http_port=DEFAULT_HTTP_PORT):
+    """Return the analysis of every namespace, fetched with one _settings request."""
+    url = 'http://' + host + ':' + str(http_port) + '/_settings'
+    try:
+        result = json.loads(connection.request('GET', url).read().decode('utf-8'))
+    except HTTPError as e:
+        raise EsanpySetupError('Failed to get settings: ' + e.read().decode('utf-8'))
+    analyses = {}
+    for namespace, namespace_obj in result.items():
+        index_obj = namespace_obj.get('settings', {}).get('index', {})
+        analyses[namespace] = index_obj.get('analysis', {})
+    return analyses
+
+
+def _normalize_settings(value):
+    # Elasticsearch returns settings as strings and omits empty objects
+    if isinstance(value, dict):
+        normalized = {}
+        for k, v in value.items():
+            v = _normalize_settings(v)
+            if v != {}:
+                normalized[k] = v
+        return normalized
+    if isinstance(value, (list, tuple)):
+        return [_normalize_settings(x) for x in value]
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return str(value)
+    return value
+
+
+def _request_namespace(method, url, namespace, data=None):
+    try:
+        return connection.request(method, url, None if data is None else json.dumps(data).encode('utf-8'))
+    except HTTPError as e:
+        raise EsanpySetupError('Failed to update ' + namespace + ' namespace: ' + e.read().decode('utf-8'))
+
+
+def _update_analysis(namespace, analysis, current, host, http_port):
+    url = 'http://' + host + ':' + str(http_port) + '/' + namespace
+    try:
+        if not set(current).issubset(analysis) or \
+                any(not set(y).issubset(analysis.get(x)) for x, y in current.items()):
+            # settings of a closed index are merged, so removing components needs a new index
+            _request_namespace('DELETE', url, namespace)
+            _request_namespace('PUT', url, namespace, get_analysis_settings(
+                analyzer=analysis.get('analyzer', {}), tokenizer=analysis.get('tokenizer', {}),
+                token_filter=analysis.get('filter', {}), char_filter=analysis.get('char_filter', {})))
+            return
+        _request_namespace('POST', url + '/_close', namespace)
+        try:
+            _request_namespace('PUT', url + '/_settings', namespace, {'index': {'analysis': analysis}})
+        finally:
+            _request_namespace('POST', url + '/_open', namespace)
+        _request_namespace('GET', 'http://' + host + ':' + str(http_port) + '/_cluster/health/' + namespace +
+                           '?wait_for_status=yellow&timeout=' + str(DEFAULT_STARTUP_TIMEOUT) + 's', namespace)
+    finally:
+        cache.invalidate_namespace(namespace, host=host, http_port=http_port)
+
+
+@metrics.traced('analysis.apply')
+def apply_analyses(spec, host='localhost', http_port=DEFAULT_HTTP_PORT, max_workers=DEFAULT_APPLY_WORKERS):
+    """Make the namespaces of the server match spec.
+
+    spec maps a namespace to a dict with analyzer, tokenizer, token_filter and
+    char_filter as for create_analysis, or to None to delete the namespace;
+    namespaces not in spec are left alone. All definitions are validated
+    first, the current state is read with one _settings request, and
+    creations, updates and deletions run in parallel. Returns a dict of
+    created, updated, deleted and unchanged namespaces.
+    """
+    from esanpy.definitions import validate_analysis
+    for namespace, definition in spec.items():
+        if definition is None:
+            continue
+        unknown = set(definition) - set(ANALYSIS_KEYS)
+        if len(unknown) > 0:
+            raise EsanpyInvalidArgumentError('Unknown keys for ' + namespace + ': ' + ', '.join(sorted(unknown)))
+        validate_analysis(namespace, **definition)
+    current = get_analyses(host=host, http_port=http_port)
+
+    tasks = []
+    report = {'created': [], 'updated': [], 'deleted': [], 'unchanged': []}
+    for namespace, definition in sorted(spec.items()):
+        if definition is None:
+            if namespace in current:
+                tasks.append(('deleted', namespace, delete_analysis, (namespace, host, http_port), {}))
+            else:
+                report['unchanged'].append(namespace)
+            continue
+        if namespace not in current:
+            tasks.append(('created', namespace, create_analysis, (namespace,),
+                          dict(definition, host=host, http_port=http_port)))
+            continue
+        analysis = dict((ANALYSIS_KEYS[x], y) for x, y in definition.items())
+        current_analysis = _normalize_settings(current.get(namespace))
+        if _normalize_settings(analysis) != current_analysis:
+            tasks.append(('updated', namespace, _update_analysis,
+                          (namespace, analysis, current_analysis, host, http_port), {}))
+        else:
+            report['unchanged'].append(namespace)
+    if len(tasks) == 0:
+        return report
+
+    errors = []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tasks))) as executor:
+        futures = [(change, namespace, executor.submit(fn, *args, **kwargs))
+                   for change, namespace, fn, args, kwargs in tasks]
+        for change, namespace, future in futures:
+            try:
+                future.result()
+                report[change].append(namespace)
+                logger.info(namespace + ' namespace is ' + change + '.')
+            except Exception as e:
+                errors.append(namespace + ': ' + str(e))
+    if len(errors) > 0:
+        raise EsanpySetupError('Failed to apply analyses: ' + '; '.join(errors))
+    return report
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from logging import getLogger
+import multiprocessing
+import time
+
+from esanpy import analyzers
+
+
+try:
+    from urllib.error import HTTPError
+    from urllib.error import URLError
+except ImportError:
+    from urllib2 import HTTPError
+    from urllib2 import URLError
+
+logger = getLogger('esanpy')
+
+DEFAULT_RETRIES = 3
+DEFAULT_RETRY_INTERVAL = 0.1
+TRANSIENT_HTTP_CODES = (429, 502, 503, 504)
+
+
+def is_transient_error(e):
+    if isinstance(e, HTTPError):
+        return e.code in TRANSIENT_HTTP_CODES
+    return isinstance(e, URLError)
+
+
+class AnalysisExecutor(object):
+    """Runs analyze requests on a thread pool with a bounded number in flight.
+
+    Results are yielded lazily, so input iterables are consumed only as fast as
+    requests complete. With ordered=True results come back in input order;
+    otherwise (index, result) pairs are yielded in completion order. Requests
+    failing with a transient HTTPError or URLError are retried with
+    exponential backoff.
+    """
+
+    def __init__(self, max_workers=None, max_in_flight=None,
+                 retries=DEFAULT_RETRIES, retry_interval=DEFAULT_RETRY_INTERVAL):
+        self.max_workers = multiprocessing.cpu_count() if max_workers is None else max_workers
+        self.max_in_flight = self.max_workers * 2 if max_in_flight is None else max_in_flight
+        self.retries = retries
+        self.retry_interval = retry_interval
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        return False
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _call(self, fn, args, kwargs):
+        attempt = 0
+        while True:
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.retries or not is_transient_error(e):
+                    raise
+                interval = self.retry_interval * (2 ** attempt)
+                logger.debug('Retrying in ' + str(interval) + 's: ' + str(e))
+                time.sleep(interval)
+                attempt += 1
+
+    def submit(self, fn, *args, **kwargs):
+        return self._executor.submit(self._call, fn, args, kwargs)
+
+    def map(self, fn, iterable, ordered=True):
+        if ordered:
+            return self._map_ordered(fn, iterable)
+        return self._map_unordered(fn, iterable)
+
+    def _map_ordered(self, fn, iterable):
+        futures = deque()
+        try:
+            for value in iterable:
+                if len(futures) >= self.max_in_flight:
+                    yield futures.popleft().result()
+                futures.append(self.submit(fn, value))
+            while len(futures) > 0:
+                yield futures.popleft().result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _map_unordered(self, fn, iterable):
+        futures = {}
+        try:
+            for index, value in enumerate(iterable):
+                if len(futures) >= self.max_in_flight:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield futures.pop(future), future.result()
+                futures[self.submit(fn, value)] = index
+            while len(futures) > 0:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield futures.pop(future), future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def analyzer(self, texts, ordered=True, batch_size=1, **kwargs):
+        if batch_size <= 1:
+            return self.map(lambda text: analyzers.analyzer(text, **kwargs), texts, ordered=ordered)
+        return self._map_batches(lambda batch: analyzers.analyze_batch(batch, batch_size=batch_size, **kwargs),
+                                 texts, batch_size, ordered)
+
+    def custom_analyzer(self, texts, ordered=True, batch_size=1, **kwargs):
+        if batch_size <= 1:
+            return self.map(lambda text: analyzers.custom_analyzer(text, **kwargs), texts, ordered=ordered)
+        return self._map_batches(lambda batch: analyzers.custom_analyze_batch(batch, batch_size=batch_size, **kwargs),
+                                 texts, batch_size, ordered)
+
+    def _map_batches(self, fn, texts, batch_size, ordered):
+        if ordered:
+            for results in self.map(fn, _chunked(texts, batch_size)):
+                for result in results:
+                    yield result
+        else:
+            for batch_index, results in self.map(fn, _chunked(texts, batch_size), ordered=False):
+                for i, result in enumerate(results):
+                    yield batch_index * batch_size + i, result
+
+
+def _chunked(iterable, size):
+    chunk = []
+    for value in iterable:
+        chunk.append(value)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
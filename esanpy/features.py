@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+from array import array
+import zlib
+
+from esanpy.core import DEFAULT_BATCH_SIZE
+from esanpy.executor import AnalysisExecutor
+from esanpy.tokens import get_final_tokens
+
+
+DEFAULT_N_FEATURES = 2 ** 20
+DEFAULT_CHUNK_SIZE = 10000
+NGRAM_SEPARATOR = ' '
+
+
+def hash_feature(feature, n_features=DEFAULT_N_FEATURES):
+    """Return (column, sign) of a feature.
+
+    The column is the CRC32 of the UTF-8 encoded feature without its top bit,
+    modulo n_features, and the sign is taken from the top bit, so hashes are
+    stable across processes and Python versions.
+    """
+    value = zlib.crc32(feature.encode('utf-8')) & 0xffffffff
+    return (value & 0x7fffffff) % n_features, -1 if value & 0x80000000 else 1
+
+
+def get_ngrams(tokens, ngram_range=(1, 1)):
+    """Return the n-grams of tokens for each n in ngram_range, joined by a space."""
+    min_n, max_n = ngram_range
+    if min_n == 1 and max_n == 1:
+        return tokens
+    ngrams = []
+    for n in range(min_n, max_n + 1):
+        if n == 1:
+            ngrams.extend(tokens)
+            continue
+        for i in range(len(tokens) - n + 1):
+            ngrams.append(NGRAM_SEPARATOR.join(tokens[i:i + n]))
+    return ngrams
+
+
+def _get_token_texts(result):
+    if isinstance(result, list):
+        return result
+    return [x.get('token') for x in get_final_tokens(result)]
+
+
+class HashedFeatures(object):
+    """Hashed term frequencies of many documents as a CSR matrix.
+
+    Each document is a row; the columns and values of all rows are kept in
+    the indices and data arrays, and indptr holds the first entry of each row.
+    Use append as the converter of analyzer or analyze_batch, or
+    append_tokens with the token lists analyze_batch returns.
+    """
+
+    __slots__ = ('n_features', 'ngram_range', 'alternate_sign', 'binary', 'indptr', 'indices', 'data')
+
+    def __init__(self, n_features=DEFAULT_N_FEATURES, ngram_range=(1, 1), alternate_sign=False, binary=False):
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.alternate_sign = alternate_sign
+        self.binary = binary
+        self.clear()
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def __getstate__(self):
+        return (self.n_features, self.ngram_range, self.alternate_sign, self.binary,
+                self.indptr, self.indices, self.data)
+
+    def __setstate__(self, state):
+        (self.n_features, self.ngram_range, self.alternate_sign, self.binary,
+         self.indptr, self.indices, self.data) = state
+
+    @property
+    def nnz(self):
+        return len(self.indices)
+
+    @property
+    def shape(self):
+        return len(self), self.n_features
+
+    def clear(self):
+        self.indptr = array('l', [0])
+        self.indices = array('i')
+        self.data = array('d')
+
+    def append(self, result):
+        """Append the tokens of an _analyze result as a new row and return its index."""
+        return self.append_tokens(_get_token_texts(result))
+
+    def append_tokens(self, tokens):
+        counts = {}
+        n_features = self.n_features
+        for feature in get_ngrams(tokens, self.ngram_range):
+            column, sign = hash_feature(feature, n_features)
+            value = sign if self.alternate_sign else 1
+            if self.binary:
+                counts[column] = value
+            else:
+                counts[column] = counts.get(column, 0) + value
+        for column in sorted(counts):
+            value = counts[column]
+            if value != 0:
+                self.indices.append(column)
+                self.data.append(value)
+        self.indptr.append(len(self.indices))
+        return len(self.indptr) - 2
+
+    def get_row(self, index):
+        """Return the columns and values of a row as a dict."""
+        if index < 0:
+            index += len(self)
+        start, end = self.indptr[index], self.indptr[index + 1]
+        return dict(zip(self.indices[start:end], self.data[start:end]))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.get_row(i)
+
+    def to_numpy(self):
+        """Return the CSR arrays as NumPy arrays. Requires numpy."""
+        import numpy
+        return {'data': numpy.frombuffer(self.data, dtype=numpy.float64),
+                'indices': numpy.frombuffer(self.indices, dtype=numpy.int32),
+                'indptr': numpy.frombuffer(self.indptr, dtype=numpy.dtype(self.indptr.typecode)),
+                'shape': self.shape}
+
+    def to_scipy(self):
+        """Return a scipy.sparse.csr_matrix. Requires scipy."""
+        from scipy.sparse import csr_matrix
+        arrays = self.to_numpy()
+        return csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=arrays['shape'])
+
+
+class Vocabulary(object):
+    """Incremental term and document frequencies.
+
+    With max_terms, the terms with the lowest document frequencies are
+    dropped whenever twice as many terms are counted, which bounds memory
+    at the cost of undercounting terms that are dropped and seen again.
+    """
+
+    def __init__(self, ngram_range=(1, 1), max_terms=None):
+        self.ngram_range = ngram_range
+        self.max_terms = max_terms
+        self.num_docs = 0
+        self.num_pruned = 0
+        self.term_counts = {}
+        self.doc_counts = {}
+
+    def __len__(self):
+        return len(self.doc_counts)
+
+    def __contains__(self, term):
+        return term in self.doc_counts
+
+    def append(self, result):
+        """Count the tokens of an _analyze result as a new document and return its index."""
+        return self.append_tokens(_get_token_texts(result))
+
+    def append_tokens(self, tokens):
+        term_counts = self.term_counts
+        doc_counts = self.doc_counts
+        features = get_ngrams(tokens, self.ngram_range)
+        for term in features:
+            term_counts[term] = term_counts.get(term, 0) + 1
+        for term in set(features):
+            doc_counts[term] = doc_counts.get(term, 0) + 1
+        self.num_docs += 1
+        if self.max_terms is not None and len(doc_counts) > 2 * self.max_terms:
+            self.prune(self.max_terms)
+        return self.num_docs - 1
+
+    def update(self, other):
+        """Add the counts of another Vocabulary."""
+        for term, count in other.term_counts.items():
+            self.term_counts[term] = self.term_counts.get(term, 0) + count
+        for term, count in other.doc_counts.items():
+            self.doc_counts[term] = self.doc_counts.get(term, 0) + count
+        self.num_docs += other.num_docs
+        self.num_pruned += other.num_pruned
+        if self.max_terms is not None and len(self.doc_counts) > 2 * self.max_terms:
+            self.prune(self.max_terms)
+
+    def prune(self, max_terms):
+        """Keep the max_terms most frequent terms."""
+        for term, _ in self.most_common()[max_terms:]:
+            del self.term_counts[term]
+            del self.doc_counts[term]
+            self.num_pruned += 1
+
+    def get_df(self, term):
+        return self.doc_counts.get(term, 0)
+
+    def get_tf(self, term):
+        return self.term_counts.get(term, 0)
+
+    def most_common(self, n=None):
+        """Return (term, document frequency) pairs, most frequent first."""
+        terms = sorted(self.doc_counts.items(), key=lambda x: (-x[1], -self.term_counts[x[0]], x[0]))
+        return terms if n is None else terms[0:n]
+
+    def to_index(self, min_df=1, max_terms=None):
+        """Return a dict from term to column, most frequent terms first."""
+        terms = [x for x, df in self.most_common(max_terms) if df >= min_df]
+        return dict((x, i) for i, x in enumerate(terms))
+
+
+def iter_features(texts, n_features=DEFAULT_N_FEATURES, ngram_range=(1, 1), alternate_sign=False,
+                  binary=False, vocabulary=None, chunk_size=DEFAULT_CHUNK_SIZE, batch_size=DEFAULT_BATCH_SIZE,
+                  concurrency=1, **kwargs):
+    """Analyze texts and yield a HashedFeatures for each chunk_size documents.
+
+    Texts are read lazily and analyzed with analyze_batch (kwargs such as
+    analyzer, namespace, host and http_port are passed to it), so memory is
+    bounded by one chunk and the batches in flight. If vocabulary is given,
+    it is updated with the same tokens.
+    """
+    features = HashedFeatures(n_features=n_features, ngram_range=ngram_range,
+                              alternate_sign=alternate_sign, binary=binary)
+    with AnalysisExecutor(max_workers=concurrency) as executor:
+        for tokens in executor.analyzer(texts, batch_size=batch_size, **kwargs):
+            features.append_tokens(tokens)
+            if vocabulary is not None:
+                vocabulary.append_tokens(tokens)
+            if len(features) >= chunk_size:
+                yield features
+                features = HashedFeatures(n_features=n_features, ngram_range=ngram_range,
+                                          alternate_sign=alternate_sign, binary=binary)
+    if len(features) > 0:
+        yield features
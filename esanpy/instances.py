@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+from contextlib import contextmanager
+import errno
+import glob
+import json
+from logging import getLogger
+import os
+import signal
+import time
+
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = getLogger('esanpy')
+
+DEFAULT_STOP_TIMEOUT = 10
+STOP_CHECK_INTERVAL = 0.1
+
+
+def get_instances_home():
+    # imported here because esanpy.elasticsearch imports this module
+    from esanpy.elasticsearch import get_esanalyzer_home
+    return get_esanalyzer_home() + '/instances'
+
+
+def get_instance_file(http_port):
+    return get_instances_home() + '/' + str(http_port) + '.json'
+
+
+def get_lock_file(http_port):
+    return get_instances_home() + '/' + str(http_port) + '.lock'
+
+
+@contextmanager
+def lock(http_port):
+    """Hold an exclusive lock on the instance at http_port across processes.
+
+    The registry functions below expect to be called with this lock held.
+    Without fcntl (Windows) the lock is a no-op.
+    """
+    instances_home = get_instances_home()
+    try:
+        os.makedirs(instances_home)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    with open(get_lock_file(http_port), 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def is_alive(pid):
+    if pid is None:
+        return False
+    try:
+        # reap our own exited children so that they do not linger as zombies
+        if os.waitpid(pid, os.WNOHANG)[0] == pid:
+            return False
+    except OSError:
+        pass
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def get_instance(http_port):
+    instance_file = get_instance_file(http_port)
+    if not os.path.exists(instance_file):
+        return None
+    try:
+        with open(instance_file, 'rt') as f:
+            return json.load(f)
+    except ValueError as e:
+        logger.warning('Broken instance file ' + instance_file + ': ' + str(e))
+        return None
+
+
+def get_instances():
+    instances = []
+    for instance_file in sorted(glob.glob(get_instances_home() + '/*.json')):
+        instance = get_instance(os.path.basename(instance_file)[0:-5])
+        if instance is not None:
+            instances.append(instance)
+    return instances
+
+
+def save_instance(instance):
+    instance_file = get_instance_file(instance.get('http_port'))
+    tmp_file = instance_file + '.tmp-' + str(os.getpid())
+    with open(tmp_file, 'wt') as f:
+        json.dump(instance, f)
+    os.rename(tmp_file, instance_file)
+
+
+def remove_instance(http_port):
+    instance_file = get_instance_file(http_port)
+    if os.path.exists(instance_file):
+        os.remove(instance_file)
+
+
+def register(http_port, pid, host='localhost', esrunner_version=None, **kwargs):
+    instance = {'http_port': http_port,
+                'host': host,
+                'pid': pid,
+                'esrunner_version': esrunner_version,
+                'clients': [],
+                'daemon_pid': None,
+                'started_at': time.time(),
+                'idle_since': time.time()}
+    instance.update(kwargs)
+    save_instance(instance)
+    return instance
+
+
+def get_clients(instance):
+    """Return the live client pids of instance, dropping exited processes."""
+    clients = [x for x in instance.get('clients') or [] if is_alive(x)]
+    if len(clients) != len(instance.get('clients') or []):
+        instance['clients'] = clients
+        if len(clients) == 0:
+            instance['idle_since'] = time.time()
+    return clients
+
+
+def attach(http_port, pid=None):
+    """Count the process pid as a client of the instance and return the number of clients."""
+    instance = get_instance(http_port)
+    if instance is None:
+        return 0
+    pid = os.getpid() if pid is None else pid
+    clients = get_clients(instance)
+    if pid not in clients:
+        clients.append(pid)
+    instance['clients'] = clients
+    instance['idle_since'] = None
+    save_instance(instance)
+    return len(clients)
+
+
+def detach(http_port, pid=None):
+    """Remove the process pid from the clients and return the number of remaining clients."""
+    instance = get_instance(http_port)
+    if instance is None:
+        return 0
+    pid = os.getpid() if pid is None else pid
+    clients = [x for x in get_clients(instance) if x != pid]
+    instance['clients'] = clients
+    if len(clients) == 0 and instance.get('idle_since') is None:
+        instance['idle_since'] = time.time()
+    save_instance(instance)
+    return len(clients)
+
+
+def get_idle_seconds(instance):
+    if len(get_clients(instance)) > 0 or instance.get('idle_since') is None:
+        return 0
+    return time.time() - instance.get('idle_since')
+
+
+def terminate(pid, timeout=DEFAULT_STOP_TIMEOUT):
+    """Send SIGTERM to pid and SIGKILL if it is still alive after timeout seconds.
+
+    Returns True if the process exited gracefully.
+    """
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except OSError as e:
+        if e.errno == errno.ESRCH:
+            return True
+        raise
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if not is_alive(pid):
+            return True
+        time.sleep(STOP_CHECK_INTERVAL)
+    logger.warning('Process ' + str(pid) + ' did not exit in ' + str(timeout) + 's. Killing it.')
+    try:
+        os.kill(pid, getattr(signal, 'SIGKILL', signal.SIGTERM))
+    except OSError as e:
+        if e.errno != errno.ESRCH:
+            raise
+    return False
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import json
+from logging import getLogger
+import multiprocessing
+import os
+import re
+
+from esanpy.core import DEFAULT_HEAP_SIZE, EsanpyInvalidArgumentError
+
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+logger = getLogger('esanpy')
+
+DEFAULT_PROFILE = 'default'
+# Elasticsearch 5.x runs _analyze on the index thread pool
+ANALYZE_THREAD_POOL = 'index'
+NODE_CONFIG_HEADER = '# Generated by esanpy from the JVM profile; changes are overwritten.'
+HEAP_SIZE_PATTERN = re.compile(r'^[0-9]+[kKmMgG]?$')
+SIZE_UNITS = {'k': 1024, 'm': 1024 * 1024, 'g': 1024 * 1024 * 1024}
+GC_OPTIONS = {'serial': ['-XX:+UseSerialGC'],
+              'parallel': ['-XX:+UseParallelGC'],
+              'cms': ['-XX:+UseConcMarkSweepGC',
+                      '-XX:CMSInitiatingOccupancyFraction=75',
+                      '-XX:+UseCMSInitiatingOccupancyOnly'],
+              'g1': ['-XX:+UseG1GC']}
+PROFILE_KEYS = frozenset(['name', 'heap_min', 'heap_max', 'gc', 'analyze_threads', 'analyze_queue_size',
+                          'system_properties', 'jvm_options', 'java_home', 'settings'])
+PROFILES = {
+    'default': {'heap_min': None,
+                'heap_max': DEFAULT_HEAP_SIZE,
+                'gc': None,
+                'analyze_threads': None,
+                'analyze_queue_size': None,
+                'system_properties': {},
+                'jvm_options': [],
+                'java_home': None,
+                'settings': {}},
+    'low-memory': {'heap_min': '128m',
+                   'heap_max': '128m',
+                   'gc': 'serial',
+                   'analyze_threads': 1,
+                   'analyze_queue_size': 200,
+                   'jvm_options': ['-Xss256k',
+                                   '-XX:MaxMetaspaceSize=128m',
+                                   '-XX:ReservedCodeCacheSize=32m',
+                                   '-XX:TieredStopAtLevel=1']},
+    'throughput': {'heap_min': '1g',
+                   'heap_max': '1g',
+                   'gc': 'g1',
+                   'analyze_threads': multiprocessing.cpu_count(),
+                   'analyze_queue_size': 1000,
+                   'jvm_options': ['-XX:MaxGCPauseMillis=100',
+                                   '-XX:+AlwaysPreTouch',
+                                   '-XX:+DisableExplicitGC']},
+}
+
+
+def parse_size(size):
+    """Return the number of bytes of a JVM size such as 256m."""
+    size = str(size)
+    if HEAP_SIZE_PATTERN.match(size) is None:
+        raise EsanpyInvalidArgumentError('Invalid size: ' + size)
+    if size[-1].isdigit():
+        return int(size)
+    return int(size[0:-1]) * SIZE_UNITS[size[-1].lower()]
+
+
+def get_profile(profile=None, **overrides):
+    """Resolve a JVM profile into a dict with all PROFILE_KEYS.
+
+    profile is a preset name in PROFILES, a dict (its name, if any, selects
+    the preset it extends) or None for the default profile. Overrides that
+    are not None replace values of the profile.
+    """
+    if profile is None:
+        profile = DEFAULT_PROFILE
+    if isinstance(profile, string_types):
+        profile = {'name': profile}
+    name = profile.get('name', DEFAULT_PROFILE)
+    if name not in PROFILES:
+        raise EsanpyInvalidArgumentError('Unknown JVM profile: ' + name +
+                                         ' (available: ' + ', '.join(sorted(PROFILES)) + ')')
+    resolved = dict(PROFILES[DEFAULT_PROFILE])
+    resolved.update(PROFILES[name])
+    resolved.update(profile)
+    resolved['name'] = name
+    resolved.update((x, y) for x, y in overrides.items() if y is not None)
+
+    unknown = set(resolved) - PROFILE_KEYS
+    if len(unknown) > 0:
+        raise EsanpyInvalidArgumentError('Unknown JVM profile keys: ' + ', '.join(sorted(unknown)))
+    for key in ('heap_min', 'heap_max'):
+        if resolved.get(key) is not None and HEAP_SIZE_PATTERN.match(str(resolved.get(key))) is None:
+            raise EsanpyInvalidArgumentError('Invalid ' + key + ': ' + str(resolved.get(key)))
+    if overrides.get('heap_max') is not None and overrides.get('heap_min') is None and \
+            resolved.get('heap_min') is not None and \
+            parse_size(resolved.get('heap_min')) > parse_size(resolved.get('heap_max')):
+        # a smaller maximum heap than the preset minimum lowers the minimum too
+        resolved['heap_min'] = resolved.get('heap_max')
+    if resolved.get('gc') is not None and resolved.get('gc') not in GC_OPTIONS:
+        raise EsanpyInvalidArgumentError('Unknown GC: ' + str(resolved.get('gc')) +
+                                         ' (available: ' + ', '.join(sorted(GC_OPTIONS)) + ')')
+    for option in resolved.get('jvm_options'):
+        if not option.startswith('-'):
+            raise EsanpyInvalidArgumentError('Invalid JVM option: ' + option)
+    return resolved
+
+
+def load_profile(value):
+    """Load a profile given on the command line as a preset name, a JSON file or a JSON object."""
+    if value is None or value in PROFILES:
+        return value
+    if value.lstrip().startswith('{'):
+        return json.loads(value)
+    if os.path.isfile(value):
+        with open(value, 'rt') as f:
+            return json.load(f)
+    raise EsanpyInvalidArgumentError('Unknown JVM profile: ' + value)
+
+
+def get_java(profile):
+    java_home = profile.get('java_home')
+    if java_home is None:
+        return 'java'
+    java = os.path.join(java_home, 'bin', 'java')
+    if not os.path.exists(java):
+        raise EsanpyInvalidArgumentError('java is not found in ' + java_home)
+    return java
+
+
+def get_jvm_args(profile):
+    args = []
+    if profile.get('heap_min') is not None:
+        args.append('-Xms' + str(profile.get('heap_min')))
+    if profile.get('heap_max') is not None:
+        args.append('-Xmx' + str(profile.get('heap_max')))
+    if profile.get('gc') is not None:
+        args.extend(GC_OPTIONS[profile.get('gc')])
+    for key, value in sorted(profile.get('system_properties').items()):
+        args.append('-D' + key + '=' + str(value))
+    args.extend(profile.get('jvm_options'))
+    return args
+
+
+def get_node_settings(profile):
+    settings = {}
+    if profile.get('analyze_threads') is not None:
+        settings['thread_pool.' + ANALYZE_THREAD_POOL + '.size'] = profile.get('analyze_threads')
+    if profile.get('analyze_queue_size') is not None:
+        settings['thread_pool.' + ANALYZE_THREAD_POOL + '.queue_size'] = profile.get('analyze_queue_size')
+    settings.update(profile.get('settings'))
+    return settings
+
+
+def get_node_config_file(es_home, node_number):
+    return es_home + '/config/node_' + str(node_number) + '/elasticsearch.yml'
+
+
+def write_node_settings(es_home, num_of_node, settings):
+    """Write settings to elasticsearch.yml of each node, which the runner reads on startup.
+
+    Without settings, a file written earlier is removed so that the runner
+    creates its default one.
+    """
+    lines = [NODE_CONFIG_HEADER]
+    for key, value in sorted(settings.items()):
+        lines.append(key + ': ' + json.dumps(value))
+    for node_number in range(1, num_of_node + 1):
+        config_file = get_node_config_file(es_home, node_number)
+        if len(settings) == 0:
+            if os.path.exists(config_file):
+                with open(config_file, 'rt') as f:
+                    generated = f.readline().rstrip('\n') == NODE_CONFIG_HEADER
+                if generated:
+                    os.remove(config_file)
+            continue
+        config_dir = os.path.dirname(config_file)
+        if not os.path.exists(config_dir):
+            os.makedirs(config_dir)
+        with open(config_file, 'wt') as f:
+            f.write('\n'.join(lines) + '\n')
+
+
+def get_effective_settings(profile):
+    """Return what is recorded in the instance registry for profile."""
+    return {'profile': profile.get('name'),
+            'java': get_java(profile),
+            'jvm_args': get_jvm_args(profile),
+            'node_settings': get_node_settings(profile)}
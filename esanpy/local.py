@@ -0,0 +1,583 @@
+# -*- coding: utf-8 -*-
+"""In-process analysis for a subset of the built-in analysis chains.
+
+Supported without a namespace, attributes or text arrays:
+
+* analyzers: standard, simple, stop, whitespace, keyword
+* tokenizers: keyword, whitespace, letter, lowercase, standard (ASCII text only)
+* token filters: standard, lowercase, stop (stopwords as a list, _english_ or
+  _none_, and ignore_case)
+* char filters: mapping (inline mappings) and html_strip (inline tags such as
+  <b> or <span> and the amp, lt, gt, quot, apos, nbsp and numeric entities)
+
+Anything else, including texts the engine cannot reproduce exactly (e.g.
+non-ASCII text for the standard tokenizer or tokens longer than 255 chars),
+returns None so that the caller sends the request to Elasticsearch.
+"""
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+from bisect import bisect_right
+import json
+from logging import getLogger
+import random
+import re
+import threading
+import unicodedata
+
+from esanpy import connection
+from esanpy import serializer
+from esanpy.core import DEFAULT_HTTP_PORT
+
+
+try:
+    unichr
+except NameError:
+    unichr = chr
+
+logger = getLogger('esanpy')
+
+MAX_TOKEN_LENGTH = 255
+MAX_ANALYZERS = 1000
+
+ENGLISH_STOP_WORDS = frozenset(['a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by',
+                                'for', 'if', 'in', 'into', 'is', 'it', 'no', 'not', 'of',
+                                'on', 'or', 'such', 'that', 'the', 'their', 'then', 'there',
+                                'these', 'they', 'this', 'to', 'was', 'will', 'with'])
+
+INLINE_TAGS = frozenset(['a', 'abbr', 'b', 'bdi', 'bdo', 'big', 'cite', 'code', 'data', 'dfn',
+                         'em', 'font', 'i', 'kbd', 'mark', 'q', 's', 'samp', 'small', 'span',
+                         'strike', 'strong', 'sub', 'sup', 'time', 'tt', 'u', 'var'])
+HTML_ENTITIES = {'amp': '&', 'lt': '<', 'gt': '>', 'quot': '"', 'apos': "'", 'nbsp': '\u00a0'}
+HTML_TAG_PATTERN = re.compile(r'</?([A-Za-z][A-Za-z0-9]*)(?:\s+[^<>]*?)?\s*/?>')
+HTML_ENTITY_PATTERN = re.compile(r'&(?:#([0-9]{1,7})|#[xX]([0-9A-Fa-f]{1,6})|([A-Za-z]+));')
+NON_ASCII_PATTERN = re.compile(r'[^\x00-\x7f]')
+# narrow builds of Python 2 already count UTF-16 code units
+NON_BMP_PATTERN = re.compile('[\U00010000-\U0010FFFF]') if len('\U00010000') == 1 else None
+
+enabled = False
+_verify_rate = 0.0
+_analyzers = {}
+_lock = threading.Lock()
+_stats = {'local': 0, 'fallback': 0, 'verified': 0, 'mismatches': 0}
+
+
+class OffsetCorrector(object):
+    """Offset correction map of a char filter, as in Lucene's BaseCharFilter."""
+
+    def __init__(self):
+        self.offsets = []
+        self.diffs = []
+
+    @property
+    def last_diff(self):
+        return self.diffs[-1] if len(self.diffs) > 0 else 0
+
+    def add(self, offset, cumulative_diff):
+        if len(self.offsets) > 0 and self.offsets[-1] == offset:
+            self.diffs[-1] = cumulative_diff
+        else:
+            self.offsets.append(offset)
+            self.diffs.append(cumulative_diff)
+
+    def correct(self, offset):
+        index = bisect_right(self.offsets, offset) - 1
+        return offset + (self.diffs[index] if index >= 0 else 0)
+
+
+def _java_trim(value):
+    start = 0
+    end = len(value)
+    while start < end and value[start] <= ' ':
+        start += 1
+    while end > start and value[end - 1] <= ' ':
+        end -= 1
+    return value[start:end]
+
+
+def _parse_mapping_string(value):
+    chars = []
+    i = 0
+    while i < len(value):
+        c = value[i]
+        i += 1
+        if c == '\\':
+            if i >= len(value):
+                return None
+            c = value[i]
+            i += 1
+            if c == 'u':
+                if i + 4 > len(value):
+                    return None
+                try:
+                    c = unichr(int(value[i:i + 4], 16))
+                except ValueError:
+                    return None
+                i += 4
+            else:
+                c = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f'}.get(c, c)
+        chars.append(c)
+    return ''.join(chars)
+
+
+def parse_mappings(rules):
+    """Parse "key => value" rules of the mapping char filter into a dict, or return None."""
+    mappings = {}
+    for rule in rules:
+        if '=>' not in rule:
+            return None
+        key, value = rule.rsplit('=>', 1)
+        key = _parse_mapping_string(_java_trim(key))
+        value = _parse_mapping_string(_java_trim(value))
+        if key is None or value is None or len(key) == 0:
+            return None
+        mappings[key] = value
+    return mappings
+
+
+class MappingCharFilter(object):
+
+    def __init__(self, mappings):
+        self.mappings = mappings
+        self.max_length = max(len(x) for x in mappings) if len(mappings) > 0 else 0
+
+    def filter(self, text):
+        output = []
+        corrector = OffsetCorrector()
+        output_length = 0
+        i = 0
+        while i < len(text):
+            replacement = None
+            for length in range(min(self.max_length, len(text) - i), 0, -1):
+                replacement = self.mappings.get(text[i:i + length])
+                if replacement is not None:
+                    break
+            if replacement is None:
+                output.append(text[i])
+                output_length += 1
+                i += 1
+                continue
+            previous_diff = corrector.last_diff
+            i += length
+            diff = length - len(replacement)
+            if diff > 0:
+                corrector.add(output_length + len(replacement), previous_diff + diff)
+            elif diff < 0:
+                output_start = i - previous_diff
+                for extra in range(-diff):
+                    corrector.add(output_start + extra, previous_diff - extra - 1)
+            output.append(replacement)
+            output_length += len(replacement)
+        return ''.join(output), corrector
+
+
+class HtmlStripCharFilter(object):
+    """html_strip for inline tags and common entities; None for other markup."""
+
+    def filter(self, text):
+        if '<' not in text and '&' not in text:
+            return text, OffsetCorrector()
+        output = []
+        corrector = OffsetCorrector()
+        output_length = 0
+        cumulative_diff = 0
+        i = 0
+        while i < len(text):
+            c = text[i]
+            if c == '<':
+                m = HTML_TAG_PATTERN.match(text, i)
+                if m is None or m.group(1).lower() not in INLINE_TAGS:
+                    return None
+                replacement = ''
+            elif c == '&':
+                m = HTML_ENTITY_PATTERN.match(text, i)
+                if m is None:
+                    return None
+                if m.group(3) is not None:
+                    replacement = HTML_ENTITIES.get(m.group(3))
+                    if replacement is None:
+                        return None
+                else:
+                    code_point = int(m.group(1), 10) if m.group(1) is not None else int(m.group(2), 16)
+                    if code_point == 0 or code_point > 0xFFFF or 0xD800 <= code_point <= 0xDFFF:
+                        return None
+                    replacement = unichr(code_point)
+            else:
+                output.append(c)
+                output_length += 1
+                i += 1
+                continue
+            output.append(replacement)
+            output_length += len(replacement)
+            cumulative_diff += m.end() - m.start() - len(replacement)
+            corrector.add(output_length, cumulative_diff)
+            i = m.end()
+        return ''.join(output), corrector
+
+
+def _is_java_whitespace(c):
+    if c in '\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f ':
+        return True
+    if c < '\x80' or c in '\u00a0\u2007\u202f':
+        return False
+    return unicodedata.category(c) in ('Zs', 'Zl', 'Zp')
+
+
+def _split_runs(text, is_token_char):
+    tokens = []
+    start = None
+    for i, c in enumerate(text):
+        if is_token_char(c):
+            if start is None:
+                start = i
+        elif start is not None:
+            tokens.append((start, i, 'word'))
+            start = None
+    if start is not None:
+        tokens.append((start, len(text), 'word'))
+    return tokens
+
+
+def tokenize_keyword(text):
+    if len(text) == 0:
+        return None
+    return [(0, len(text), 'word')]
+
+
+def tokenize_whitespace(text):
+    return _split_runs(text, lambda c: not _is_java_whitespace(c))
+
+
+def tokenize_letter(text):
+    return _split_runs(text, lambda c: c.isalpha())
+
+
+LETTER = 1
+DIGIT = 2
+EXTEND_NUM_LET = 3
+MID_LETTER = 4
+MID_NUM = 5
+MID_NUM_LET = 6
+ASCII_WORD_BREAK = {'_': EXTEND_NUM_LET, ':': MID_LETTER, ',': MID_NUM, ';': MID_NUM,
+                    '.': MID_NUM_LET, "'": MID_NUM_LET}
+
+
+def _get_word_break(c):
+    if c.isalpha():
+        return LETTER
+    if c.isdigit():
+        return DIGIT
+    return ASCII_WORD_BREAK.get(c)
+
+
+def tokenize_standard(text):
+    """UAX#29 word segmentation of the standard tokenizer, for ASCII text."""
+    if NON_ASCII_PATTERN.search(text) is not None:
+        return None
+    classes = [_get_word_break(c) for c in text]
+    tokens = []
+    i = 0
+    while i < len(text):
+        if classes[i] not in (LETTER, DIGIT, EXTEND_NUM_LET):
+            i += 1
+            continue
+        start = i
+        while i + 1 < len(text):
+            current = classes[i]
+            following = classes[i + 1]
+            if following in (LETTER, DIGIT, EXTEND_NUM_LET):
+                i += 1
+            elif i + 2 < len(text) and classes[i + 2] == current and \
+                    ((current == LETTER and following in (MID_LETTER, MID_NUM_LET)) or
+                     (current == DIGIT and following in (MID_NUM, MID_NUM_LET))):
+                i += 2
+            else:
+                break
+        i += 1
+        segment = classes[start:i]
+        if LETTER in segment:
+            tokens.append((start, i, '<ALPHANUM>'))
+        elif DIGIT in segment:
+            tokens.append((start, i, '<NUM>'))
+        else:
+            return None
+    return tokens
+
+
+def _lowercase(tokens):
+    for token in tokens:
+        token['token'] = ''.join(x.lower()[0] for x in token['token'])
+    return tokens
+
+
+def _is_named_stopwords(word):
+    return len(word) > 2 and word.startswith('_') and word.endswith('_')
+
+
+def _create_stop_filter(stopwords, ignore_case=False):
+    if stopwords == '_english_':
+        stopwords = ENGLISH_STOP_WORDS
+    elif stopwords == '_none_':
+        stopwords = []
+    elif not isinstance(stopwords, list) or any(_is_named_stopwords(x) for x in stopwords):
+        # Elasticsearch expands named sets such as _english_ inside a list too
+        return None
+    if ignore_case:
+        stopwords = frozenset(x.lower() for x in stopwords)
+        return lambda tokens: [x for x in tokens if x['token'].lower() not in stopwords]
+    stopwords = frozenset(stopwords)
+    return lambda tokens: [x for x in tokens if x['token'] not in stopwords]
+
+
+TOKENIZERS = {'keyword': tokenize_keyword,
+              'whitespace': tokenize_whitespace,
+              'letter': tokenize_letter,
+              'standard': tokenize_standard}
+
+ANALYZERS = {'standard': ('standard', ['lowercase']),
+             'simple': ('letter', ['lowercase']),
+             'stop': ('letter', ['lowercase', 'stop']),
+             'whitespace': ('whitespace', []),
+             'keyword': ('keyword', [])}
+
+
+def _get_tokenizer(definition):
+    if isinstance(definition, dict):
+        if set(definition) - set(['type', 'max_token_length']) or \
+                definition.get('max_token_length', MAX_TOKEN_LENGTH) != MAX_TOKEN_LENGTH:
+            return None, []
+        definition = definition.get('type')
+    if definition == 'lowercase':
+        return tokenize_letter, [_lowercase]
+    return TOKENIZERS.get(definition), []
+
+
+def _get_token_filter(definition):
+    if definition == 'standard':
+        return lambda tokens: tokens
+    if definition == 'lowercase':
+        return _lowercase
+    if definition == 'stop':
+        return _create_stop_filter('_english_')
+    if not isinstance(definition, dict):
+        return None
+    filter_type = definition.get('type')
+    if filter_type == 'lowercase' and set(definition) == set(['type']):
+        return _lowercase
+    if filter_type == 'stop' and not set(definition) - set(['type', 'stopwords', 'ignore_case',
+                                                           'remove_trailing']):
+        if definition.get('remove_trailing', True) is not True:
+            # SuggestStopFilter keeps a trailing stopword
+            return None
+        return _create_stop_filter(definition.get('stopwords', '_english_'), definition.get('ignore_case', False))
+    return None
+
+
+def _get_char_filter(definition):
+    if definition == 'html_strip':
+        return HtmlStripCharFilter()
+    if not isinstance(definition, dict):
+        return None
+    filter_type = definition.get('type')
+    if filter_type == 'html_strip' and set(definition) == set(['type']):
+        return HtmlStripCharFilter()
+    if filter_type == 'mapping' and set(definition) == set(['type', 'mappings']):
+        mappings = parse_mappings(definition.get('mappings'))
+        if mappings is not None:
+            return MappingCharFilter(mappings)
+    return None
+
+
+def _to_utf16_offsets(text):
+    offsets = [0]
+    for c in text:
+        offsets.append(offsets[-1] + (2 if ord(c) > 0xFFFF else 1))
+    return offsets
+
+
+class LocalAnalyzer(object):
+    """Analysis chain of char filters, a tokenizer and token filters run in process."""
+
+    def __init__(self, tokenizer, token_filters, char_filters):
+        self.tokenizer = tokenizer
+        self.token_filters = token_filters
+        self.char_filters = char_filters
+
+    def analyze(self, text):
+        """Return an _analyze result for text, or None if it must be analyzed by Elasticsearch."""
+        if not isinstance(text, type('')):
+            return None
+        filtered = text
+        correctors = []
+        for char_filter in self.char_filters:
+            result = char_filter.filter(filtered)
+            if result is None:
+                return None
+            filtered, corrector = result
+            correctors.append(corrector)
+        spans = self.tokenizer(filtered)
+        if spans is None:
+            return None
+        utf16_offsets = None
+        if NON_BMP_PATTERN is not None and NON_BMP_PATTERN.search(text) is not None:
+            utf16_offsets = _to_utf16_offsets(text)
+        tokens = []
+        for position, (start, end, token_type) in enumerate(spans):
+            token = filtered[start:end]
+            if len(token) > MAX_TOKEN_LENGTH // 2 and self.tokenizer is not tokenize_keyword and \
+                    len(token.encode('utf-16-le')) // 2 > MAX_TOKEN_LENGTH:
+                return None
+            for corrector in reversed(correctors):
+                start = corrector.correct(start)
+                end = corrector.correct(end)
+            if utf16_offsets is not None:
+                start = utf16_offsets[start]
+                end = utf16_offsets[end]
+            tokens.append({'token': token,
+                           'start_offset': start,
+                           'end_offset': end,
+                           'type': token_type,
+                           'position': position})
+        for token_filter in self.token_filters:
+            tokens = token_filter(tokens)
+        return {'tokens': tokens}
+
+
+def create_analyzer(data):
+    """Build a LocalAnalyzer for an _analyze request body, or return None if it is not supported."""
+    if 'explain' in data or 'attributes' in data or 'normalizer' in data or 'field' in data:
+        return None
+    if 'analyzer' in data:
+        if set(data) - set(['analyzer', 'text']):
+            return None
+        chain = ANALYZERS.get(data.get('analyzer'))
+        if chain is None:
+            return None
+        tokenizer_name, token_filter_names = chain
+        return LocalAnalyzer(TOKENIZERS.get(tokenizer_name),
+                             [_get_token_filter(x) for x in token_filter_names], [])
+    if set(data) - set(['tokenizer', 'filter', 'char_filter', 'text']):
+        return None
+    tokenizer, token_filters = _get_tokenizer(data.get('tokenizer', 'keyword'))
+    if tokenizer is None:
+        return None
+    for definition in data.get('filter') or []:
+        token_filter = _get_token_filter(definition)
+        if token_filter is None:
+            return None
+        token_filters.append(token_filter)
+    char_filters = []
+    for definition in data.get('char_filter') or []:
+        char_filter = _get_char_filter(definition)
+        if char_filter is None:
+            return None
+        char_filters.append(char_filter)
+    return LocalAnalyzer(tokenizer, token_filters, char_filters)
+
+
+def get_analyzer(data):
+    """Return a cached LocalAnalyzer for the definition in data (text is ignored), or None."""
+    key = json.dumps(dict((x, y) for x, y in data.items() if x != 'text'), sort_keys=True)
+    local_analyzer = _analyzers.get(key)
+    if local_analyzer is None:
+        local_analyzer = create_analyzer(data) or False
+        with _lock:
+            if len(_analyzers) >= MAX_ANALYZERS:
+                _analyzers.clear()
+            _analyzers[key] = local_analyzer
+    return local_analyzer or None
+
+
+def run(local_analyzer, text):
+    result = local_analyzer.analyze(text)
+    _increment('fallback' if result is None else 'local')
+    return result
+
+
+def analyze(data):
+    """Analyze data['text'] in process; None if the server is needed."""
+    local_analyzer = get_analyzer(data)
+    if local_analyzer is None:
+        _increment('fallback')
+        return None
+    return run(local_analyzer, data.get('text'))
+
+
+def _increment(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def enable(verify_rate=0.0):
+    """Analyze supported chains in process.
+
+    With verify_rate, that fraction of local results is also requested from
+    Elasticsearch; on a mismatch, a warning is logged and the server result
+    is used.
+    """
+    global enabled, _verify_rate
+    _verify_rate = verify_rate
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def should_verify():
+    return _verify_rate > 0 and random.random() < _verify_rate
+
+
+def check(data, local_result, server_result):
+    """Compare local and server results, recording and logging a mismatch."""
+    _increment('verified')
+    if local_result.get('tokens') == server_result.get('tokens'):
+        return True
+    _increment('mismatches')
+    logger.warning('Local analysis differs from Elasticsearch for ' + json.dumps(data, ensure_ascii=False) +
+                   ': ' + json.dumps(local_result.get('tokens'), ensure_ascii=False) +
+                   ' != ' + json.dumps(server_result.get('tokens'), ensure_ascii=False))
+    return False
+
+
+def stats():
+    with _lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    with _lock:
+        for name in _stats:
+            _stats[name] = 0
+
+
+def verify(texts, analyzer=None, tokenizer='keyword', token_filter=[], char_filter=[],
+           host='localhost', http_port=DEFAULT_HTTP_PORT, sample_size=None):
+    """Diff-check local analysis against Elasticsearch on a sample of texts.
+
+    The chain is analyzer, or tokenizer, token_filter and char_filter as for
+    custom_analyzer. Returns a list of (text, local tokens, server tokens)
+    for texts analyzed differently; texts the engine does not support are
+    skipped.
+    """
+    if analyzer is not None:
+        data = {'analyzer': analyzer}
+    else:
+        data = {'tokenizer': tokenizer, 'filter': token_filter, 'char_filter': char_filter}
+    local_analyzer = get_analyzer(data)
+    if local_analyzer is None:
+        return []
+    if sample_size is not None and sample_size < len(texts):
+        texts = random.sample(list(texts), sample_size)
+    url = 'http://' + host + ':' + str(http_port) + '/_analyze'
+    mismatches = []
+    for text in texts:
+        local_result = local_analyzer.analyze(text)
+        if local_result is None:
+            continue
+        request_data = dict(data, text=text)
+        response = connection.request('POST', url, serializer.dumps(request_data))
+        server_result = serializer.loads(response.read())
+        if not check(request_data, local_result, server_result):
+            mismatches.append((text, local_result.get('tokens'), server_result.get('tokens')))
+    return mismatches
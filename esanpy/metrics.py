@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+from bisect import bisect_left
+from contextlib import contextmanager
+import functools
+from logging import getLogger
+import threading
+import time
+
+
+try:
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import HTTPError
+
+logger = getLogger('esanpy')
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_timer = getattr(time, 'perf_counter', time.time)
+
+# trace and traced check this flag first, so that metrics cost a no-op
+# context manager per call while no hook is registered.
+enabled = False
+_hooks = []
+_hooks_lock = threading.Lock()
+_collector = None
+
+
+def add_hook(hook):
+    """Register hook(name, values) to be called for every event.
+
+    Events are http.request, analyze, analyze_batch, analysis.create,
+    analysis.get, analysis.delete, analysis.apply and server.start. values holds numbers
+    such as total_seconds, sent_bytes or status; keys ending with _seconds
+    are latencies. Hooks run on the calling thread and must be fast.
+    """
+    global enabled
+    with _hooks_lock:
+        _hooks.append(hook)
+        enabled = True
+
+
+def remove_hook(hook):
+    global enabled
+    with _hooks_lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+        enabled = len(_hooks) > 0
+
+
+def emit(name, **values):
+    for hook in list(_hooks):
+        try:
+            hook(name, values)
+        except Exception as e:
+            logger.warning('Failed to call metrics hook ' + repr(hook) + ': ' + str(e))
+
+
+@contextmanager
+def _trace(name, values):
+    start = _timer()
+    try:
+        yield values
+    except HTTPError as e:
+        values['status'] = e.code
+        raise
+    except Exception as e:
+        values['error'] = type(e).__name__
+        raise
+    finally:
+        values['total_seconds'] = _timer() - start
+        emit(name, **values)
+
+
+class _NullTrace(object):
+    # values set inside the block go to a dict that is dropped
+
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_null_trace = _NullTrace()
+
+
+def trace(name, **values):
+    """Time the with block and emit name with total_seconds and any error.
+
+    The yielded dict can be filled with more values inside the block.
+    """
+    if not enabled:
+        return _null_trace
+    return _trace(name, values)
+
+
+def traced(name):
+    """Decorator tracing each call of the function as event name."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            with _trace(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Histogram(object):
+    """Counts of observed values per upper bound bucket."""
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum', 'min', 'max')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def get_percentile(self, percent):
+        """Return the upper bound of the bucket holding the percentile."""
+        if self.count == 0:
+            return None
+        rank = self.count * percent / 100
+        total = 0
+        for bound, count in zip(self.buckets + (self.max,), self.counts):
+            total += count
+            if total >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {'count': self.count,
+                'sum': self.sum,
+                'min': self.min,
+                'max': self.max,
+                'p50': self.get_percentile(50),
+                'p99': self.get_percentile(99),
+                'buckets': [[x, y] for x, y in zip(list(self.buckets) + ['+Inf'], self.counts)]}
+
+
+class MetricsCollector(object):
+    """Hook aggregating events into counters and latency histograms.
+
+    For each event name it counts calls, sums *_bytes values, counts errors by
+    status or exception type and cache hits by cache, and keeps a Histogram
+    of each *_seconds value.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def _increment(self, key, value=1):
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def __call__(self, name, values):
+        with self._lock:
+            self._increment(name + '.count')
+            for key, value in values.items():
+                if value is None:
+                    continue
+                if key.endswith('_seconds'):
+                    histogram = self.histograms.get(name + '.' + key)
+                    if histogram is None:
+                        histogram = Histogram(self.buckets)
+                        self.histograms[name + '.' + key] = histogram
+                    histogram.observe(value)
+                elif key.endswith('_bytes'):
+                    self._increment(name + '.' + key, value)
+                elif key == 'status' and value >= 400:
+                    self._increment(name + '.errors.' + str(value))
+                elif key == 'error':
+                    self._increment(name + '.errors.' + value)
+                elif key == 'cache':
+                    self._increment(name + '.cache_hits.' + value)
+
+    def snapshot(self):
+        with self._lock:
+            return {'counters': dict(self.counters),
+                    'histograms': dict((x, y.to_dict()) for x, y in self.histograms.items())}
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+
+def enable(buckets=DEFAULT_BUCKETS):
+    """Start collecting metrics with the built-in MetricsCollector and return it."""
+    global _collector
+    if _collector is None:
+        _collector = MetricsCollector(buckets)
+        add_hook(_collector)
+    return _collector
+
+
+def disable():
+    global _collector
+    if _collector is not None:
+        remove_hook(_collector)
+        _collector = None
+
+
+def snapshot():
+    if _collector is None:
+        return {'counters': {}, 'histograms': {}}
+    return _collector.snapshot()
+
+
+def reset():
+    if _collector is not None:
+        _collector.reset()
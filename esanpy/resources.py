@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import copy
+import hashlib
+import json
+from logging import getLogger
+import os
+import re
+import threading
+
+from esanpy import cache
+from esanpy import connection
+from esanpy import elasticsearch
+from esanpy.core import DEFAULT_HTTP_PORT, EsanpyIndexExistError, EsanpyInvalidArgumentError, \
+    EsanpySetupError
+from esanpy.definitions import string_types, validate_analysis
+
+
+try:
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import HTTPError
+
+logger = getLogger('esanpy')
+
+DEFAULT_WATCH_INTERVAL = 5.0
+DEFAULT_KEEP_VERSIONS = 1
+VERSION_LENGTH = 12
+# settings holding a file path, in addition to the ones ending with _path
+RESOURCE_KEYS = frozenset(['user_dictionary'])
+
+
+def _is_resource_key(key):
+    return key in RESOURCE_KEYS or key.endswith('_path')
+
+
+def _resolve_resources(definitions, resource_files):
+    # replaces resource paths with absolute ones and collects them
+    resolved = {}
+    for name, definition in definitions.items():
+        definition = dict(definition)
+        for key, value in definition.items():
+            if _is_resource_key(key) and isinstance(value, string_types):
+                value = os.path.abspath(value)
+                if not os.path.isfile(value):
+                    raise EsanpyInvalidArgumentError('Resource file not found: ' + value)
+                definition[key] = value
+                resource_files.add(value)
+        resolved[name] = definition
+    return resolved
+
+
+class ManagedAnalysis(object):
+    """Namespace whose analysis is rebuilt when its resource files change.
+
+    Each version lives in its own index, namespace-<version>, where the
+    version is a hash of the definition and of the contents of the files it
+    refers to (user_dictionary and *_path settings). deploy builds the
+    current version and then points the namespace alias at it in one atomic
+    _aliases request, so analyzer(namespace=...) never sees a missing
+    namespace. Older versions except the last keep ones are deleted
+    afterwards. watch polls the files and deploys on a background thread.
+    """
+
+    def __init__(self, namespace, analyzer={}, tokenizer={}, token_filter={}, char_filter={},
+                 host='localhost', http_port=DEFAULT_HTTP_PORT, keep=DEFAULT_KEEP_VERSIONS):
+        validate_analysis(namespace, analyzer=analyzer, tokenizer=tokenizer,
+                          token_filter=token_filter, char_filter=char_filter)
+        self.namespace = namespace
+        self.host = host
+        self.http_port = http_port
+        self.keep = keep
+        resource_files = set()
+        self.analysis = {'analyzer': copy.deepcopy(analyzer),
+                         'tokenizer': _resolve_resources(tokenizer, resource_files),
+                         'token_filter': _resolve_resources(token_filter, resource_files),
+                         'char_filter': _resolve_resources(char_filter, resource_files)}
+        self.resource_files = sorted(resource_files)
+        self._version_pattern = re.compile('^' + re.escape(namespace) + '-[0-9a-f]{' + str(VERSION_LENGTH) + '}$')
+        self._signature = None
+        self._lock = threading.Lock()
+        self._watch_thread = None
+        self._watch_stop = threading.Event()
+
+    def _get_url(self, path):
+        return 'http://' + self.host + ':' + str(self.http_port) + '/' + path
+
+    def get_signature(self):
+        """Return the modification time and size of each resource file."""
+        signature = []
+        for path in self.resource_files:
+            try:
+                stat = os.stat(path)
+                signature.append((path, stat.st_mtime, stat.st_size))
+            except OSError:
+                signature.append((path, None, None))
+        return signature
+
+    def get_version(self):
+        digest = hashlib.sha1(json.dumps(self.analysis, sort_keys=True).encode('utf-8'))
+        for path in self.resource_files:
+            try:
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(65536), b''):
+                        digest.update(chunk)
+            except IOError as e:
+                raise EsanpySetupError('Failed to read ' + path + ': ' + str(e))
+        return digest.hexdigest()[0:VERSION_LENGTH]
+
+    def get_index(self, version):
+        return self.namespace + '-' + version
+
+    def get_current_index(self):
+        """Return the index the namespace alias points to, or None."""
+        try:
+            response = connection.request('GET', self._get_url('_alias/' + self.namespace))
+            indices = sorted(json.loads(response.read().decode('utf-8')))
+        except HTTPError as e:
+            if e.code == 404:
+                return None
+            raise EsanpySetupError('Failed to get ' + self.namespace + ' alias: ' + e.read().decode('utf-8'))
+        return indices[0] if len(indices) > 0 else None
+
+    def get_versions(self):
+        """Return the indices of all versions, oldest first."""
+        try:
+            response = connection.request('GET', self._get_url(self.namespace + '-*/_settings'))
+            result = json.loads(response.read().decode('utf-8'))
+        except HTTPError as e:
+            if e.code == 404:
+                return []
+            raise EsanpySetupError('Failed to get versions of ' + self.namespace + ': ' +
+                                   e.read().decode('utf-8'))
+        versions = []
+        for index, index_obj in result.items():
+            if self._version_pattern.match(index) is None:
+                continue
+            created = index_obj.get('settings', {}).get('index', {}).get('creation_date', '0')
+            versions.append((int(created), index))
+        return [x for _, x in sorted(versions)]
+
+    def _check_namespace(self):
+        try:
+            connection.request('HEAD', self._get_url(self.namespace))
+        except HTTPError as e:
+            if e.code == 404:
+                return
+            raise
+        raise EsanpyIndexExistError(self.namespace + ' is an index created by create_analysis. '
+                                    'Delete it with delete_analysis to manage it.')
+
+    def deploy(self):
+        """Build the current version if needed and switch the alias to it.
+
+        Returns True if the alias was switched.
+        """
+        with self._lock:
+            self._signature = self.get_signature()
+            index = self.get_index(self.get_version())
+            current_index = self.get_current_index()
+            if current_index == index:
+                return False
+            if current_index is None:
+                self._check_namespace()
+            elasticsearch.create_analysis(index, host=self.host, http_port=self.http_port, **self.analysis)
+            actions = [{'add': {'index': index, 'alias': self.namespace}}]
+            if current_index is not None:
+                actions.insert(0, {'remove': {'index': current_index, 'alias': self.namespace}})
+            try:
+                connection.request('POST', self._get_url('_aliases'),
+                                   json.dumps({'actions': actions}).encode('utf-8'))
+            except HTTPError as e:
+                raise EsanpySetupError('Failed to switch ' + self.namespace + ' to ' + index + ': ' +
+                                       e.read().decode('utf-8'))
+            finally:
+                cache.invalidate_namespace(self.namespace, host=self.host, http_port=self.http_port)
+            logger.info('Switched ' + self.namespace + ' to ' + index)
+            self._gc(index)
+            return True
+
+    def _gc(self, current_index):
+        versions = [x for x in self.get_versions() if x != current_index]
+        for index in versions[0:max(len(versions) - self.keep, 0)]:
+            try:
+                elasticsearch.delete_analysis(index, host=self.host, http_port=self.http_port)
+                logger.debug('Deleted ' + index)
+            except Exception as e:
+                logger.warning('Failed to delete ' + index + ': ' + str(e))
+
+    def gc(self):
+        """Delete versions except the current one and the last keep ones."""
+        with self._lock:
+            self._gc(self.get_current_index())
+
+    def delete(self):
+        """Stop watching and delete all versions, and with them the alias."""
+        self.stop()
+        with self._lock:
+            for index in self.get_versions():
+                elasticsearch.delete_analysis(index, host=self.host, http_port=self.http_port)
+            cache.invalidate_namespace(self.namespace, host=self.host, http_port=self.http_port)
+
+    def check(self):
+        """Deploy if a resource file changed since the last deploy; True if switched."""
+        if self._signature == self.get_signature():
+            return False
+        return self.deploy()
+
+    def watch(self, interval=DEFAULT_WATCH_INTERVAL):
+        """Deploy now and then check the resource files every interval seconds."""
+        self.deploy()
+
+        def run():
+            while not self._watch_stop.wait(interval):
+                try:
+                    self.check()
+                except Exception as e:
+                    logger.warning('Failed to reload ' + self.namespace + ': ' + str(e))
+        self._watch_stop.clear()
+        self._watch_thread = threading.Thread(target=run, name='esanpy-watch-' + self.namespace)
+        self._watch_thread.daemon = True
+        self._watch_thread.start()
+
+    def stop(self):
+        self._watch_stop.set()
+        if self._watch_thread is not None:
+            self._watch_thread.join()
+            self._watch_thread = None
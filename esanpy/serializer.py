@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import json
+import re
+import threading
+import time
+
+from esanpy.core import EsanpyInvalidArgumentError
+
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    text_type = unicode
+except NameError:
+    text_type = str
+
+_timer = getattr(time, 'perf_counter', time.time)
+
+TOKEN_PATTERN = re.compile(r'"token"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+class JsonSerializer(object):
+    name = 'json'
+
+    def dumps(self, obj):
+        return json.dumps(obj).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data.decode('utf-8'))
+
+    def loads_tokens(self, data):
+        # A quote inside a JSON string is always escaped, so "token": can only
+        # match a key; values are decoded only when they contain escapes.
+        tokens = []
+        for value in TOKEN_PATTERN.findall(data.decode('utf-8')):
+            tokens.append(json.loads('"' + value + '"') if '\\' in value else value)
+        return tokens
+
+
+class UjsonSerializer(JsonSerializer):
+    name = 'ujson'
+
+    def dumps(self, obj):
+        body = ujson.dumps(obj, ensure_ascii=False)
+        # ujson returns UTF-8 encoded bytes on Python 2
+        return body.encode('utf-8') if isinstance(body, text_type) else body
+
+    def loads(self, data):
+        return ujson.loads(data.decode('utf-8'))
+
+    def loads_tokens(self, data):
+        return [x.get('token') for x in self.loads(data).get('tokens')]
+
+
+class OrjsonSerializer(JsonSerializer):
+    name = 'orjson'
+
+    def dumps(self, obj):
+        return orjson.dumps(obj)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+    def loads_tokens(self, data):
+        return [x.get('token') for x in orjson.loads(data).get('tokens')]
+
+
+class DecodeStats(object):
+
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, size, seconds):
+        with self._lock:
+            self.count += 1
+            self.bytes += size
+            self.seconds += seconds
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self.bytes = 0
+            self.seconds = 0.0
+
+    def to_dict(self):
+        with self._lock:
+            return {'count': self.count, 'bytes': self.bytes, 'seconds': self.seconds}
+
+
+SERIALIZERS = {'json': JsonSerializer}
+if ujson is not None:
+    SERIALIZERS['ujson'] = UjsonSerializer
+if orjson is not None:
+    SERIALIZERS['orjson'] = OrjsonSerializer
+
+_serializer = (OrjsonSerializer if orjson is not None else
+               UjsonSerializer if ujson is not None else JsonSerializer)()
+_decode_stats = DecodeStats()
+
+
+def set_serializer(name):
+    global _serializer
+    serializer_class = SERIALIZERS.get(name)
+    if serializer_class is None:
+        raise EsanpyInvalidArgumentError('Unknown serializer: ' + name +
+                                         ' (available: ' + ', '.join(sorted(SERIALIZERS)) + ')')
+    _serializer = serializer_class()
+
+
+def get_serializer():
+    return _serializer
+
+
+def dumps(obj):
+    return _serializer.dumps(obj)
+
+
+def loads(data):
+    start = _timer()
+    result = _serializer.loads(data)
+    _decode_stats.add(len(data), _timer() - start)
+    return result
+
+
+def loads_tokens(data):
+    start = _timer()
+    result = _serializer.loads_tokens(data)
+    _decode_stats.add(len(data), _timer() - start)
+    return result
+
+
+def decode_stats():
+    return _decode_stats.to_dict()
+
+
+def reset_decode_stats():
+    _decode_stats.reset()
+
+
+def measure_decode(data, repeat=10):
+    """Measure full and token-only decoding of a response body.
+
+    Returns seconds per decode and, on Python 3, the peak memory allocated
+    while decoding for each mode.
+    """
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+    result = {}
+    for mode, decode in (('full', lambda: [x.get('token') for x in _serializer.loads(data).get('tokens')]),
+                         ('tokens', lambda: _serializer.loads_tokens(data))):
+        start = _timer()
+        for _ in range(repeat):
+            decode()
+        seconds = (_timer() - start) / repeat
+        peak = None
+        if tracemalloc is not None:
+            tracing = tracemalloc.is_tracing()
+            if not tracing:
+                tracemalloc.start()
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.clear_traces()
+            base = tracemalloc.get_traced_memory()[0]
+            decode()
+            peak = tracemalloc.get_traced_memory()[1] - base
+            if not tracing:
+                tracemalloc.stop()
+        result[mode] = {'seconds': seconds, 'peak_bytes': peak}
+    return result
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Coalescing of identical analyze requests in flight.
+
+While enabled, a request whose URL and body equal one already being sent
+waits for that request and shares its decoded result instead of sending
+its own. Thread callers use the module-level Group; asyncio callers use
+esanpy.aio.AsyncGroup, which shields the shared request from the
+cancellation of any one caller.
+"""
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import os
+import threading
+
+
+enabled = False
+_stats = {'executed': 0, 'shared': 0}
+_stats_lock = threading.Lock()
+
+
+class Call(object):
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Group(object):
+    """Runs at most one call per key at a time for threads."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Return fn(), or the result of the call for key already in flight.
+
+        An exception raised by fn is raised in every caller waiting for it.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = Call()
+                self._calls[key] = call
+        record(not leader)
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def __len__(self):
+        return len(self._calls)
+
+
+_group = Group()
+
+
+def reset_after_fork():
+    """Forget the calls in flight in the parent; their threads do not exist in a forked child."""
+    global _group, _stats_lock
+    _group = Group()
+    _stats_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_after_fork)
+
+
+def do(key, fn):
+    return _group.do(key, fn)
+
+
+def record(shared):
+    with _stats_lock:
+        _stats['shared' if shared else 'executed'] += 1
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def stats():
+    """Return the number of requests sent (executed) and coalesced into them (shared)."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import io
+import json
+from logging import getLogger
+import sys
+import time
+
+from esanpy import analyzers
+from esanpy.core import DEFAULT_BATCH_SIZE, DEFAULT_BATCH_BYTES
+from esanpy.executor import AnalysisExecutor, is_transient_error
+
+
+try:
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import HTTPError
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+logger = getLogger('esanpy')
+
+DEFAULT_PROGRESS_INTERVAL = 10
+
+
+def open_input(path):
+    if path == '-':
+        return io.open(sys.stdin.fileno(), 'rt', encoding='utf-8', closefd=False)
+    return io.open(path, 'rt', encoding='utf-8')
+
+
+def open_output(path):
+    if path == '-':
+        return io.open(sys.stdout.fileno(), 'wt', encoding='utf-8', closefd=False)
+    return io.open(path, 'wt', encoding='utf-8')
+
+
+class StreamStats(object):
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.documents = 0
+        self.tokens = 0
+        self.errors = 0
+
+    def __str__(self):
+        elapsed = max(time.time() - self.start_time, 1e-9)
+        return ('{} documents, {} tokens, {} errors in {:.1f}s ({:.1f} docs/s, {:.1f} tokens/s)'
+                .format(self.documents, self.tokens, self.errors, elapsed,
+                        self.documents / elapsed, self.tokens / elapsed))
+
+
+def _parse_record(line, text_field):
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError('not a JSON object')
+    text = record.get(text_field)
+    if text is not None and not isinstance(text, string_types):
+        raise ValueError(text_field + ' is not a string')
+    return record, text
+
+
+def _analyze_texts(line_numbers, texts, **kwargs):
+    # a rejected batch fails its lines instead of the whole stream
+    try:
+        return analyzers.analyze_batch(texts, **kwargs), None
+    except HTTPError as e:
+        if e.code >= 500 or is_transient_error(e):
+            raise
+        error = 'HTTP ' + str(e.code) + ': ' + e.read().decode('utf-8')
+        logger.warning('Failed to analyze lines ' + str(line_numbers[0]) + '-' + str(line_numbers[-1]) +
+                       ': ' + error)
+        return [[] for _ in texts], error
+
+
+def analyze_stream(lines, output, input_format='text', text_field='text', tokens_field='tokens',
+                   batch_size=DEFAULT_BATCH_SIZE, batch_bytes=DEFAULT_BATCH_BYTES, concurrency=1,
+                   progress_interval=DEFAULT_PROGRESS_INTERVAL, **kwargs):
+    """Analyze lines of plain text or JSONL and write one line per input line.
+
+    Plain text output is the tokens of each line joined by a space; blank
+    lines are not sent and give empty lines. JSONL output is the input
+    object with tokens stored under tokens_field; blank lines are skipped.
+    A malformed line, a non-string text_field or a batch rejected by
+    Elasticsearch is logged and written as {"line": ..., "error": ...} in
+    JSONL (an empty line in plain text) instead of stopping the stream.
+    Output keeps input order; at most 2 * concurrency batches are held in
+    memory.
+    """
+    if input_format == 'jsonl':
+        def analyze(batch):
+            records = []
+            valid = []
+            errors = 0
+            for line_number, line in batch:
+                if len(line.strip()) == 0:
+                    continue
+                try:
+                    record, text = _parse_record(line, text_field)
+                    valid.append((len(records), line_number, text))
+                except ValueError as e:
+                    logger.warning('Invalid record at line ' + str(line_number) + ': ' + str(e))
+                    record = {'line': line_number, 'error': str(e)}
+                    errors += 1
+                records.append(record)
+            results, error = [], None
+            if len(valid) > 0:
+                results, error = _analyze_texts([x[1] for x in valid], [x[2] for x in valid],
+                                                batch_size=batch_size, batch_bytes=batch_bytes, **kwargs)
+            for (index, line_number, _), tokens in zip(valid, results):
+                if error is None:
+                    records[index][tokens_field] = tokens
+                else:
+                    records[index] = {'line': line_number, 'error': error}
+                    errors += 1
+            return [json.dumps(x, ensure_ascii=False) for x in records], sum(len(x) for x in results), errors
+    else:
+        def analyze(batch):
+            line_numbers = [x for x, _ in batch]
+            texts = [x.rstrip('\r\n') for _, x in batch]
+            results, error = _analyze_texts(line_numbers, [x if len(x.strip()) > 0 else None for x in texts],
+                                            batch_size=batch_size, batch_bytes=batch_bytes, **kwargs)
+            return [' '.join(x) for x in results], sum(len(x) for x in results), \
+                0 if error is None else sum(1 for x in texts if len(x.strip()) > 0)
+
+    stats = StreamStats()
+    last_report = stats.start_time
+    with AnalysisExecutor(max_workers=concurrency) as executor:
+        for output_lines, num_of_tokens, num_of_errors in executor.map(analyze, _read_batches(lines, batch_size)):
+            for output_line in output_lines:
+                output.write(output_line)
+                output.write('\n')
+            stats.documents += len(output_lines)
+            stats.tokens += num_of_tokens
+            stats.errors += num_of_errors
+            now = time.time()
+            if progress_interval is not None and now - last_report >= progress_interval:
+                logger.info('Processed ' + str(stats))
+                last_report = now
+    output.flush()
+    logger.info('Finished ' + str(stats))
+    return stats
+
+
+def _read_batches(lines, batch_size):
+    # yields lists of (line number, line)
+    batch = []
+    for line_number, line in enumerate(lines, 1):
+        batch.append((line_number, line))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+from array import array
+
+
+def get_final_tokens(result):
+    """Return the token list of the last analysis stage in an _analyze result."""
+    detail = result.get('detail')
+    if detail is None:
+        return result.get('tokens') or []
+    if detail.get('analyzer') is not None:
+        return detail.get('analyzer').get('tokens') or []
+    token_filters = detail.get('tokenfilters')
+    if token_filters:
+        return token_filters[-1].get('tokens') or []
+    if detail.get('tokenizer') is not None:
+        return detail.get('tokenizer').get('tokens') or []
+    return []
+
+
+class TokenStream(object):
+    """Columnar store of tokens for many documents.
+
+    Token texts are concatenated into one shared buffer and addressed by
+    token_offsets; offsets, positions and interned type ids are kept in
+    parallel arrays, and doc_offsets holds the first token index of each
+    document. Use append as the converter of analyze_batch to fill a stream
+    without keeping per-token dicts around.
+    """
+
+    __slots__ = ('token_offsets', 'start_offsets', 'end_offsets', 'positions', 'type_ids',
+                 'doc_offsets', 'types', '_type_ids', '_chunks', '_buffer', '_buffer_length')
+
+    def __init__(self):
+        self.token_offsets = array('l', [0])
+        self.start_offsets = array('i')
+        self.end_offsets = array('i')
+        self.positions = array('i')
+        self.type_ids = array('i')
+        self.doc_offsets = array('l', [0])
+        self.types = []
+        self._type_ids = {}
+        self._chunks = []
+        self._buffer = ''
+        self._buffer_length = 0
+
+    def __len__(self):
+        return len(self.doc_offsets) - 1
+
+    def __getstate__(self):
+        return (self.buffer, self.token_offsets, self.start_offsets, self.end_offsets,
+                self.positions, self.type_ids, self.doc_offsets, self.types)
+
+    def __setstate__(self, state):
+        (buffer, self.token_offsets, self.start_offsets, self.end_offsets,
+         self.positions, self.type_ids, self.doc_offsets, self.types) = state
+        self._type_ids = dict((x, i) for i, x in enumerate(self.types))
+        self._chunks = []
+        self._buffer = buffer
+        self._buffer_length = len(buffer)
+
+    @property
+    def num_tokens(self):
+        return len(self.start_offsets)
+
+    @property
+    def buffer(self):
+        if len(self._chunks) > 0:
+            self._buffer = self._buffer + ''.join(self._chunks)
+            self._chunks = []
+        return self._buffer
+
+    def _get_type_id(self, token_type):
+        type_id = self._type_ids.get(token_type)
+        if type_id is None:
+            type_id = len(self.types)
+            self.types.append(token_type)
+            self._type_ids[token_type] = type_id
+        return type_id
+
+    def append(self, result):
+        """Append the tokens of an _analyze result as a new document and return its index."""
+        return self.append_tokens(get_final_tokens(result))
+
+    def append_tokens(self, tokens):
+        for token in tokens:
+            text = token.get('token')
+            self._chunks.append(text)
+            self._buffer_length += len(text)
+            self.token_offsets.append(self._buffer_length)
+            self.start_offsets.append(token.get('start_offset'))
+            self.end_offsets.append(token.get('end_offset'))
+            self.positions.append(token.get('position'))
+            self.type_ids.append(self._get_type_id(token.get('type')))
+        self.doc_offsets.append(len(self.start_offsets))
+        return len(self.doc_offsets) - 2
+
+    def extend(self, other):
+        """Append all documents of another TokenStream."""
+        type_ids = [self._get_type_id(x) for x in other.types]
+        buffer_base = self._buffer_length
+        token_base = len(self.start_offsets)
+        self._chunks.append(other.buffer)
+        self._buffer_length += len(other.buffer)
+        self.token_offsets.extend(array('l', [x + buffer_base for x in other.token_offsets[1:]]))
+        self.start_offsets.extend(other.start_offsets)
+        self.end_offsets.extend(other.end_offsets)
+        self.positions.extend(other.positions)
+        self.type_ids.extend(array('i', [type_ids[x] for x in other.type_ids]))
+        self.doc_offsets.extend(array('l', [x + token_base for x in other.doc_offsets[1:]]))
+
+    def _token_range(self, index):
+        if index < 0:
+            index += len(self)
+        return self.doc_offsets[index], self.doc_offsets[index + 1]
+
+    def get_tokens(self, index):
+        start, end = self._token_range(index)
+        buffer = self.buffer
+        offsets = self.token_offsets
+        return [buffer[offsets[i]:offsets[i + 1]] for i in range(start, end)]
+
+    def get_offsets(self, index):
+        start, end = self._token_range(index)
+        return list(zip(self.start_offsets[start:end], self.end_offsets[start:end]))
+
+    def get_positions(self, index):
+        start, end = self._token_range(index)
+        return self.positions[start:end].tolist()
+
+    def get_types(self, index):
+        start, end = self._token_range(index)
+        return [self.types[x] for x in self.type_ids[start:end]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.get_tokens(i)
+
+    def to_numpy(self):
+        """Return the columns as NumPy arrays. Requires numpy."""
+        import numpy
+        return {'buffer': self.buffer,
+                'token_offsets': numpy.frombuffer(self.token_offsets, dtype=numpy.dtype(self.token_offsets.typecode)),
+                'start_offsets': numpy.frombuffer(self.start_offsets, dtype=numpy.int32),
+                'end_offsets': numpy.frombuffer(self.end_offsets, dtype=numpy.int32),
+                'positions': numpy.frombuffer(self.positions, dtype=numpy.int32),
+                'type_ids': numpy.frombuffer(self.type_ids, dtype=numpy.int32),
+                'doc_offsets': numpy.frombuffer(self.doc_offsets, dtype=numpy.dtype(self.doc_offsets.typecode)),
+                'types': list(self.types)}
+
+
+def columnar_converter(result):
+    stream = TokenStream()
+    stream.append(result)
+    return stream
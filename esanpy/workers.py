@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+from collections import deque
+import multiprocessing
+import pickle
+import sys
+
+from esanpy import analyzers
+from esanpy import cache
+from esanpy import connection
+from esanpy import singleflight
+from esanpy.core import DEFAULT_BATCH_SIZE, EsanpyInvalidArgumentError
+from esanpy.tokens import TokenStream
+
+
+def _get_context(start_method):
+    get_context = getattr(multiprocessing, 'get_context', None)
+    if get_context is None:
+        return multiprocessing
+    if start_method is None and sys.platform.startswith('linux'):
+        # forked workers start in milliseconds and need no re-import
+        start_method = 'fork'
+    return get_context(start_method)
+
+
+def _initialize_worker():
+    # register_at_fork is not available before Python 3.7
+    connection.reset_after_fork()
+    cache.reset_after_fork()
+    singleflight.reset_after_fork()
+
+
+def _analyze_chunk(custom, texts, kwargs, columnar):
+    analyze = analyzers.custom_analyze_batch if custom else analyzers.analyze_batch
+    if columnar:
+        stream = TokenStream()
+        analyze(texts, converter=stream.append, **kwargs)
+        return stream
+    return analyze(texts, **kwargs)
+
+
+def _check_picklable(kwargs):
+    for name in ('converter', 'deduplicator'):
+        try:
+            pickle.dumps(kwargs.get(name))
+        except Exception as e:
+            raise EsanpyInvalidArgumentError(name + ' should be picklable to be sent to worker processes, '
+                                             'e.g. a function defined at module level: ' + str(e))
+
+
+class AnalysisProcessPool(object):
+    """Runs batch analysis and converters on a pool of worker processes.
+
+    Decoding responses and running converters is CPU-bound, so threads are
+    limited to about one core by the GIL. Each worker process keeps its own
+    connection pool and analyzes chunks of chunk_size texts with
+    analyze_batch, running the converter locally, so only the texts and the
+    converted results are pickled. Converters must be picklable; return
+    compact values from them, or use token_stream to get a TokenStream.
+    Workers are started once and reused until close; at most max_in_flight
+    chunks are pending, so input iterables are consumed lazily.
+    """
+
+    def __init__(self, processes=None, chunk_size=DEFAULT_BATCH_SIZE, max_in_flight=None, start_method=None):
+        self.processes = multiprocessing.cpu_count() if processes is None else processes
+        self.chunk_size = chunk_size
+        self.max_in_flight = self.processes * 2 if max_in_flight is None else max_in_flight
+        self._pool = _get_context(start_method).Pool(self.processes, initializer=_initialize_worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+        return False
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def terminate(self):
+        self._pool.terminate()
+        self._pool.join()
+
+    def _map_chunks(self, custom, texts, kwargs, columnar):
+        _check_picklable(kwargs)
+        results = deque()
+        chunk = []
+        for text in texts:
+            chunk.append(text)
+            if len(chunk) >= self.chunk_size:
+                if len(results) >= self.max_in_flight:
+                    yield results.popleft().get()
+                results.append(self._pool.apply_async(_analyze_chunk, (custom, chunk, kwargs, columnar)))
+                chunk = []
+        if len(chunk) > 0:
+            results.append(self._pool.apply_async(_analyze_chunk, (custom, chunk, kwargs, columnar)))
+        while len(results) > 0:
+            yield results.popleft().get()
+
+    def analyzer(self, texts, **kwargs):
+        """Yield the result of analyze_batch for each text, in input order."""
+        for results in self._map_chunks(False, texts, kwargs, False):
+            for result in results:
+                yield result
+
+    def custom_analyzer(self, texts, **kwargs):
+        """Yield the result of custom_analyze_batch for each text, in input order."""
+        for results in self._map_chunks(True, texts, kwargs, False):
+            for result in results:
+                yield result
+
+    def token_stream(self, texts, custom=False, **kwargs):
+        """Analyze texts into one TokenStream, which workers send back as compact arrays."""
+        stream = TokenStream()
+        for chunk_stream in self._map_chunks(custom, texts, kwargs, True):
+            stream.extend(chunk_stream)
+        return stream
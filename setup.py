@@ -8,6 +8,7 @@ setup(
     name="esanpy",
     version=VERSION,
     packages=['esanpy'],
+    install_requires=['futures; python_version < "3"'],
     author="CodeLibs",
     author_email="dev@codelibs.org",
     license="Apache Software License",
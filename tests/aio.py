@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import errno
+from logging import getLogger, basicConfig
+import shutil
+import sys
+import tempfile
+import unittest
+
+import esanpy
+from esanpy import singleflight
+
+if sys.version_info >= (3, 5):
+    import asyncio
+    from esanpy import aio
+
+
+@unittest.skipIf(sys.version_info < (3, 5), 'asyncio client requires Python 3.5 or above')
+class AsyncAnalyzerTest(unittest.TestCase):
+
+    def setUp(self):
+        basicConfig()
+        getLogger('esanpy').setLevel(10)
+        esanpy.start_server()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        aio.close_client(self.loop)
+        self.loop.close()
+        esanpy.stop_server()
+
+    def _run(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_analyzer(self):
+        result = self._run(aio.analyzer('This is a pen.'))
+        self.assertEqual(result, ['this', 'is', 'a', 'pen'])
+
+    def test_analyzer_gather(self):
+        texts = ['This is a pen.', 'That is a book.'] * 10
+        tasks = [self.loop.create_task(aio.analyzer(x)) for x in texts]
+        result = self._run(asyncio.gather(*tasks))
+        self.assertEqual(result, [esanpy.analyzer(x) for x in texts])
+
+    def test_custom_analyzer(self):
+        result = self._run(aio.custom_analyzer('this is a <b>test</b>',
+                                               tokenizer="keyword",
+                                               token_filter=["lowercase"],
+                                               char_filter=["html_strip"]))
+        self.assertEqual(result, ['this is a test'])
+
+    def test_analysis(self):
+        self.assertTrue(self._run(aio.create_analysis('aio_case1',
+                                                      analyzer={
+                                                          "my_analyzer": {
+                                                              "type": "custom",
+                                                              "tokenizer": "whitespace",
+                                                              "filter": ["lowercase"]
+                                                              }
+                                                      })))
+        analysis = self._run(aio.get_analysis('aio_case1'))
+        self.assertTrue('my_analyzer' in analysis.get('analyzer'), "my_analyzer exists.")
+        result = self._run(aio.analyzer('This is a PEN', analyzer='my_analyzer', namespace='aio_case1'))
+        self.assertEqual(result, ['this', 'is', 'a', 'pen'])
+        self._run(aio.delete_analysis('aio_case1'))
+        self.assertTrue(self._run(aio.get_analysis('aio_case1')) is None, "analysis is None.")
+
+
+    def test_shared_paths(self):
+        text = 'This is a pen. That is a book.'
+        esanpy.enable_local()
+        esanpy.local.reset_stats()
+        try:
+            self.assertEqual(self._run(aio.analyzer(text)), esanpy.analyzer(text))
+            self.assertEqual(esanpy.local.stats().get('local'), 2)
+        finally:
+            esanpy.disable_local()
+        esanpy.enable_chunking(max_chars=10)
+        try:
+            self.assertEqual(self._run(aio.analyzer(text, converter=lambda x: x)),
+                             esanpy.analyzer(text, converter=lambda x: x))
+        finally:
+            esanpy.disable_chunking()
+
+    def test_metrics_and_persistent_cache(self):
+        tmp_dir = tempfile.mkdtemp()
+        collector = esanpy.enable_metrics()
+        try:
+            persistent_cache = esanpy.enable_persistent_cache(path=tmp_dir + '/analysis.db')
+            self.assertEqual(self._run(aio.analyzer('This is a pen.')), ['this', 'is', 'a', 'pen'])
+            self.assertEqual(self._run(aio.analyzer('This is a pen.')), ['this', 'is', 'a', 'pen'])
+            self.assertEqual(persistent_cache.stats().get('hits'), 1)
+            counters = collector.snapshot().get('counters')
+            self.assertEqual(counters.get('analyze.count'), 2)
+            self.assertEqual(counters.get('analyze.cache_hits.persistent'), 1)
+        finally:
+            esanpy.disable_persistent_cache()
+            esanpy.disable_metrics()
+            shutil.rmtree(tmp_dir)
+
+    def test_get_analysis_alias(self):
+        managed = esanpy.ManagedAnalysis('aio_managed_case1',
+                                         analyzer={'my_analyzer': {'type': 'custom', 'tokenizer': 'whitespace'}})
+        managed.deploy()
+        try:
+            analysis = self._run(aio.get_analysis('aio_managed_case1'))
+            self.assertEqual(analysis.get('analyzer').get('my_analyzer').get('tokenizer'), 'whitespace')
+        finally:
+            managed.delete()
+
+
+class FakeWriter(object):
+
+    def __init__(self, error=None):
+        self.error = error
+
+    def write(self, data):
+        pass
+
+    def drain(self):
+        if self.error is not None:
+            raise self.error
+        return asyncio.sleep(0)
+
+    def close(self):
+        pass
+
+
+class FakeConnectionPool(object):
+
+    def __init__(self, response=b'', error=None):
+        self.pool = aio.AsyncConnectionPool('localhost', 9299)
+        self.pool._get_connection = self._get_connection
+        self.response = response
+        self.error = error
+        self.connections = 0
+
+    def _get_connection(self):
+        self.connections += 1
+        reader = asyncio.StreamReader()
+        reader.feed_data(self.response)
+        reader.feed_eof()
+        return asyncio.sleep(0, result=(reader, FakeWriter(self.error), self.connections == 1))
+
+
+@unittest.skipIf(sys.version_info < (3, 5), 'asyncio client requires Python 3.5 or above')
+class AsyncConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _request(self, fake):
+        return self.loop.run_until_complete(fake.pool.request('PUT', '/aio_case1', b'{}'))
+
+    def test_retry_closed_connection(self):
+        fake = FakeConnectionPool()
+        self.assertRaises(aio.URLError, self._request, fake)
+        self.assertEqual(fake.connections, 2)
+        fake = FakeConnectionPool(error=ConnectionResetError(errno.ECONNRESET, 'reset'))
+        self.assertRaises(aio.URLError, self._request, fake)
+        self.assertEqual(fake.connections, 2)
+
+    def test_no_retry_after_response(self):
+        fake = FakeConnectionPool(b'HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\n{}')
+        self.assertRaises(aio.URLError, self._request, fake)
+        self.assertEqual(fake.connections, 1)
+        fake = FakeConnectionPool(b'HTTP/1.1 OK\r\n\r\n')
+        self.assertRaises(aio.URLError, self._request, fake)
+        self.assertEqual(fake.connections, 1)
+
+    def test_response(self):
+        fake = FakeConnectionPool(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}')
+        self.assertEqual(self._request(fake)[3], b'{}')
+
+
+@unittest.skipIf(sys.version_info < (3, 5), 'asyncio client requires Python 3.5 or above')
+class AsyncGroupTest(unittest.TestCase):
+
+    def setUp(self):
+        singleflight.reset_stats()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_cancel(self):
+        group = aio.AsyncGroup()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            return asyncio.sleep(0.05, result=['this', 'is', 'a', 'pen'])
+        tasks = [self.loop.create_task(group.do('key', fetch)) for _ in range(4)]
+        self.loop.run_until_complete(asyncio.sleep(0))
+        tasks[0].cancel()
+        results = self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(isinstance(results[0], asyncio.CancelledError))
+        self.assertEqual(results[1:], [['this', 'is', 'a', 'pen']] * 3)
+        self.assertEqual(singleflight.stats(), {'executed': 1, 'shared': 3})
+        self.assertEqual(len(group), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -97,6 +97,31 @@ class AnalyzerTest(unittest.TestCase):
         self.assertEqual([x.get('type') for x in tokens], ['<ALPHANUM>', '<ALPHANUM>'])
         self.assertEqual([x.get('keyword') for x in tokens], [False, False])
 
+    def test_analyze_batch(self):
+        result = esanpy.analyze_batch(['This is a pen.', None, 'That is a book.'],
+                                      analyzer='standard')
+        self.assertEqual(result, [['this', 'is', 'a', 'pen'], [], ['that', 'is', 'a', 'book']])
+
+    def test_analyze_batch_offsets(self):
+        texts = ['今日の天気は晴れです。', 'This is a pen.', 'detailed output']
+        result = esanpy.analyze_batch(texts,
+                                      analyzer='kuromoji',
+                                      converter=lambda x: x.get('tokens'),
+                                      batch_size=2)
+        for text, tokens in zip(texts, result):
+            expected = esanpy.analyzer(text, analyzer='kuromoji',
+                                       converter=lambda x: x.get('tokens'))
+            self.assertEqual([(x.get('token'), x.get('start_offset'), x.get('end_offset')) for x in tokens],
+                             [(x.get('token'), x.get('start_offset'), x.get('end_offset')) for x in expected])
+
+    def test_custom_analyze_batch(self):
+        result = esanpy.custom_analyze_batch(['this is a <b>test</b>', 'THIS IS A PEN'],
+                                             tokenizer="keyword",
+                                             token_filter=["lowercase"],
+                                             char_filter=["html_strip"],
+                                             batch_bytes=16)
+        self.assertEqual(result, [['this is a test'], ['this is a pen']])
+
 
 if __name__ == "__main__":
     unittest.main()
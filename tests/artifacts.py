@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+
+from esanpy import artifacts
+from esanpy.core import EsanpySetupError
+
+
+class ArtifactsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.mirror_dir = self.tmp_dir + '/mirror'
+        self.artifact_home = self.tmp_dir + '/artifacts'
+        os.makedirs(self.mirror_dir)
+        self.zip_file = self.mirror_dir + '/analysis-test-5.6.11.zip'
+        with zipfile.ZipFile(self.zip_file, 'w') as zf:
+            zf.writestr('elasticsearch/plugin-descriptor.properties', 'name=analysis-test\n')
+            zf.writestr('elasticsearch/lib/test.jar', b'0123456789' * 100)
+        with open(self.zip_file, 'rb') as f:
+            self.data = f.read()
+        self.url = 'https://example.com/plugins/analysis-test-5.6.11.zip'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_resolve_url(self):
+        self.assertEqual(artifacts.resolve_url(self.url, 'http://mirror.local/'),
+                         'http://mirror.local/analysis-test-5.6.11.zip')
+        self.assertTrue(artifacts.resolve_url(self.url, self.mirror_dir).startswith('file:'))
+        os.environ.pop(artifacts.MIRROR_ENV, None)
+        self.assertEqual(artifacts.resolve_url(self.url), self.url)
+
+    def test_download_with_checksum(self):
+        with open(self.zip_file + '.sha512', 'wt') as f:
+            f.write(hashlib.sha512(self.data).hexdigest() + '  analysis-test-5.6.11.zip\n')
+        path = self.tmp_dir + '/out.zip'
+        artifacts.download(artifacts.resolve_url(self.url, self.mirror_dir), path)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(os.path.exists(path + '.part'))
+
+    def test_download_checksum_mismatch(self):
+        with open(self.zip_file + '.sha1', 'wt') as f:
+            f.write('0' * 40)
+        path = self.tmp_dir + '/out.zip'
+        self.assertRaises(EsanpySetupError, artifacts.download,
+                          artifacts.resolve_url(self.url, self.mirror_dir), path)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(path + '.part'))
+
+    def test_download_require_checksum(self):
+        self.assertRaises(EsanpySetupError, artifacts.download,
+                          artifacts.resolve_url(self.url, self.mirror_dir), self.tmp_dir + '/out.zip',
+                          require_checksum=True)
+
+    def test_download_restarts_partial_file(self):
+        path = self.tmp_dir + '/out.zip'
+        with open(path + '.part', 'wb') as f:
+            f.write(self.data[0:100])
+        artifacts.download(artifacts.resolve_url(self.url, self.mirror_dir), path,
+                           checksum=('sha1', hashlib.sha1(self.data).hexdigest()))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    @unittest.skipIf(artifacts.fcntl is None, 'fcntl is not available')
+    def test_download_by_another_process(self):
+        path = self.tmp_dir + '/out.zip'
+        missing_url = artifacts.resolve_url(self.url + '.missing', self.mirror_dir)
+        results = []
+        with artifacts._open_part_file(path + '.part') as f:
+            thread = threading.Thread(target=lambda: results.append(
+                artifacts.download(missing_url, path, checksum=('sha1', '0' * 40))))
+            thread.start()
+            time.sleep(0.1)
+            f.write(self.data)
+            f.flush()
+            os.rename(path + '.part', path)
+        thread.join()
+        self.assertEqual(results, [path])
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(os.path.exists(path + '.part'))
+
+    def test_fetch_and_install(self):
+        zip_file, sha1 = artifacts.fetch_artifact(self.url, self.artifact_home, mirror=self.mirror_dir)
+        self.assertEqual(sha1, hashlib.sha1(self.data).hexdigest())
+        extracted_dir = artifacts.extract_artifact(zip_file, sha1, self.artifact_home)
+        self.assertEqual(extracted_dir, self.artifact_home + '/' + sha1)
+
+        plugin_dir = self.tmp_dir + '/plugins/analysis-test-5.6.11'
+        self.assertTrue(artifacts.install_tree(extracted_dir + '/elasticsearch', plugin_dir))
+        self.assertFalse(artifacts.install_tree(extracted_dir + '/elasticsearch', plugin_dir))
+        with open(plugin_dir + '/lib/test.jar', 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789' * 100)
+        self.assertEqual(os.listdir(self.tmp_dir + '/plugins'), ['analysis-test-5.6.11'])
+
+        # cached: the mirror is not needed anymore
+        os.remove(self.zip_file)
+        self.assertEqual(artifacts.fetch_artifact(self.url, self.artifact_home)[1], sha1)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+from logging import getLogger, basicConfig
+import shutil
+import tempfile
+import unittest
+
+import esanpy
+from esanpy import cache
+
+
+class TokenCacheTest(unittest.TestCase):
+
+    def test_lru(self):
+        token_cache = cache.TokenCache(max_entries=2)
+        token_cache.put('url', 'a', ['a'], 1)
+        token_cache.put('url', 'b', ['b'], 1)
+        self.assertEqual(token_cache.get('url', 'a'), ['a'])
+        token_cache.put('url', 'c', ['c'], 1)
+        self.assertEqual(token_cache.get('url', 'b'), None)
+        self.assertEqual(token_cache.get('url', 'c'), ['c'])
+        self.assertEqual(token_cache.stats(), {'hits': 2, 'misses': 1, 'evictions': 1,
+                                               'entries': 2, 'bytes': 2})
+
+    def test_max_bytes(self):
+        token_cache = cache.TokenCache(max_bytes=10)
+        token_cache.put('url', 'a', ['a'], 6)
+        token_cache.put('url', 'b', ['b'], 6)
+        token_cache.put('url', 'c', ['c'], 11)
+        self.assertEqual(len(token_cache), 1)
+        self.assertEqual(token_cache.get('url', 'b'), ['b'])
+
+    def test_invalidate(self):
+        token_cache = cache.TokenCache()
+        token_cache.put('url1', 'a', ['a'], 1)
+        token_cache.put('url2', 'a', ['a'], 1)
+        token_cache.invalidate('url1')
+        self.assertEqual(token_cache.get('url1', 'a'), None)
+        self.assertEqual(token_cache.get('url2', 'a'), ['a'])
+        self.assertEqual(token_cache.size, 1)
+
+    def test_make_key(self):
+        self.assertEqual(cache.make_key({'analyzer': 'standard', 'text': 'a'}),
+                         cache.make_key({'text': 'a', 'analyzer': 'standard'}))
+        self.assertNotEqual(cache.make_key({'analyzer': 'standard', 'text': 'a'}),
+                            cache.make_key({'analyzer': 'standard', 'text': 'b'}))
+
+
+class PersistentCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.persistent_cache = cache.PersistentCache(path=self.cache_dir + '/analysis.db', max_bytes=100)
+
+    def tearDown(self):
+        self.persistent_cache.close()
+        shutil.rmtree(self.cache_dir)
+
+    def test_get_put(self):
+        self.assertEqual(self.persistent_cache.get('a'), None)
+        self.persistent_cache.put('a', b'{"tokens":[]}')
+        self.assertEqual(self.persistent_cache.get('a'), b'{"tokens":[]}')
+        other_cache = cache.PersistentCache(path=self.persistent_cache.path)
+        self.assertEqual(other_cache.get('a'), b'{"tokens":[]}')
+        other_cache.close()
+
+    def test_compact(self):
+        for i in range(10):
+            self.persistent_cache.put(str(i), b'x' * 20)
+        self.assertEqual(self.persistent_cache.compact(), 80)
+        self.assertEqual(self.persistent_cache.get('0'), None)
+        self.assertEqual(self.persistent_cache.get('9'), b'x' * 20)
+
+    def test_make_key(self):
+        url = 'http://localhost:9299/_analyze'
+        key1 = self.persistent_cache.make_key(url, {'analyzer': 'standard', 'text': 'a'})
+        key2 = self.persistent_cache.make_key(url, {'analyzer': 'standard', 'text': 'b'})
+        key3 = self.persistent_cache.make_key(url, {'analyzer': 'kuromoji', 'text': 'a'})
+        self.assertEqual(key1.split(':')[0], key2.split(':')[0])
+        self.assertNotEqual(key1, key2)
+        self.assertNotEqual(key1.split(':')[0], key3.split(':')[0])
+
+    def test_fingerprint_ttl(self):
+        url = 'http://localhost:9299/persistent_case1/_analyze'
+        data = {'analyzer': 'standard', 'text': 'a'}
+        get_namespace_analysis = cache._get_namespace_analysis
+        analysis = {'uuid': 'a'}
+        cache._get_namespace_analysis = lambda namespace, host, http_port: dict(analysis)
+        try:
+            key1 = self.persistent_cache.make_key(url, data)
+            # changed by another process, not invalidated here
+            analysis['uuid'] = 'b'
+            self.assertEqual(self.persistent_cache.make_key(url, data), key1)
+            self.persistent_cache.fingerprint_ttl = 0
+            self.assertNotEqual(self.persistent_cache.make_key(url, data), key1)
+        finally:
+            cache._get_namespace_analysis = get_namespace_analysis
+
+
+class AnalyzerCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        basicConfig()
+        getLogger('esanpy').setLevel(10)
+        esanpy.start_server()
+        esanpy.enable_cache()
+
+    def tearDown(self):
+        esanpy.disable_cache()
+        esanpy.stop_server()
+
+    def test_analyzer_cache(self):
+        self.assertEqual(esanpy.analyzer('This is a pen.'), ['this', 'is', 'a', 'pen'])
+        self.assertEqual(esanpy.analyzer('This is a pen.'), ['this', 'is', 'a', 'pen'])
+        stats = esanpy.cache_stats()
+        self.assertEqual(stats.get('hits'), 1)
+        self.assertEqual(stats.get('misses'), 1)
+
+    def test_cached_result_copy(self):
+        result = esanpy.analyzer('This is a pen.', converter=lambda x: x)
+        result.get('tokens').pop()
+        result = esanpy.analyzer('This is a pen.', converter=lambda x: x)
+        self.assertEqual(len(result.get('tokens')), 4)
+        result.get('tokens')[0]['token'] = 'that'
+        result = esanpy.analyzer('This is a pen.', converter=lambda x: x)
+        self.assertEqual([x.get('token') for x in result.get('tokens')], ['this', 'is', 'a', 'pen'])
+        self.assertEqual(esanpy.cache_stats().get('hits'), 2)
+
+    def test_namespace_invalidation(self):
+        esanpy.create_analysis('cache_case1',
+                               analyzer={"my_analyzer": {"type": "custom",
+                                                         "tokenizer": "whitespace"}})
+        self.assertEqual(esanpy.analyzer('This IS', analyzer='my_analyzer', namespace='cache_case1'),
+                         ['This', 'IS'])
+        esanpy.delete_analysis('cache_case1')
+        esanpy.create_analysis('cache_case1',
+                               analyzer={"my_analyzer": {"type": "custom",
+                                                         "tokenizer": "whitespace",
+                                                         "filter": ["lowercase"]}})
+        self.assertEqual(esanpy.analyzer('This IS', analyzer='my_analyzer', namespace='cache_case1'),
+                         ['this', 'is'])
+        esanpy.delete_analysis('cache_case1')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import unittest
+
+import esanpy
+from esanpy import chunking
+from esanpy.core import EsanpyInvalidArgumentError
+
+
+def _token(token, start_offset, end_offset, position):
+    return {'token': token, 'start_offset': start_offset, 'end_offset': end_offset,
+            'position': position, 'type': '<ALPHANUM>'}
+
+
+class SplitTextTest(unittest.TestCase):
+
+    def test_boundaries(self):
+        text = 'First one. Second one.\n\nThird one. Fourth'
+        self.assertEqual(chunking.split_text(text, max_chars=30), ['First one. Second one.\n\n', 'Third one. Fourth'])
+        self.assertEqual(chunking.split_text(text, max_chars=15), ['First one. ', 'Second one.\n\n', 'Third one. ',
+                                                                   'Fourth'])
+        self.assertEqual(chunking.split_text('aaaa bbbb cccc', max_chars=7), ['aaaa ', 'bbbb ', 'cccc'])
+        self.assertEqual(chunking.split_text('吾輩は猫である。名前はまだ無い。', max_chars=10),
+                         ['吾輩は猫である。', '名前はまだ無い。'])
+        self.assertEqual(chunking.split_text('abcdefg', max_chars=3), ['abc', 'def', 'g'])
+        self.assertEqual(chunking.split_text('short', max_chars=10), ['short'])
+        for max_chars in range(2, 20):
+            self.assertEqual(''.join(chunking.split_text(text, max_chars=max_chars)), text)
+
+    def test_enable(self):
+        self.assertRaises(EsanpyInvalidArgumentError, chunking.enable, max_chars=1)
+        chunking.enable(max_chars=5)
+        try:
+            self.assertTrue(chunking.should_split('abcdef'))
+            self.assertFalse(chunking.should_split('abcde'))
+            self.assertFalse(chunking.should_split(['abcdef']))
+            self.assertFalse(chunking.should_split(None))
+        finally:
+            chunking.disable()
+
+
+class MergeTest(unittest.TestCase):
+
+    def test_merge(self):
+        chunks = ['\U0001F600 is a ', 'pen. ', 'an apple']
+        self.assertEqual(chunking.get_chunk_offsets(chunks), [0, 8, 13])
+        results = [{'tokens': [_token('is', 3, 5, 0), _token('a', 6, 7, 1)]},
+                   {'tokens': []},
+                   {'tokens': [_token('apple', 3, 8, 1)]}]
+        self.assertEqual(chunking.merge_analyze_results(results, chunks),
+                         {'tokens': [_token('is', 3, 5, 0), _token('a', 6, 7, 1), _token('apple', 16, 21, 3)]})
+        self.assertEqual(results[2]['tokens'][0]['start_offset'], 3)
+
+    def test_merge_detail(self):
+        chunks = ['a b ', 'c']
+        results = [{'detail': {'custom_analyzer': True,
+                               'charfilters': [{'name': 'html_strip', 'filtered_text': ['a b ']}],
+                               'tokenizer': {'name': 'whitespace',
+                                             'tokens': [_token('a', 0, 1, 0), _token('b', 2, 3, 1)]},
+                               'tokenfilters': [{'name': 'uppercase',
+                                                 'tokens': [_token('A', 0, 1, 0), _token('B', 2, 3, 1)]}]}},
+                   {'detail': {'custom_analyzer': True,
+                               'charfilters': [{'name': 'html_strip', 'filtered_text': ['c']}],
+                               'tokenizer': {'name': 'whitespace', 'tokens': [_token('c', 0, 1, 0)]},
+                               'tokenfilters': [{'name': 'uppercase', 'tokens': [_token('C', 0, 1, 0)]}]}}]
+        detail = chunking.merge_analyze_results(results, chunks)['detail']
+        self.assertTrue(detail['custom_analyzer'])
+        self.assertEqual(detail['charfilters'], [{'name': 'html_strip', 'filtered_text': ['a b c']}])
+        self.assertEqual(detail['tokenizer']['tokens'][-1], _token('c', 4, 5, 2))
+        self.assertEqual([x['token'] for x in detail['tokenfilters'][0]['tokens']], ['A', 'B', 'C'])
+
+
+class ChunkedAnalyzerTest(unittest.TestCase):
+
+    def setUp(self):
+        esanpy.start_server()
+
+    def tearDown(self):
+        chunking.disable()
+        esanpy.stop_server()
+
+    def test_analyzer(self):
+        text = ' '.join(['This is pen number ' + str(i) + '.' for i in range(200)])
+        expected = esanpy.analyzer(text, converter=lambda x: x)
+        batch_expected = esanpy.analyze_batch(['short text', text])
+        chunking.enable(max_chars=100, max_workers=3)
+        self.assertEqual(esanpy.analyzer(text, converter=lambda x: x), expected)
+        self.assertEqual(esanpy.analyze_batch(['short text', text]), batch_expected)
+
+    def test_template(self):
+        text = ' '.join(['This is pen number ' + str(i) + '.' for i in range(200)])
+        template = esanpy.AnalyzerRegistry().compile('standard')
+        expected = template.analyze(text, converter=lambda x: x)
+        chunking.enable(max_chars=100, max_workers=3)
+        original_split_text = chunking.split_text
+        chunk_counts = []
+
+        def split_text(text, max_chars=None):
+            chunks = original_split_text(text, max_chars)
+            chunk_counts.append(len(chunks))
+            return chunks
+        chunking.split_text = split_text
+        try:
+            self.assertEqual(template.analyze(text, converter=lambda x: x), expected)
+        finally:
+            chunking.split_text = original_split_text
+        self.assertTrue(chunk_counts[0] > 1, chunk_counts)
+
+
+if __name__ == "__main__":
+    unittest.main()
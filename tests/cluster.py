@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+from logging import getLogger, basicConfig
+import unittest
+
+import esanpy
+from esanpy.cluster import AnalysisCluster, LEAST_OUTSTANDING
+from esanpy.core import DEFAULT_HTTP_PORT
+
+
+class AnalysisClusterTest(unittest.TestCase):
+
+    def setUp(self):
+        basicConfig()
+        getLogger('esanpy').setLevel(10)
+        self.nodes = esanpy.start_servers(2)
+
+    def tearDown(self):
+        esanpy.stop_servers(2)
+
+    def test_round_robin(self):
+        cluster = AnalysisCluster(self.nodes)
+        for _ in range(4):
+            self.assertEqual(cluster.analyzer('This is a pen.'), ['this', 'is', 'a', 'pen'])
+        self.assertEqual([x.healthy for x in cluster.nodes], [True, True])
+
+    def test_failover(self):
+        # the unavailable node is picked first with no outstanding requests
+        cluster = AnalysisCluster([('localhost', DEFAULT_HTTP_PORT + 10)] + self.nodes,
+                                  strategy=LEAST_OUTSTANDING, retry_interval=0)
+        for _ in range(4):
+            self.assertEqual(cluster.analyzer('This is a pen.'), ['this', 'is', 'a', 'pen'])
+        self.assertEqual([x.healthy for x in cluster.nodes], [False, True, True])
+
+    def test_analysis(self):
+        cluster = AnalysisCluster(self.nodes)
+        cluster.create_analysis('cluster_case1',
+                                analyzer={"my_analyzer": {"type": "custom",
+                                                          "tokenizer": "whitespace"}})
+        for _ in range(4):
+            self.assertEqual(cluster.analyzer('This is', analyzer='my_analyzer', namespace='cluster_case1'),
+                             ['This', 'is'])
+        cluster.delete_analysis('cluster_case1')
+        self.assertTrue(cluster.get_analysis('cluster_case1') is None, "analysis is None.")
+
+
+if __name__ == "__main__":
+    unittest.main()
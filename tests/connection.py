@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import errno
+from logging import getLogger, basicConfig
+import socket
+import unittest
+
+import esanpy
+from esanpy import connection
+from esanpy.core import DEFAULT_HTTP_PORT
+
+
+try:
+    from http.client import BadStatusLine
+    from urllib.error import URLError
+except ImportError:
+    from httplib import BadStatusLine
+    from urllib2 import URLError
+
+
+class FailingConnection(object):
+
+    def __init__(self, error):
+        self.error = error
+
+    def request(self, method, path, body, headers):
+        raise self.error
+
+    def close(self):
+        pass
+
+
+class FailingConnectionPool(connection.ConnectionPool):
+
+    def __init__(self, error):
+        super(FailingConnectionPool, self).__init__('localhost', 9299)
+        self.error = error
+        self.connections = 0
+
+    def _get_connection(self):
+        self.connections += 1
+        return FailingConnection(self.error), self.connections == 1
+
+
+class RetryTest(unittest.TestCase):
+
+    def test_is_stale_connection(self):
+        self.assertTrue(connection._is_stale_connection(socket.error(errno.ECONNRESET, 'reset')))
+        self.assertTrue(connection._is_stale_connection(socket.error(errno.EPIPE, 'broken pipe')))
+        self.assertTrue(connection._is_stale_connection(BadStatusLine('')))
+        self.assertFalse(connection._is_stale_connection(BadStatusLine('HTTP/1.1 2')))
+        self.assertFalse(connection._is_stale_connection(socket.timeout('timed out')))
+        self.assertFalse(connection._is_stale_connection(socket.error(errno.ECONNREFUSED, 'refused')))
+
+    def test_retry_reset(self):
+        pool = FailingConnectionPool(socket.error(errno.ECONNRESET, 'reset'))
+        self.assertRaises(URLError, pool.request, 'POST', '/_analyze', b'{}')
+        self.assertEqual(pool.connections, 2)
+
+    def test_no_retry_timeout(self):
+        pool = FailingConnectionPool(socket.timeout('timed out'))
+        self.assertRaises(URLError, pool.request, 'POST', '/_analyze', b'{}')
+        self.assertEqual(pool.connections, 1)
+
+
+class ConnectionTest(unittest.TestCase):
+
+    def setUp(self):
+        basicConfig()
+        getLogger('esanpy').setLevel(10)
+        esanpy.start_server()
+
+    def tearDown(self):
+        esanpy.stop_server()
+        connection.close_all()
+
+    def test_connection_reuse(self):
+        for _ in range(10):
+            result = esanpy.analyzer('This is a pen.')
+            self.assertEqual(result, ['this', 'is', 'a', 'pen'])
+        pool = connection.get_pool('localhost', DEFAULT_HTTP_PORT)
+        self.assertEqual(len(pool._idle), 1)
+
+    def test_reconnect_after_clear(self):
+        esanpy.analyzer('This is a pen.')
+        connection.get_pool('localhost', DEFAULT_HTTP_PORT).clear()
+        result = esanpy.analyzer('This is a pen.')
+        self.assertEqual(result, ['this', 'is', 'a', 'pen'])
+
+    def test_idle_timeout(self):
+        connection.configure(idle_timeout=0)
+        try:
+            esanpy.analyzer('This is a pen.')
+            result = esanpy.analyzer('This is a pen.')
+            self.assertEqual(result, ['this', 'is', 'a', 'pen'])
+        finally:
+            connection.configure(idle_timeout=connection.DEFAULT_IDLE_TIMEOUT)
+
+
+if __name__ == "__main__":
+    unittest.main()
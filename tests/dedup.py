@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import threading
+import unittest
+
+import esanpy
+from esanpy import cache
+from esanpy.dedup import Deduplicator
+
+
+URL = 'http://localhost:9299/_analyze'
+
+
+class DeduplicatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = []
+
+    def send(self, texts):
+        self.sent.append(texts)
+        return [{'tokens': [{'token': x}]} for x in texts]
+
+    def test_batch(self):
+        deduplicator = Deduplicator(window=0)
+        results = deduplicator.analyze(URL, {'analyzer': 'standard'}, ['a', 'b', None, 'a', 'a'], self.send)
+        self.assertEqual(self.sent, [['a', 'b']])
+        self.assertEqual([x['tokens'][0]['token'] if x is not None else None for x in results],
+                         ['a', 'b', None, 'a', 'a'])
+        self.assertTrue(results[0] is results[3])
+        deduplicator.analyze(URL, {'analyzer': 'standard'}, ['a'], self.send)
+        self.assertEqual(self.sent, [['a', 'b'], ['a']])
+        self.assertEqual(len(deduplicator), 0)
+
+    def test_window(self):
+        deduplicator = Deduplicator(window=2)
+        deduplicator.analyze(URL, {'analyzer': 'standard'}, ['a', 'b', 'a'], self.send)
+        deduplicator.analyze(URL, {'analyzer': 'standard'}, ['a', 'c'], self.send)
+        # b is the least recently used
+        deduplicator.analyze(URL, {'analyzer': 'standard'}, ['b', 'a'], self.send)
+        deduplicator.analyze(URL, {'analyzer': 'keyword'}, ['a'], self.send)
+        self.assertEqual(self.sent, [['a', 'b'], ['c'], ['b'], ['a']])
+        self.assertEqual(len(deduplicator), 2)
+        self.assertEqual(deduplicator.stats(), {'texts': 8, 'sent': 5, 'batch_duplicates': 1,
+                                                'window_duplicates': 2, 'ratio': 1 - 5 / 8})
+        deduplicator.reset_stats()
+        self.assertEqual(deduplicator.stats()['ratio'], 0.0)
+        deduplicator.clear()
+        self.assertEqual(len(deduplicator), 0)
+
+
+    def test_invalidate_namespace(self):
+        deduplicator = Deduplicator()
+        namespace_url = cache.get_analyze_url('localhost', 9299, 'dedup_case1')
+        deduplicator.analyze(URL, {'analyzer': 'standard'}, ['a'], self.send)
+        deduplicator.analyze(namespace_url, {'analyzer': 'my_analyzer'}, ['a'], self.send)
+        cache.invalidate_namespace('dedup_case1', http_port=9299)
+        self.assertEqual(len(deduplicator), 1)
+        deduplicator.analyze(namespace_url, {'analyzer': 'my_analyzer'}, ['a'], self.send)
+        self.assertEqual(self.sent, [['a'], ['a'], ['a']])
+
+
+    def test_invalidate_in_flight(self):
+        deduplicator = Deduplicator()
+        namespace_url = cache.get_analyze_url('localhost', 9299, 'dedup_case2')
+
+        def send(texts):
+            cache.invalidate_namespace('dedup_case2', http_port=9299)
+            return self.send(texts)
+
+        deduplicator.analyze(namespace_url, {'analyzer': 'my_analyzer'}, ['a'], send)
+        self.assertEqual(len(deduplicator), 0)
+        deduplicator.analyze(namespace_url, {'analyzer': 'my_analyzer'}, ['a'], self.send)
+        self.assertEqual(len(deduplicator), 1)
+
+    def test_in_flight(self):
+        deduplicator = Deduplicator()
+        started = threading.Event()
+        release = threading.Event()
+
+        def send(texts):
+            started.set()
+            release.wait()
+            return self.send(texts)
+
+        results = []
+        thread = threading.Thread(target=lambda: results.append(
+            deduplicator.analyze(URL, {'analyzer': 'standard'}, ['a'], send)))
+        thread.start()
+        started.wait()
+        waiter = threading.Thread(target=lambda: results.append(
+            deduplicator.analyze(URL, {'analyzer': 'standard'}, ['a', 'b'], self.send)))
+        waiter.start()
+        release.set()
+        thread.join()
+        waiter.join()
+        self.assertEqual(sorted(self.sent), [['a'], ['b']])
+        self.assertEqual(deduplicator.stats().get('sent'), 2)
+
+    def test_in_flight_failure(self):
+        deduplicator = Deduplicator()
+        started = threading.Event()
+        release = threading.Event()
+
+        def send(texts):
+            started.set()
+            release.wait()
+            raise IOError('failed')
+
+        errors = []
+        results = []
+
+        def analyze():
+            try:
+                deduplicator.analyze(URL, {'analyzer': 'standard'}, ['a'], send)
+            except IOError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=analyze)
+        thread.start()
+        started.wait()
+        waiter = threading.Thread(target=lambda: results.append(
+            deduplicator.analyze(URL, {'analyzer': 'standard'}, ['a'], self.send)))
+        waiter.start()
+        release.set()
+        thread.join()
+        waiter.join()
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(self.sent, [['a']])
+        self.assertEqual(results[0][0]['tokens'][0]['token'], 'a')
+
+
+class DedupAnalyzeBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        esanpy.start_server()
+
+    def tearDown(self):
+        esanpy.stop_server()
+
+    def test_analyze_batch(self):
+        texts = ['This is a pen.', None, 'This is a pen.', 'That is a book.']
+        deduplicator = Deduplicator()
+        self.assertEqual(esanpy.analyze_batch(texts, deduplicator=deduplicator),
+                         esanpy.analyze_batch(texts))
+        stream = esanpy.TokenStream()
+        esanpy.analyze_batch(texts, converter=stream.append, deduplicator=deduplicator)
+        self.assertEqual(list(stream), [['this', 'is', 'a', 'pen'], ['this', 'is', 'a', 'pen'],
+                                        ['that', 'is', 'a', 'book']])
+        self.assertEqual(esanpy.custom_analyze_batch(texts, tokenizer='whitespace', deduplicator=deduplicator),
+                         [['This', 'is', 'a', 'pen.'], [], ['This', 'is', 'a', 'pen.'], ['That', 'is', 'a', 'book.']])
+        self.assertEqual(deduplicator.stats()['sent'], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import json
+import unittest
+
+import esanpy
+from esanpy import definitions
+from esanpy import singleflight
+from esanpy.core import EsanpyInvalidArgumentError
+
+
+class ValidationTest(unittest.TestCase):
+
+    def test_validate_namespace(self):
+        definitions.validate_namespace('my_analyzers')
+        for namespace in ['', 'Upper', '_private', 'a b', 'a/b', '..']:
+            self.assertRaises(EsanpyInvalidArgumentError, definitions.validate_namespace, namespace)
+
+    def test_validate_analysis(self):
+        definitions.validate_analysis('case1',
+                                      char_filter={'my_mapping': {'type': 'mapping', 'mappings': ['a => b']}},
+                                      token_filter={'my_stop': {'type': 'stop', 'stopwords': ['foo']}},
+                                      analyzer={'my_analyzer': {'type': 'custom',
+                                                                'tokenizer': 'kuromoji_tokenizer',
+                                                                'char_filter': ['my_mapping', 'html_strip'],
+                                                                'filter': 'lowercase, my_stop'},
+                                                'my_standard': {'type': 'standard', 'max_token_length': 5}})
+
+    def test_validate_analysis_errors(self):
+        try:
+            definitions.validate_analysis('case2',
+                                          analyzer={'my_analyzer': {'type': 'custom',
+                                                                    'char_filter': ['xxx'],
+                                                                    'tokenizer': 'yyy',
+                                                                    'filter': ['zzz']},
+                                                    'my_other': {'type': 'unknown'}})
+            self.fail('EsanpyInvalidArgumentError should be thrown.')
+        except EsanpyInvalidArgumentError as e:
+            message = str(e)
+        for name in ['"xxx"', '"yyy"', '"zzz"', '"unknown"']:
+            self.assertTrue(name in message, message)
+        self.assertRaises(EsanpyInvalidArgumentError, definitions.validate_analysis,
+                          'case2', tokenizer={'my_tokenizer': {'mode': 'normal'}})
+        self.assertRaises(EsanpyInvalidArgumentError, definitions.validate_analysis,
+                          'case2', analyzer={'my_analyzer': {'type': 'custom'}})
+
+    def test_template_prefix(self):
+        template = definitions.AnalyzeTemplate({'analyzer': 'standard'}, http_port=9200, namespace='case1')
+        self.assertEqual(template.url, 'http://localhost:9200/case1/_analyze')
+        self.assertEqual(template.path, '/case1/_analyze')
+        body = template.prefix + esanpy.serializer.dumps('This is a pen.') + b'}'
+        self.assertEqual(json.loads(body.decode('utf-8')), {'analyzer': 'standard', 'text': 'This is a pen.'})
+        self.assertEqual(definitions.AnalyzeTemplate({}).prefix, b'{"text":')
+
+
+class AnalyzerRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        esanpy.start_server()
+        self.registry = esanpy.AnalyzerRegistry()
+
+    def tearDown(self):
+        esanpy.stop_server()
+
+    def test_register(self):
+        self.assertTrue(self.registry.register('registry_case1',
+                                               analyzer={'my_analyzer': {'type': 'custom',
+                                                                         'tokenizer': 'whitespace',
+                                                                         'filter': ['lowercase']}}))
+        try:
+            self.assertEqual(self.registry.get_analyzer_names('registry_case1'), ['my_analyzer'])
+            self.assertEqual(self.registry.analyzer('This is a PEN.', analyzer='my_analyzer',
+                                                    namespace='registry_case1'),
+                             ['this', 'is', 'a', 'pen.'])
+            template = self.registry.compile('my_analyzer', namespace='registry_case1')
+            self.assertTrue(template is self.registry.compile('my_analyzer', namespace='registry_case1'))
+            self.assertRaises(EsanpyInvalidArgumentError, self.registry.compile,
+                              'xxx', namespace='registry_case1')
+        finally:
+            self.registry.unregister('registry_case1')
+        self.assertTrue(self.registry.get_analysis('registry_case1') is None)
+        self.assertRaises(EsanpyInvalidArgumentError, self.registry.compile,
+                          'my_analyzer', namespace='registry_case1')
+
+    def test_analyzer(self):
+        self.assertEqual(self.registry.analyzer('This is a pen.'), ['this', 'is', 'a', 'pen'])
+        self.assertEqual(self.registry.custom_analyzer('This is a pen.', tokenizer='whitespace'),
+                         ['This', 'is', 'a', 'pen.'])
+        self.assertRaises(EsanpyInvalidArgumentError, self.registry.custom_analyzer,
+                          'This is a pen.', tokenizer='xxx')
+
+
+    def test_template_singleflight(self):
+        template = self.registry.compile('standard')
+        singleflight.reset_stats()
+        singleflight.enable()
+        try:
+            self.assertEqual(template.analyze('This is a pen.'), ['this', 'is', 'a', 'pen'])
+        finally:
+            singleflight.disable()
+        self.assertEqual(singleflight.stats(), {'executed': 1, 'shared': 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -92,6 +92,39 @@ class ElasticsearchTest(unittest.TestCase):
             print(e)
         esanpy.get_analysis('case2')
 
+    def test_apply_analyses(self):
+        spec = {'apply_case1': {'analyzer': {'my_analyzer': {'type': 'custom',
+                                                             'tokenizer': 'whitespace',
+                                                             'filter': ['lowercase']}}},
+                'apply_case2': {'tokenizer': {'my_tokenizer': {'type': 'standard',
+                                                               'max_token_length': 5}},
+                                'analyzer': {'my_analyzer': {'tokenizer': 'my_tokenizer'}}}}
+        result = esanpy.apply_analyses(spec)
+        self.assertEqual(result.get('created'), ['apply_case1', 'apply_case2'])
+        self.assertEqual(esanpy.apply_analyses(spec).get('unchanged'), ['apply_case1', 'apply_case2'])
+
+        spec['apply_case1']['analyzer']['my_standard'] = {'type': 'standard'}
+        spec['apply_case2'] = None
+        result = esanpy.apply_analyses(spec)
+        self.assertEqual(result.get('updated'), ['apply_case1'])
+        self.assertEqual(result.get('deleted'), ['apply_case2'])
+        self.assertTrue('my_standard' in esanpy.get_analysis('apply_case1').get('analyzer'))
+        self.assertTrue(esanpy.get_analysis('apply_case2') is None)
+        self.assertEqual(esanpy.analyzer('This is a PEN.', analyzer='my_analyzer', namespace='apply_case1'),
+                         ['this', 'is', 'a', 'pen.'])
+
+        esanpy.apply_analyses({'apply_case1': None})
+        self.assertTrue(esanpy.get_analysis('apply_case1') is None)
+
+    def test_startup_timings(self):
+        esanpy.stop_server()
+        esanpy.start_server()
+        timings = esanpy.get_startup_timings()
+        for phase in ('probe', 'setup', 'spawn', 'port_open', 'cluster_yellow', 'total'):
+            self.assertTrue(phase in timings, phase + " exists.")
+        esanpy.start_server()
+        self.assertEqual(sorted(esanpy.get_startup_timings().keys()), ['probe', 'total'])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+from logging import getLogger, basicConfig
+import unittest
+
+import esanpy
+from esanpy.executor import AnalysisExecutor
+
+
+try:
+    from urllib.error import URLError
+except ImportError:
+    from urllib2 import URLError
+
+
+class AnalysisExecutorTest(unittest.TestCase):
+
+    def setUp(self):
+        basicConfig()
+        getLogger('esanpy').setLevel(10)
+        esanpy.start_server()
+        self.texts = ['This is a pen.', 'That is a book.', None, 'detailed output'] * 5
+        self.expected = [esanpy.analyzer(x) for x in self.texts]
+
+    def tearDown(self):
+        esanpy.stop_server()
+
+    def test_analyzer_ordered(self):
+        with AnalysisExecutor(max_workers=4, max_in_flight=2) as executor:
+            result = list(executor.analyzer(iter(self.texts)))
+        self.assertEqual(result, self.expected)
+
+    def test_analyzer_unordered(self):
+        with AnalysisExecutor(max_workers=4) as executor:
+            result = dict(executor.analyzer(self.texts, ordered=False))
+        self.assertEqual([result[i] for i in range(len(self.texts))], self.expected)
+
+    def test_analyzer_batch(self):
+        with AnalysisExecutor(max_workers=2) as executor:
+            result = list(executor.analyzer(self.texts, batch_size=3))
+        self.assertEqual(result, self.expected)
+
+    def test_custom_analyzer_batch_unordered(self):
+        with AnalysisExecutor(max_workers=2) as executor:
+            result = dict(executor.custom_analyzer(self.texts, ordered=False, batch_size=3,
+                                                   tokenizer="standard", token_filter=["lowercase"]))
+        self.assertEqual([result[i] for i in range(len(self.texts))], self.expected)
+
+    def test_retry(self):
+        calls = []
+
+        def flaky(value):
+            calls.append(value)
+            if len(calls) < 3:
+                raise URLError('connection refused')
+            return value
+
+        with AnalysisExecutor(max_workers=1, retry_interval=0.01) as executor:
+            self.assertEqual(executor.submit(flaky, 1).result(), 1)
+        self.assertEqual(len(calls), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import pickle
+import unittest
+
+import esanpy
+from esanpy import features
+from esanpy.features import HashedFeatures, Vocabulary
+
+
+def _result(*tokens):
+    return {'tokens': [{'token': x, 'start_offset': 0, 'end_offset': len(x), 'position': i, 'type': '<ALPHANUM>'}
+                       for i, x in enumerate(tokens)]}
+
+
+class HashedFeaturesTest(unittest.TestCase):
+
+    def test_hash_feature(self):
+        column, sign = features.hash_feature('pen', 16)
+        self.assertEqual((column, sign), features.hash_feature('pen', 16))
+        self.assertTrue(0 <= column < 16)
+        self.assertTrue(sign in (1, -1))
+
+    def test_get_ngrams(self):
+        tokens = ['this', 'is', 'a', 'pen']
+        self.assertTrue(features.get_ngrams(tokens) is tokens)
+        self.assertEqual(features.get_ngrams(tokens, (1, 2)),
+                         ['this', 'is', 'a', 'pen', 'this is', 'is a', 'a pen'])
+        self.assertEqual(features.get_ngrams(tokens, (3, 3)), ['this is a', 'is a pen'])
+        self.assertEqual(features.get_ngrams(['a'], (2, 2)), [])
+
+    def test_append(self):
+        hashed = HashedFeatures(n_features=1024)
+        self.assertEqual(hashed.append(_result('pen', 'is', 'pen')), 0)
+        self.assertEqual(hashed.append_tokens([]), 1)
+        self.assertEqual(hashed.append_tokens(['pen']), 2)
+        self.assertEqual(len(hashed), 3)
+        self.assertEqual(hashed.shape, (3, 1024))
+        pen = features.hash_feature('pen', 1024)[0]
+        is_ = features.hash_feature('is', 1024)[0]
+        self.assertEqual(hashed.get_row(0), {pen: 2.0, is_: 1.0})
+        self.assertEqual(hashed.get_row(1), {})
+        self.assertEqual(hashed.get_row(-1), {pen: 1.0})
+        self.assertEqual(list(hashed.indptr), [0, 2, 2, 3])
+        self.assertEqual(list(hashed.indices[0:2]), sorted([pen, is_]))
+        self.assertEqual(hashed.nnz, 3)
+        self.assertEqual(list(pickle.loads(pickle.dumps(hashed))), list(hashed))
+
+    def test_options(self):
+        binary = HashedFeatures(n_features=1024, binary=True, ngram_range=(1, 2))
+        binary.append_tokens(['a', 'a', 'b'])
+        self.assertEqual(sorted(binary.get_row(0).values()), [1.0, 1.0, 1.0, 1.0])
+        signed = HashedFeatures(n_features=1024, alternate_sign=True)
+        signed.append_tokens(['a', 'a'])
+        column, sign = features.hash_feature('a', 1024)
+        self.assertEqual(signed.get_row(0), {column: 2.0 * sign})
+
+
+class VocabularyTest(unittest.TestCase):
+
+    def test_counts(self):
+        vocabulary = Vocabulary()
+        vocabulary.append(_result('pen', 'is', 'pen'))
+        vocabulary.append_tokens(['pen', 'apple'])
+        self.assertEqual(vocabulary.num_docs, 2)
+        self.assertEqual(vocabulary.get_df('pen'), 2)
+        self.assertEqual(vocabulary.get_tf('pen'), 3)
+        self.assertEqual(vocabulary.get_df('xxx'), 0)
+        self.assertEqual(vocabulary.most_common(2), [('pen', 2), ('apple', 1)])
+        self.assertEqual(vocabulary.to_index(), {'pen': 0, 'apple': 1, 'is': 2})
+        self.assertEqual(vocabulary.to_index(min_df=2), {'pen': 0})
+
+        other = Vocabulary()
+        other.append_tokens(['is'])
+        vocabulary.update(other)
+        self.assertEqual(vocabulary.num_docs, 3)
+        self.assertEqual(vocabulary.get_df('is'), 2)
+
+    def test_prune(self):
+        vocabulary = Vocabulary(max_terms=2)
+        vocabulary.append_tokens(['a', 'b'])
+        vocabulary.append_tokens(['a', 'c'])
+        vocabulary.append_tokens(['a', 'd', 'e'])
+        self.assertEqual(len(vocabulary), 2)
+        self.assertEqual(vocabulary.num_pruned, 3)
+        self.assertTrue('a' in vocabulary)
+
+
+class IterFeaturesTest(unittest.TestCase):
+
+    def setUp(self):
+        esanpy.start_server()
+
+    def tearDown(self):
+        esanpy.stop_server()
+
+    def test_iter_features(self):
+        texts = ['This is a pen.', 'This is an apple.', None, 'Pen pen.']
+        vocabulary = Vocabulary()
+        chunks = list(features.iter_features(iter(texts), n_features=1024, vocabulary=vocabulary,
+                                             chunk_size=3, batch_size=2))
+        self.assertEqual([len(x) for x in chunks], [3, 1])
+        pen = features.hash_feature('pen', 1024)[0]
+        self.assertEqual(chunks[0].get_row(2), {})
+        self.assertEqual(chunks[1].get_row(0), {pen: 2.0})
+        self.assertEqual(vocabulary.num_docs, 4)
+        self.assertEqual(vocabulary.get_df('this'), 2)
+        self.assertEqual(vocabulary.get_tf('pen'), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from esanpy import elasticsearch
+from esanpy import instances
+
+
+class InstancesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.home = os.environ.get('HOME')
+        self.tmp_dir = tempfile.mkdtemp()
+        os.environ['HOME'] = self.tmp_dir
+
+    def tearDown(self):
+        os.environ['HOME'] = self.home
+        shutil.rmtree(self.tmp_dir)
+
+    def test_instances_home(self):
+        get_esanalyzer_home = elasticsearch.get_esanalyzer_home
+        elasticsearch.get_esanalyzer_home = lambda: self.tmp_dir + '/custom'
+        try:
+            self.assertEqual(instances.get_lock_file(9299), self.tmp_dir + '/custom/instances/9299.lock')
+            with instances.lock(9299):
+                instances.register(9299, os.getpid(), esrunner_version='5.6.3.0')
+            self.assertTrue(os.path.exists(self.tmp_dir + '/custom/instances/9299.json'))
+        finally:
+            elasticsearch.get_esanalyzer_home = get_esanalyzer_home
+
+    def test_attach_detach(self):
+        dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+        dead.wait()
+        with instances.lock(9299):
+            self.assertEqual(instances.attach(9299), 0)
+            instances.register(9299, os.getpid(), esrunner_version='5.6.3.0')
+            self.assertEqual(instances.attach(9299), 1)
+            self.assertEqual(instances.attach(9299), 1)
+            self.assertEqual(instances.attach(9299, pid=dead.pid), 2)
+            # exited clients are not counted
+            self.assertEqual(instances.get_clients(instances.get_instance(9299)), [os.getpid()])
+            self.assertEqual(instances.get_idle_seconds(instances.get_instance(9299)), 0)
+            self.assertEqual(instances.detach(9299), 0)
+            self.assertTrue(instances.get_instance(9299).get('idle_since') is not None)
+        self.assertEqual([x.get('http_port') for x in instances.get_instances()], [9299])
+        instances.remove_instance(9299)
+        self.assertEqual(instances.get_instance(9299), None)
+
+    def test_terminate(self):
+        p = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+        self.assertTrue(instances.is_alive(p.pid))
+        self.assertTrue(instances.terminate(p.pid, timeout=10))
+        self.assertFalse(instances.is_alive(p.pid))
+
+    def test_terminate_kill(self):
+        p = subprocess.Popen([sys.executable, '-c',
+                              'import signal, sys, time; signal.signal(signal.SIGTERM, signal.SIG_IGN);'
+                              'sys.stdout.write("ready\\n"); sys.stdout.flush(); time.sleep(60)'],
+                             stdout=subprocess.PIPE)
+        p.stdout.readline()
+        self.assertFalse(instances.terminate(p.pid, timeout=0.5))
+        p.wait()
+        p.stdout.close()
+        self.assertFalse(instances.is_alive(p.pid))
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from esanpy import jvm
+from esanpy.core import DEFAULT_HEAP_SIZE, EsanpyInvalidArgumentError
+
+
+class JvmTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_default_profile(self):
+        profile = jvm.get_profile()
+        self.assertEqual(profile.get('name'), 'default')
+        self.assertEqual(jvm.get_jvm_args(profile), ['-Xmx' + DEFAULT_HEAP_SIZE])
+        self.assertEqual(jvm.get_node_settings(profile), {})
+        self.assertEqual(jvm.get_java(profile), 'java')
+
+    def test_presets(self):
+        profile = jvm.get_profile('low-memory')
+        args = jvm.get_jvm_args(profile)
+        self.assertEqual(args[0:3], ['-Xms128m', '-Xmx128m', '-XX:+UseSerialGC'])
+        self.assertEqual(jvm.get_node_settings(profile), {'thread_pool.index.size': 1,
+                                                          'thread_pool.index.queue_size': 200})
+        self.assertTrue('-XX:+UseG1GC' in jvm.get_jvm_args(jvm.get_profile('throughput')))
+
+    def test_overrides(self):
+        profile = jvm.get_profile({'name': 'throughput', 'system_properties': {'file.encoding': 'UTF-8'},
+                                   'settings': {'indices.fielddata.cache.size': '10%'}},
+                                  heap_max='512m', gc='parallel')
+        args = jvm.get_jvm_args(profile)
+        self.assertEqual(args[0:3], ['-Xms512m', '-Xmx512m', '-XX:+UseParallelGC'])
+        self.assertTrue('-Dfile.encoding=UTF-8' in args)
+        self.assertEqual(jvm.get_node_settings(profile).get('indices.fielddata.cache.size'), '10%')
+        self.assertEqual(jvm.get_profile('low-memory', heap_max='1g').get('heap_min'), '128m')
+
+    def test_invalid_profiles(self):
+        self.assertRaises(EsanpyInvalidArgumentError, jvm.get_profile, 'unknown')
+        self.assertRaises(EsanpyInvalidArgumentError, jvm.get_profile, {'heap': '1g'})
+        self.assertRaises(EsanpyInvalidArgumentError, jvm.get_profile, None, heap_max='1gb')
+        self.assertRaises(EsanpyInvalidArgumentError, jvm.get_profile, None, gc='zgc')
+        self.assertRaises(EsanpyInvalidArgumentError, jvm.get_profile, {'jvm_options': ['Xss1m']})
+        self.assertRaises(EsanpyInvalidArgumentError, jvm.get_java, {'java_home': self.tmp_dir})
+
+    def test_load_profile(self):
+        self.assertEqual(jvm.load_profile('throughput'), 'throughput')
+        self.assertEqual(jvm.load_profile('{"heap_max": "2g"}'), {'heap_max': '2g'})
+        profile_file = self.tmp_dir + '/profile.json'
+        with open(profile_file, 'wt') as f:
+            json.dump({'name': 'low-memory', 'gc': 'g1'}, f)
+        self.assertEqual(jvm.get_profile(jvm.load_profile(profile_file)).get('gc'), 'g1')
+        self.assertRaises(EsanpyInvalidArgumentError, jvm.load_profile, self.tmp_dir + '/missing.json')
+
+    def test_write_node_settings(self):
+        jvm.write_node_settings(self.tmp_dir, 2, {'thread_pool.index.size': 4})
+        for node_number in (1, 2):
+            with open(jvm.get_node_config_file(self.tmp_dir, node_number), 'rt') as f:
+                self.assertEqual(f.read().splitlines()[1:], ['thread_pool.index.size: 4'])
+        jvm.write_node_settings(self.tmp_dir, 2, {})
+        self.assertFalse(os.path.exists(jvm.get_node_config_file(self.tmp_dir, 1)))
+
+
+if __name__ == "__main__":
+    unittest.main()
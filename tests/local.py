@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import unittest
+
+from esanpy import local
+
+
+def analyze(**data):
+    result = local.analyze(data)
+    if result is None:
+        return None
+    return [(x['token'], x['start_offset'], x['end_offset'], x['position']) for x in result['tokens']]
+
+
+class LocalTest(unittest.TestCase):
+
+    def setUp(self):
+        local.reset_stats()
+
+    def test_standard(self):
+        self.assertEqual(analyze(analyzer='standard', text="This is a pen. I'm U.S.A 3.14 foo_bar e-mail"),
+                         [('this', 0, 4, 0), ('is', 5, 7, 1), ('a', 8, 9, 2), ('pen', 10, 13, 3),
+                          ("i'm", 15, 18, 4), ('u.s.a', 19, 24, 5), ('3.14', 25, 29, 6),
+                          ('foo_bar', 30, 37, 7), ('e', 38, 39, 8), ('mail', 40, 44, 9)])
+        result = local.analyze({'analyzer': 'standard', 'text': 'pen 1,000'})
+        self.assertEqual([x['type'] for x in result['tokens']], ['<ALPHANUM>', '<NUM>'])
+
+    def test_whitespace_keyword_letter(self):
+        self.assertEqual(analyze(analyzer='whitespace', text='Foo  Bar-baz'),
+                         [('Foo', 0, 3, 0), ('Bar-baz', 5, 12, 1)])
+        self.assertEqual(analyze(tokenizer='keyword', filter=['lowercase'], text='Foo Bar'),
+                         [('foo bar', 0, 7, 0)])
+        self.assertEqual(analyze(analyzer='simple', text='Foo1bar'),
+                         [('foo', 0, 3, 0), ('bar', 4, 7, 1)])
+
+    def test_stop(self):
+        self.assertEqual(analyze(analyzer='stop', text='The quick fox is in the box'),
+                         [('quick', 4, 9, 1), ('fox', 10, 13, 2), ('box', 24, 27, 6)])
+        self.assertEqual(analyze(tokenizer='whitespace',
+                                 filter=[{'type': 'stop', 'stopwords': ['foo'], 'ignore_case': True}],
+                                 text='FOO bar'),
+                         [('bar', 4, 7, 1)])
+        self.assertEqual(analyze(tokenizer='whitespace',
+                                 filter=[{'type': 'stop', 'stopwords': ['foo'], 'remove_trailing': True}],
+                                 text='bar foo'),
+                         [('bar', 0, 3, 0)])
+
+    def test_stop_fallback(self):
+        # SuggestStopFilter and named sets in a list are left to the server
+        self.assertIsNone(analyze(tokenizer='whitespace',
+                                  filter=[{'type': 'stop', 'stopwords': ['foo'], 'remove_trailing': False}],
+                                  text='bar foo'))
+        self.assertIsNone(analyze(tokenizer='whitespace',
+                                  filter=[{'type': 'stop', 'stopwords': ['_english_', 'foo']}],
+                                  text='the foo bar'))
+
+    def test_mapping_char_filter(self):
+        char_filter = [{'type': 'mapping', 'mappings': ['ph => f', 'x => ks', 'aa =>']}]
+        self.assertEqual(analyze(tokenizer='standard', char_filter=char_filter, text='phone xa aab'),
+                         [('fone', 0, 5, 0), ('ksa', 6, 8, 1), ('b', 11, 12, 2)])
+
+    def test_html_strip_char_filter(self):
+        self.assertEqual(analyze(tokenizer='keyword', char_filter=['html_strip'],
+                                 text='<b>Foo</b> &amp; Bar'),
+                         [('Foo & Bar', 3, 20, 0)])
+        self.assertIsNone(analyze(tokenizer='keyword', char_filter=['html_strip'], text='<p>Foo</p>'))
+
+    def test_utf16_offsets(self):
+        self.assertEqual(analyze(analyzer='whitespace', text='\U0001F600x y'),
+                         [('\U0001F600x', 0, 3, 0), ('y', 4, 5, 1)])
+
+    def test_fallback(self):
+        self.assertIsNone(analyze(analyzer='kuromoji', text='foo'))
+        self.assertIsNone(analyze(analyzer='standard', text='今日'))
+        self.assertIsNone(analyze(analyzer='standard', text='a' * 256))
+        self.assertIsNone(analyze(analyzer='standard', text=['foo', 'bar']))
+        self.assertIsNone(analyze(tokenizer='standard', filter=['asciifolding'], text='foo'))
+        self.assertIsNone(local.get_analyzer({'analyzer': 'standard', 'attributes': ['keyword']}))
+        self.assertEqual(local.stats()['fallback'], 5)
+
+    def test_check(self):
+        result = local.analyze({'analyzer': 'whitespace', 'text': 'foo'})
+        self.assertTrue(local.check({}, result, {'tokens': list(result['tokens'])}))
+        self.assertFalse(local.check({}, result, {'tokens': []}))
+        self.assertEqual(local.stats()['mismatches'], 1)
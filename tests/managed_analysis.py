@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import esanpy
+from esanpy.core import EsanpyIndexExistError, EsanpyInvalidArgumentError
+
+
+class ManagedAnalysisTest(unittest.TestCase):
+
+    def setUp(self):
+        esanpy.start_server()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.mapping_file = self.tmp_dir + '/mapping.txt'
+        self.write_mapping('"foo" => "bar"\n')
+        self.managed = esanpy.ManagedAnalysis('managed_case1',
+                                              char_filter={'my_mapping': {'type': 'mapping',
+                                                                          'mappings_path': self.mapping_file}},
+                                              analyzer={'my_analyzer': {'type': 'custom',
+                                                                        'tokenizer': 'whitespace',
+                                                                        'char_filter': ['my_mapping']}})
+
+    def tearDown(self):
+        self.managed.delete()
+        shutil.rmtree(self.tmp_dir)
+        esanpy.stop_server()
+
+    def write_mapping(self, text):
+        with open(self.mapping_file, 'w') as f:
+            f.write(text)
+
+    def test_deploy(self):
+        self.assertTrue(self.managed.deploy())
+        self.assertFalse(self.managed.deploy())
+        first_index = self.managed.get_current_index()
+        self.assertEqual(esanpy.analyzer('foo baz', analyzer='my_analyzer', namespace='managed_case1'),
+                         ['bar', 'baz'])
+
+        self.write_mapping('"foo" => "qux"\n')
+        self.assertTrue(self.managed.check())
+        self.assertNotEqual(self.managed.get_current_index(), first_index)
+        self.assertEqual(esanpy.analyzer('foo baz', analyzer='my_analyzer', namespace='managed_case1'),
+                         ['qux', 'baz'])
+        self.assertEqual(len(self.managed.get_versions()), 2)
+
+        self.write_mapping('"foo" => "quux"\n')
+        self.assertTrue(self.managed.check())
+        self.assertEqual(len(self.managed.get_versions()), 2)
+        self.assertFalse(first_index in self.managed.get_versions())
+
+    def test_persistent_cache(self):
+        persistent_cache = esanpy.enable_persistent_cache(path=self.tmp_dir + '/analysis.db')
+        try:
+            url = esanpy.cache.get_analyze_url('localhost', 9299, 'managed_case1')
+            data = {'analyzer': 'my_analyzer', 'text': 'foo baz'}
+            self.managed.deploy()
+            first_key = persistent_cache.make_key(url, data)
+            esanpy.analyzer('foo baz', analyzer='my_analyzer', namespace='managed_case1')
+            self.assertTrue(persistent_cache.get(first_key) is not None)
+
+            self.write_mapping('"foo" => "qux"\n')
+            self.assertTrue(self.managed.check())
+            self.assertNotEqual(persistent_cache.make_key(url, data), first_key)
+            self.assertEqual(esanpy.analyzer('foo baz', analyzer='my_analyzer', namespace='managed_case1'),
+                             ['qux', 'baz'])
+        finally:
+            esanpy.disable_persistent_cache()
+
+    def test_existing_index(self):
+        esanpy.create_analysis('managed_case2')
+        try:
+            self.assertRaises(EsanpyIndexExistError, esanpy.ManagedAnalysis('managed_case2').deploy)
+        finally:
+            esanpy.delete_analysis('managed_case2')
+
+    def test_missing_resource(self):
+        self.assertRaises(EsanpyInvalidArgumentError, esanpy.ManagedAnalysis, 'managed_case3',
+                          tokenizer={'my_tokenizer': {'type': 'kuromoji_tokenizer',
+                                                      'user_dictionary': self.tmp_dir + '/missing.txt'}})
+
+
+if __name__ == "__main__":
+    unittest.main()
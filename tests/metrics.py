@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+from logging import getLogger, basicConfig
+import unittest
+
+import esanpy
+from esanpy import metrics
+
+
+class MetricsCollectorTest(unittest.TestCase):
+
+    def tearDown(self):
+        metrics.disable()
+
+    def test_collect(self):
+        collector = metrics.MetricsCollector()
+        collector('http.request', {'status': 200, 'sent_bytes': 10, 'received_bytes': 100,
+                                   'connect_seconds': None, 'total_seconds': 0.002})
+        collector('http.request', {'status': 404, 'sent_bytes': 5, 'received_bytes': 50,
+                                   'total_seconds': 0.02})
+        collector('analyze', {'cache': 'memory', 'total_seconds': 0.0001})
+        snapshot = collector.snapshot()
+        self.assertEqual(snapshot['counters'], {'http.request.count': 2,
+                                                'http.request.sent_bytes': 15,
+                                                'http.request.received_bytes': 150,
+                                                'http.request.errors.404': 1,
+                                                'analyze.count': 1,
+                                                'analyze.cache_hits.memory': 1})
+        histogram = snapshot['histograms']['http.request.total_seconds']
+        self.assertEqual(histogram['count'], 2)
+        self.assertEqual(histogram['max'], 0.02)
+        self.assertEqual(sum(x[1] for x in histogram['buckets']), 2)
+        self.assertFalse('http.request.connect_seconds' in snapshot['histograms'])
+
+    def test_trace(self):
+        events = []
+        self.assertFalse(metrics.enabled)
+        with metrics.trace('test') as values:
+            values['sent_bytes'] = 1
+        self.assertEqual(events, [])
+
+        hook = lambda name, values: events.append((name, values))
+        metrics.add_hook(hook)
+        try:
+            self.assertTrue(metrics.enabled)
+            with metrics.trace('test', namespace='ns') as values:
+                values['sent_bytes'] = 1
+            try:
+                with metrics.trace('test'):
+                    raise ValueError('error')
+            except ValueError:
+                pass
+        finally:
+            metrics.remove_hook(hook)
+        self.assertFalse(metrics.enabled)
+        self.assertEqual([x[0] for x in events], ['test', 'test'])
+        self.assertEqual(events[0][1].get('namespace'), 'ns')
+        self.assertEqual(events[0][1].get('sent_bytes'), 1)
+        self.assertEqual(events[1][1].get('error'), 'ValueError')
+
+    def test_traced(self):
+        collector = metrics.enable()
+
+        @metrics.traced('fn')
+        def fn(x):
+            return x * 2
+        self.assertEqual(fn(2), 4)
+        self.assertEqual(collector.snapshot()['counters'], {'fn.count': 1})
+        metrics.disable()
+        self.assertEqual(fn(3), 6)
+        self.assertEqual(metrics.snapshot(), {'counters': {}, 'histograms': {}})
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        basicConfig()
+        getLogger('esanpy').setLevel(10)
+        esanpy.start_server()
+        esanpy.enable_metrics()
+
+    def tearDown(self):
+        esanpy.disable_metrics()
+        esanpy.stop_server()
+
+    def test_analyzer(self):
+        metrics.reset()
+        tokens = esanpy.analyzer("This is a pen.")
+        self.assertEqual(tokens, ['this', 'is', 'a', 'pen'])
+        snapshot = metrics.snapshot()
+        counters = snapshot['counters']
+        self.assertEqual(counters['analyze.count'], 1)
+        self.assertEqual(counters['http.request.count'], 1)
+        self.assertTrue(counters['http.request.received_bytes'] > 0)
+        self.assertTrue('http.request.ttfb_seconds' in snapshot['histograms'])
+        self.assertTrue('analyze.deserialize_seconds' in snapshot['histograms'])
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import json
+import unittest
+
+from esanpy import serializer
+from esanpy.core import EsanpyInvalidArgumentError
+
+
+class SerializerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.serializer_name = serializer.get_serializer().name
+        self.tokens = ['this', '"token":"x"', 'back\\slash', '今日', ' ', 'token']
+        self.body = json.dumps({'tokens': [{'token': x, 'start_offset': 0, 'end_offset': 1,
+                                            'type': 'word', 'position': i}
+                                           for i, x in enumerate(self.tokens)]}).encode('utf-8')
+
+    def tearDown(self):
+        serializer.set_serializer(self.serializer_name)
+
+    def test_loads_tokens(self):
+        for name in serializer.SERIALIZERS:
+            serializer.set_serializer(name)
+            self.assertEqual(serializer.loads_tokens(self.body), self.tokens)
+            self.assertEqual(serializer.loads(self.body), json.loads(self.body.decode('utf-8')))
+            self.assertEqual(json.loads(serializer.dumps({'text': '今日'}).decode('utf-8')), {'text': '今日'})
+
+    def test_json_loads_tokens_compact(self):
+        body = json.dumps({'tokens': [{'token': x} for x in self.tokens]},
+                          separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        self.assertEqual(serializer.JsonSerializer().loads_tokens(body), self.tokens)
+
+    def test_unknown_serializer(self):
+        self.assertRaises(EsanpyInvalidArgumentError, serializer.set_serializer, 'unknown')
+
+    def test_decode_stats(self):
+        serializer.reset_decode_stats()
+        serializer.loads(self.body)
+        serializer.loads_tokens(self.body)
+        stats = serializer.decode_stats()
+        self.assertEqual(stats.get('count'), 2)
+        self.assertEqual(stats.get('bytes'), len(self.body) * 2)
+
+    def test_measure_decode(self):
+        result = serializer.measure_decode(self.body, repeat=2)
+        self.assertEqual(sorted(result.keys()), ['full', 'tokens'])
+        self.assertTrue(result.get('tokens').get('seconds') >= 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import threading
+import time
+import unittest
+
+from esanpy import singleflight
+
+
+class GroupTest(unittest.TestCase):
+
+    def setUp(self):
+        singleflight.reset_stats()
+        self.group = singleflight.Group()
+
+    def run_threads(self, fn, num_of_thread=8):
+        results = [None] * num_of_thread
+
+        def run(i):
+            try:
+                results[i] = self.group.do('key', fn)
+            except Exception as e:
+                results[i] = e
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(num_of_thread)]
+        for thread in threads:
+            thread.start()
+        return threads, results
+
+    def test_do(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return ['this', 'is', 'a', 'pen']
+        threads, results = self.run_threads(fn)
+        started.wait()
+        while singleflight.stats()['shared'] < len(threads) - 1:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [['this', 'is', 'a', 'pen']] * len(threads))
+        self.assertEqual(singleflight.stats(), {'executed': 1, 'shared': len(threads) - 1})
+        self.assertEqual(len(self.group), 0)
+        self.assertEqual(self.group.do('key', lambda: 'next'), 'next')
+
+    def test_error(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def fn():
+            started.set()
+            release.wait()
+            raise ValueError('failed')
+        threads, results = self.run_threads(fn, num_of_thread=4)
+        started.wait()
+        while singleflight.stats()['shared'] < len(threads) - 1:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        for result in results:
+            self.assertTrue(isinstance(result, ValueError), result)
+        self.assertEqual(len(self.group), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import io
+import json
+from logging import getLogger, basicConfig
+import unittest
+
+import esanpy
+from esanpy import stream
+
+
+class StreamTest(unittest.TestCase):
+
+    def setUp(self):
+        basicConfig()
+        getLogger('esanpy').setLevel(10)
+        esanpy.start_server()
+
+    def tearDown(self):
+        esanpy.stop_server()
+
+    def test_analyze_stream_text(self):
+        lines = io.StringIO('This is a pen.\n\nThat is a book.\n')
+        output = io.StringIO()
+        stats = stream.analyze_stream(lines, output, batch_size=2, concurrency=2)
+        self.assertEqual(output.getvalue(), 'this is a pen\n\nthat is a book\n')
+        self.assertEqual(stats.documents, 3)
+        self.assertEqual(stats.tokens, 8)
+
+    def test_analyze_stream_jsonl(self):
+        lines = io.StringIO('{"id": 1, "body": "今日の天気は晴れです。"}\n{"id": 2}\n')
+        output = io.StringIO()
+        stream.analyze_stream(lines, output, input_format='jsonl',
+                              text_field='body', analyzer='kuromoji')
+        records = [json.loads(x) for x in output.getvalue().splitlines()]
+        self.assertEqual(records, [{"id": 1, "body": "今日の天気は晴れです。", "tokens": ['今日', '天気', '晴れ']},
+                                   {"id": 2, "tokens": []}])
+
+
+    def test_analyze_stream_invalid_records(self):
+        lines = io.StringIO('{"id": 1, "body": "This is a pen."}\n\n{"id": 2\n[1, 2]\n'
+                            '{"id": 3, "body": 1}\n{"id": 4, "body": "That is a book."}\n')
+        output = io.StringIO()
+        stats = stream.analyze_stream(lines, output, input_format='jsonl', text_field='body', batch_size=2)
+        records = [json.loads(x) for x in output.getvalue().splitlines()]
+        self.assertEqual([x.get('line') for x in records], [None, 3, 4, 5, None])
+        self.assertEqual(records[0]['tokens'], ['this', 'is', 'a', 'pen'])
+        self.assertEqual(records[4]['tokens'], ['that', 'is', 'a', 'book'])
+        self.assertTrue('body' in records[3]['error'])
+        self.assertEqual(stats.documents, 5)
+        self.assertEqual(stats.errors, 3)
+
+    def test_analyze_stream_rejected_batch(self):
+        lines = io.StringIO('This is a pen.\n\nThat is a book.\n')
+        output = io.StringIO()
+        stats = stream.analyze_stream(lines, output, namespace='stream_missing_case')
+        self.assertEqual(output.getvalue(), '\n\n\n')
+        self.assertEqual(stats.errors, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import pickle
+import unittest
+
+from esanpy.tokens import TokenStream, columnar_converter, get_final_tokens
+
+
+def _token(token, start_offset, end_offset, position, token_type='<ALPHANUM>'):
+    return {'token': token, 'start_offset': start_offset, 'end_offset': end_offset,
+            'position': position, 'type': token_type}
+
+
+class TokenStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = TokenStream()
+        self.stream.append({'tokens': [_token('this', 0, 4, 0), _token('is', 5, 7, 1),
+                                       _token('1', 8, 9, 2, '<NUM>')]})
+        self.stream.append({'tokens': []})
+        self.stream.append({'tokens': [_token('pen', 0, 3, 0)]})
+
+    def test_columns(self):
+        self.assertEqual(len(self.stream), 3)
+        self.assertEqual(self.stream.num_tokens, 4)
+        self.assertEqual(self.stream.buffer, 'thisis1pen')
+        self.assertEqual(list(self.stream), [['this', 'is', '1'], [], ['pen']])
+        self.assertEqual(self.stream.get_offsets(0), [(0, 4), (5, 7), (8, 9)])
+        self.assertEqual(self.stream.get_positions(2), [0])
+        self.assertEqual(self.stream.get_types(0), ['<ALPHANUM>', '<ALPHANUM>', '<NUM>'])
+        self.assertEqual(self.stream.types, ['<ALPHANUM>', '<NUM>'])
+
+    def test_extend(self):
+        other = columnar_converter({'tokens': [_token('a', 0, 1, 0, '<NUM>'), _token('b', 2, 3, 1, 'word')]})
+        self.stream.extend(other)
+        self.assertEqual(list(self.stream), [['this', 'is', '1'], [], ['pen'], ['a', 'b']])
+        self.assertEqual(self.stream.get_types(-1), ['<NUM>', 'word'])
+
+    def test_pickle(self):
+        stream = pickle.loads(pickle.dumps(self.stream))
+        self.assertEqual(list(stream), list(self.stream))
+        self.assertEqual(stream.get_types(0), self.stream.get_types(0))
+        stream.append_tokens([_token('x', 0, 1, 0, '<NUM>')])
+        self.assertEqual(stream.types, ['<ALPHANUM>', '<NUM>'])
+
+    def test_get_final_tokens(self):
+        tokens = [_token('a', 0, 1, 0)]
+        self.assertEqual(get_final_tokens({'tokens': tokens}), tokens)
+        self.assertEqual(get_final_tokens({'detail': {'analyzer': {'tokens': tokens}}}), tokens)
+        self.assertEqual(get_final_tokens({'detail': {'tokenizer': {'tokens': []},
+                                                      'tokenfilters': [{'tokens': tokens}]}}), tokens)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import shutil
+import tempfile
+import unittest
+
+import esanpy
+from esanpy import cache
+from esanpy import connection
+from esanpy import singleflight
+from esanpy.core import EsanpyInvalidArgumentError
+from esanpy.workers import AnalysisProcessPool
+
+
+def token_lengths(result):
+    return [len(x.get('token')) for x in result.get('tokens')]
+
+
+class ResetAfterForkTest(unittest.TestCase):
+
+    def test_reset_after_fork(self):
+        pool = connection.get_pool('localhost', 9299)
+        self.assertTrue(connection.get_pool('localhost', 9299) is pool)
+        connection.reset_after_fork()
+        self.assertFalse(connection.get_pool('localhost', 9299) is pool)
+
+    def test_cache_after_fork(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            persistent_cache = cache.PersistentCache(path=tmp_dir + '/analysis.db')
+            conn = persistent_cache._get_connection()
+            persistent_cache.after_fork()
+            self.assertFalse(persistent_cache._get_connection() is conn)
+            # the inherited connection is left open for the parent
+            conn.execute('SELECT 1')
+            persistent_cache.put('key', b'value')
+            self.assertEqual(persistent_cache.get('key'), b'value')
+            persistent_cache.close()
+            conn.close()
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_singleflight_after_fork(self):
+        group = singleflight._group
+        singleflight.reset_after_fork()
+        self.assertFalse(singleflight._group is group)
+        self.assertEqual(singleflight.do('key', lambda: 1), 1)
+
+
+class AnalysisProcessPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        esanpy.start_server()
+        self.pool = AnalysisProcessPool(processes=2, chunk_size=2, max_in_flight=2)
+        self.texts = ['This is a pen.', None, 'That is a book.', 'Pen pen.', 'An apple.']
+
+    def tearDown(self):
+        self.pool.close()
+        esanpy.stop_server()
+
+    def test_analyzer(self):
+        expected = esanpy.analyze_batch(self.texts)
+        self.assertEqual(list(self.pool.analyzer(iter(self.texts))), expected)
+        self.assertEqual(list(self.pool.analyzer(self.texts, converter=token_lengths)),
+                         [[4, 2, 1, 3], [], [4, 2, 1, 4], [3, 3], [2, 5]])
+        self.assertEqual(list(self.pool.custom_analyzer(self.texts, tokenizer='keyword')),
+                         esanpy.custom_analyze_batch(self.texts, tokenizer='keyword'))
+
+    def test_token_stream(self):
+        stream = self.pool.token_stream(self.texts)
+        self.assertEqual(list(stream), [x for x in esanpy.analyze_batch(self.texts) if len(x) > 0])
+        self.assertEqual(stream.get_offsets(0), [(0, 4), (5, 7), (8, 9), (10, 13)])
+
+    def test_persistent_cache(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            esanpy.enable_persistent_cache(path=tmp_dir + '/analysis.db')
+            expected = esanpy.analyze_batch(self.texts)
+            pool = AnalysisProcessPool(processes=2, chunk_size=2)
+            try:
+                self.assertEqual(list(pool.analyzer(self.texts)), expected)
+            finally:
+                pool.close()
+            self.assertEqual(esanpy.analyzer('This is a pen.'), expected[0])
+        finally:
+            esanpy.disable_persistent_cache()
+            shutil.rmtree(tmp_dir)
+
+    def test_unpicklable_converter(self):
+        self.assertRaises(EsanpyInvalidArgumentError, list,
+                          self.pool.analyzer(self.texts, converter=lambda x: x))
+
+
+if __name__ == "__main__":
+    unittest.main()